@@ -0,0 +1,239 @@
+import asyncio
+import itertools
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pymongo.errors import PyMongoError
+from user2 import UserSimilarityAnalyzerFull
+from mongodb_writer import MongoDBWriter
+from embedding import EmbeddingHandler, SBERT
+from mongo_manager import MongoConnectionManager
+from pipeline_logging import StageCounters
+from memory_budget import MemoryBudget, DOCUMENT_BYTES_ESTIMATE, FETCH_BUFFER_SHARE
+from compact_results import COMPACT
+from score_matrix import ScoreMatrixWriter
+from user_pairs import UserPairBatch, user_pair_collection_name
+from stage_profiler import profiled_task
+from config import get_env_variable
+import config
+
+logger = logging.getLogger(__name__)
+
+# Sentinel that tells a queue consumer to stop
+_DONE = object()
+
+class AsyncFullProfileMatching:
+    """
+    Handles Step 2 with asyncio: profiles are streamed from MongoDB while their values are
+    embedded, and results are written while the remaining profiles are still being scored.
+    """
+
+    def __init__(self, database, collection_name_out, top_comparable_keys, threshold, key_alignment=None, result_channel=None, modules=None):
+        """Initialize AsyncFullProfileMatching with the same arguments as FullProfileMatching."""
+        self.database = database
+        self.collection_name = get_env_variable("COLLECTION_NAME", "modified_data")
+        self.collection_name_out = collection_name_out
+        self.vector_collection = get_env_variable("VECTOR_COLLECTION", "vector_1")
+        self.threshold = threshold
+        self.top_comparable_keys = top_comparable_keys
+        self.key_alignment = key_alignment or {}
+        self.result_channel = result_channel
+        self.modules = modules  # Restrict matching to these modules (e.g. one shard); None means all
+        self.workers = config.ASYNC_WORKERS
+        self.queue_size = config.ASYNC_QUEUE_SIZE
+        self.memory_budget = MemoryBudget()
+        self.fetch_batch_size = self.memory_budget.batch_size(DOCUMENT_BYTES_ESTIMATE, FETCH_BUFFER_SHARE, config.ASYNC_FETCH_BATCH_SIZE)
+        self.mongo_writer = MongoDBWriter()
+        self.embedding_handler = EmbeddingHandler()
+        self.counters = StageCounters()
+        # Shard workers see only their modules, so only unsharded runs keep score matrices
+        self.score_matrices = ScoreMatrixWriter() if config.SCORE_MATRIX_DIR and modules is None else None
+        self._profiles_by_module = defaultdict(list)
+        self._seen_value_ids = set()
+
+    def execute(self):
+        """Perform full profile matching on a fresh event loop."""
+        print("Executing Step 2: Full Profile Matching (async)...")
+        asyncio.run(self.run())
+
+    async def run(self):
+        """Run the fetch -> embed -> score -> write stages with bounded queues between them."""
+        UserSimilarityAnalyzerFull.initialize_allowed_keys(self.top_comparable_keys)
+        UserSimilarityAnalyzerFull.initialize_key_alignment(self.key_alignment)
+        UserSimilarityAnalyzerFull.reset_value_state()
+
+        loop = asyncio.get_running_loop()
+        compute_executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="step2-compute")
+        io_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="step2-io")
+        embed_queue = asyncio.Queue(maxsize=self.queue_size)
+        result_queue = asyncio.Queue(maxsize=self.queue_size)
+
+        scoring = writer = None
+        try:
+            embedders = [
+                asyncio.create_task(self._embed_values(embed_queue, loop, compute_executor))
+                for _ in range(self.workers)
+            ]
+            writer = asyncio.create_task(self._write_results(result_queue, loop, io_executor))
+
+            # Embedding of already-seen values overlaps with fetching the rest of the collection
+            await self._stream_profiles(embed_queue, loop, io_executor)
+            for _ in embedders:
+                await embed_queue.put(_DONE)
+            await asyncio.gather(*embedders)
+            # Batches were warmed on their own, before all long values were seen
+            await loop.run_in_executor(compute_executor, self._embed_mixed_pairs)
+
+            # Scoring overlaps with writing earlier results. They are awaited together: if the writer fails,
+            # nothing drains the bounded queue and scoring would block on it forever
+            scoring = asyncio.create_task(self._score_profiles(result_queue, loop, compute_executor))
+            await asyncio.wait({scoring, writer}, return_when=asyncio.FIRST_COMPLETED)
+            if writer.done():
+                # The writer only stops before _DONE when it failed
+                scoring.cancel()
+                await asyncio.gather(scoring, return_exceptions=True)
+                writer.result()
+            scoring.result()
+            await result_queue.put(_DONE)
+            selected_similarity_count = await writer
+            if self.score_matrices is not None:
+                await loop.run_in_executor(io_executor, self.score_matrices.save, self.threshold)
+
+            if self.result_channel is None:
+                await loop.run_in_executor(
+                    io_executor, self.mongo_writer.write_similarity_count, self.collection_name_out, selected_similarity_count
+                )
+            else:
+                self.result_channel.finish()
+            self.counters.log_summary(logger, "Step 2 totals")
+            self.memory_budget.log_peak("Step 2")
+            logger.info(f"Total similarity results written: {selected_similarity_count}")
+        finally:
+            for task in (scoring, writer):
+                if task is not None and not task.done():
+                    task.cancel()
+            compute_executor.shutdown(wait=True)
+            io_executor.shutdown(wait=True)
+            MongoConnectionManager.close_async_clients()
+
+    async def _stream_profiles(self, embed_queue, loop, io_executor):
+        """Read profile documents in batches, with Motor when available and pymongo in an executor otherwise."""
+        projection = {module: 1 for module in self.modules} if self.modules is not None else None
+        if projection == {}:
+            return
+        async_database = MongoConnectionManager.get_async_database(self.database.name)
+        if async_database is not None:
+            cursor = async_database[self.collection_name].find({}, projection, batch_size=self.fetch_batch_size)
+            batch = []
+            async for document in cursor:
+                batch.append(document)
+                if len(batch) >= self.fetch_batch_size:
+                    await self._add_documents(batch, embed_queue)
+                    batch = []
+            if batch:
+                await self._add_documents(batch, embed_queue)
+            return
+
+        cursor = self.database[self.collection_name].find({}, projection, batch_size=self.fetch_batch_size)
+        while True:
+            batch = await loop.run_in_executor(io_executor, lambda: list(itertools.islice(cursor, self.fetch_batch_size)))
+            if not batch:
+                break
+            await self._add_documents(batch, embed_queue)
+
+    async def _add_documents(self, documents, embed_queue):
+        """Prepare the profiles of a batch of documents and queue their new values for embedding."""
+        key_value_pairs = UserSimilarityAnalyzerFull.generate_key_value_pairs_full(documents)
+        prepared_pairs = UserSimilarityAnalyzerFull.prepare_key_value_pairs(key_value_pairs, self.counters)
+        for pair in prepared_pairs:
+            self._profiles_by_module[pair[0]].append(pair)
+            for _, value_id in pair[4].values():
+                if value_id not in self._seen_value_ids:
+                    self._seen_value_ids.add(value_id)
+                    await embed_queue.put(value_id)
+
+    async def _embed_values(self, embed_queue, loop, compute_executor):
+        """Warm the embedding cache for queued values in small batches. Each worker consumes one sentinel."""
+        while True:
+            value_id = await embed_queue.get()
+            if value_id is _DONE:
+                return
+            value_ids = [value_id]
+            done = False
+            while len(value_ids) < self.fetch_batch_size and not embed_queue.empty():
+                value_id = embed_queue.get_nowait()
+                if value_id is _DONE:
+                    done = True
+                    break
+                value_ids.append(value_id)
+            await loop.run_in_executor(compute_executor, profiled_task("step2", self._embed_batch), value_ids)
+            if done:
+                return
+
+    def _embed_batch(self, value_ids):
+        """Batch-embed the canonical texts of the given values with the policy's encoder."""
+        self.embedding_handler.warm_cache([UserSimilarityAnalyzerFull.value_interner.text(value_id) for value_id in value_ids])
+
+    def _embed_mixed_pairs(self):
+        """Batch-encode the Sentence-BERT vectors short values need for mixed pairs with long values of the corpus."""
+        interner = UserSimilarityAnalyzerFull.value_interner
+        texts = EmbeddingHandler.group_by_encoder([interner.text(value_id) for value_id in range(len(interner))]).get(SBERT, [])
+        for start in range(0, len(texts), config.EMBEDDING_BATCH_SIZE):
+            self.embedding_handler.get_embeddings(texts[start:start + config.EMBEDDING_BATCH_SIZE], SBERT)
+
+    async def _score_profiles(self, result_queue, loop, compute_executor):
+        """Score every profile against the profiles of its module, keeping a bounded number of tasks in flight."""
+        semaphore = asyncio.Semaphore(self.workers * 2)
+        floor = self.score_matrices.floor if self.score_matrices is not None else None
+
+        async def score(pair, module_profiles):
+            async with semaphore:
+                result = await loop.run_in_executor(
+                    compute_executor, profiled_task("step2", UserSimilarityAnalyzerFull._calculate_similarity_for_pair_full),
+                    pair, module_profiles, {}, None, self.threshold, self.embedding_handler,
+                    self.database, self.vector_collection, floor
+                )
+            self.counters.merge(result.get("counters"))
+            if self.score_matrices is not None:
+                self.score_matrices.add(result["similarity"])
+                self.score_matrices.add(result.get("below_threshold"))
+            if len(result.get("user_pairs", ())):
+                await result_queue.put(result["user_pairs"])
+            if len(result["similarity"]) and (config.KEY_LEVEL_RESULTS or not config.USER_PAIR_AGGREGATION):
+                await result_queue.put(result["similarity"])
+
+        await asyncio.gather(*(
+            score(pair, module_profiles)
+            for module_profiles in self._profiles_by_module.values()
+            for pair in module_profiles
+        ))
+
+    async def _write_results(self, result_queue, loop, io_executor):
+        """Drain result batches into the output collection and return how many results were written."""
+        async_database = MongoConnectionManager.get_async_database(self.database.name, bulk=True)
+        selected_similarity_count = 0
+        while True:
+            results = await result_queue.get()
+            if results is _DONE:
+                return selected_similarity_count
+            if isinstance(results, UserPairBatch):
+                await loop.run_in_executor(
+                    io_executor, self.mongo_writer.write_user_pairs, user_pair_collection_name(self.collection_name_out), results
+                )
+                continue
+            if self.result_channel is not None:
+                # The channel's sinks take care of persistence
+                self.result_channel.publish(results)
+            elif async_database is not None and config.RESULT_FORMAT != COMPACT:
+                try:
+                    await async_database[self.collection_name_out].insert_many(results.to_documents())
+                except PyMongoError as e:
+                    # Counted like the writer's own failed inserts, so the run is not recorded as complete
+                    logger.error(f"Error writing similarity scores to MongoDB: {e}")
+                    self.mongo_writer.record_failed_write(self.collection_name_out, len(results))
+            else:
+                # Compact results need their table entries written first, which the writer does
+                await loop.run_in_executor(
+                    io_executor, self.mongo_writer.write_result_batch, self.collection_name_out, results
+                )
+            selected_similarity_count += len(results)
@@ -1,18 +1,22 @@
 from user2 import UserSimilarityAnalyzerFull
 from mongodb_writer import MongoDBWriter
 from embedding import EmbeddingHandler
+from memory_budget import MemoryBudget, DOCUMENT_BYTES_ESTIMATE, FETCH_BUFFER_SHARE
 from config import get_env_variable  
 
 class FullProfileMatching:
     """Handles Step 2: Full dataset profile matching."""
 
-    def __init__(self, database, collection_name_out, top_comparable_keys, threshold):
+    def __init__(self, database, collection_name_out, top_comparable_keys, threshold, key_alignment=None, result_channel=None, modules=None):
         """Initialize FullProfileMatching with necessary configurations."""
         self.database = database
         self.collection_name_out = collection_name_out  # Now passed as an argument
         self.vector_collection = get_env_variable("VECTOR_COLLECTION", "vector_1")
         self.threshold = threshold  # Now passed as an argument
         self.top_comparable_keys = top_comparable_keys
+        self.key_alignment = key_alignment or {}
+        self.result_channel = result_channel
+        self.modules = modules  # Restrict matching to these modules (e.g. one shard); None means all
         self.user_similarity_analyzer_full = UserSimilarityAnalyzerFull()
         self.mongo_writer = MongoDBWriter()
         self.embedding_handler = EmbeddingHandler()
@@ -21,11 +25,21 @@ class FullProfileMatching:
         """Perform full profile matching."""
         print("Executing Step 2: Full Profile Matching...")
         self.user_similarity_analyzer_full.initialize_allowed_keys(self.top_comparable_keys)
+        self.user_similarity_analyzer_full.initialize_key_alignment(self.key_alignment)
         
-        data = list(self.database[get_env_variable("COLLECTION_NAME", "modified_data")].find({}))
-        all_key_value_pairs = self.user_similarity_analyzer_full.generate_key_value_pairs_full(data)
+        projection = {module: 1 for module in self.modules} if self.modules is not None else None
+        if projection == {}:
+            print("No modules assigned. Skipping full profile matching.")
+            return
+        # Keep only the filtered profiles of each document instead of the whole collection
+        batch_size = MemoryBudget().batch_size(DOCUMENT_BYTES_ESTIMATE, FETCH_BUFFER_SHARE, default=1000)
+        cursor = self.database[get_env_variable("COLLECTION_NAME", "modified_data")].find({}, projection, batch_size=batch_size)
+        all_key_value_pairs = []
+        for document in cursor:
+            all_key_value_pairs.extend(self.user_similarity_analyzer_full.generate_key_value_pairs_full(document))
 
         self.user_similarity_analyzer_full.calculate_similarity_scores_full(
             all_key_value_pairs, {}, None, self.collection_name_out, self.threshold,
-            self.mongo_writer, self.embedding_handler, self.database, self.vector_collection
+            self.mongo_writer, self.embedding_handler, self.database, self.vector_collection,
+            self.result_channel, keep_score_matrices=self.modules is None
         )
@@ -1,25 +1,40 @@
 from abc import ABC, abstractmethod
 import time
 import logging
+from stage_profiler import StageProfiler
 
 class PipelineTemplate(ABC):
     """Template Method Pattern for executing user profile matching and clustering."""
 
     def run_pipeline(self):
-        """Template method that defines the pipeline execution steps."""
+        """
+        Template method that defines the pipeline execution steps.
+
+        Returns:
+            bool: Whether every step succeeded. The error of a failed step is logged.
+        """
         start_time = time.time()
         print("Pipeline execution started...")
 
+        succeeded = False
         try:
-            self.step1_sample_profile_matching()
-            self.step2_full_profile_matching()
-            self.step3_ranking_and_clustering()
+            self.run_stage("step1", self.step1_sample_profile_matching)
+            self.run_stage("step2", self.step2_full_profile_matching)
+            self.run_stage("step3", self.step3_ranking_and_clustering)
+            self.run_stage("step4", self.step4_materialize_recommendations)
+            succeeded = True
         except Exception as e:
             logging.error(f"An error occurred during execution: {e}", exc_info=True)
         finally:
             self.cleanup()
             end_time = time.time()
             print(f"Total Execution Time: {end_time - start_time:.2f} seconds")
+        return succeeded
+
+    def run_stage(self, stage, step):
+        """Run one step, under the profilers selected for it with PROFILE_STAGES."""
+        with StageProfiler(stage):
+            step()
 
     @abstractmethod
     def step1_sample_profile_matching(self):
@@ -36,6 +51,10 @@ class PipelineTemplate(ABC):
         """Step 3: Perform ranking and clustering."""
         pass
 
+    def step4_materialize_recommendations(self):
+        """Step 4: Materialize per-user recommendations (optional)."""
+        pass
+
     @abstractmethod
     def cleanup(self):
         """Clean up resources like database connections."""
@@ -1,5 +1,11 @@
+import json
 import logging
+from functools import partial
 from ranking_and_clustering import RankingAndClustering
+from memory_budget import MemoryBudget, RESULT_BUFFER_SHARE, RESULT_BYTES_ESTIMATE
+from compact_results import StoredTableSets, iter_result_batches, result_modules, count_results
+from user_pairs import iter_user_pair_batches, user_pair_modules, count_user_pairs, user_pair_collection_name
+import config
 from file_writer import FileWriter
 from config import get_env_variable  
 
@@ -9,29 +15,58 @@ logging.basicConfig(level=logging.INFO)
 class RankingClustering:
     """Handles Step 3: Ranking and Clustering."""
 
-    def __init__(self, database, collection_name_out=None):
+    def __init__(self, database, collection_name_out=None, result_channel=None):
         """
         Initialize the RankingClustering class.
 
         Args:
             database: MongoDB database instance.
             collection_name_out: Name of the collection storing similarity results.
+            result_channel: Optional in-process channel holding Step 2 results; when given,
+                the results are not read back from MongoDB.
         """
         self.database = database
+        self.result_channel = result_channel
         self.collection_name_out = collection_name_out or get_env_variable("COLLECTION_NAME_OUT", "modified_data")
         self.num_clusters = int(get_env_variable("NUM_CLUSTERS", 6))  
+        self.memory_budget = MemoryBudget()
+        if config.USER_PAIR_AGGREGATION:
+            # Rank one key-weighted score per user pair instead of every key-level result
+            self.result_channel = None
+            self.source_name = user_pair_collection_name(self.collection_name_out)
+            self._iter_batches, self._modules, self._count = iter_user_pair_batches, user_pair_modules, count_user_pairs
+        else:
+            self.source_name = self.collection_name_out
+            # The streaming path reads module by module; the id tables are loaded once for all of them
+            self._iter_batches = partial(iter_result_batches, stored_tables=StoredTableSets())
+            self._modules, self._count = result_modules, count_results
 
     def execute(self):
         """Perform ranking and clustering of similarity results."""
         logger.info("🔹 Executing Step 3: Ranking and Clustering...")
 
         try:
-            # Fetch similarity results from MongoDB
-            collection = self.database[self.collection_name_out]
-            final_similarity_results = list(collection.find({}))
+            if self.result_channel is None and self.memory_budget.enabled:
+                self._execute_streaming()
+                return
+
+            if self.result_channel is not None:
+                # Consume Step 2 results handed over in memory
+                final_similarity_results = [
+                    result for partition in self.result_channel.partitions().values() for result in partition.to_documents()
+                ]
+                source = "the Step 2 result channel"
+            else:
+                # Fetch similarity results from MongoDB (either result schema), skipping the count document
+                final_similarity_results = [
+                    result
+                    for batch in self._iter_batches(self.database, self.collection_name_out)
+                    for result in batch.to_documents()
+                ]
+                source = f"'{self.source_name}'"
 
             if not final_similarity_results:
-                logger.warning(f"⚠️ No similarity results found in '{self.collection_name_out}'. Skipping ranking and clustering.")
+                logger.warning(f"⚠️ No similarity results found in {source}. Skipping ranking and clustering.")
                 return
 
             # Convert NumPy types for compatibility
@@ -49,3 +84,54 @@ class RankingClustering:
 
         except Exception as e:
             logger.error(f"❌ Error during ranking and clustering: {e}", exc_info=True)
+
+    def _execute_streaming(self, filename="clusters.json"):
+        """
+        Rank and cluster one module at a time under the memory budget. Results are read from MongoDB
+        already sorted by score and written straight to the clusters file, so only one batch is held.
+        """
+        batch_size = self.memory_budget.batch_size(RESULT_BYTES_ESTIMATE, RESULT_BUFFER_SHARE, default=1000)
+        modules = self._modules(self.database, self.collection_name_out)
+        if not modules:
+            logger.warning(f"⚠️ No similarity results found in '{self.source_name}'. Skipping ranking and clustering.")
+            return
+
+        with open(filename, "w") as file:
+            file.write("{")
+            for module_index, module in enumerate(modules):
+                total = self._count(self.database, self.collection_name_out, module)
+                logger.info(f"Module '{module}' has {total} similarity results after sorting.")
+                # Same assignment as rank_and_cluster_by_module: equal slices of the ranking
+                cluster_size = max(total // self.num_clusters, 1)
+                sizes = [0] * self.num_clusters
+                score_sums = [0.0] * self.num_clusters
+                results = (
+                    result
+                    for batch in self._iter_batches(
+                        self.database, self.collection_name_out, batch_size, module=module, sort_by_score=True
+                    )
+                    for result in batch.to_documents()
+                )
+
+                file.write(("," if module_index else "") + f"\n    {json.dumps(str(module))}: {{\n        \"0\": [")
+                label = 0
+                for index, result in enumerate(results):
+                    cluster_id = min(index // cluster_size, self.num_clusters - 1)
+                    while label < cluster_id:
+                        label += 1
+                        file.write(f"\n        ],\n        \"{label}\": [")
+                    file.write(("," if sizes[label] else "") + "\n            " + json.dumps(result, default=str))
+                    sizes[label] += 1
+                    score_sums[label] += result["similarity_score"]
+                while label < self.num_clusters - 1:
+                    label += 1
+                    file.write(f"\n        ],\n        \"{label}\": [")
+                file.write("\n        ]\n    }")
+
+                for label, size in enumerate(sizes):
+                    avg_sim = score_sums[label] / size if size else 0
+                    logger.info(f"Module '{module}', Cluster {label} (Avg Sim: {avg_sim:.3f}) contains {size} profiles.")
+            file.write("\n}\n")
+
+        self.memory_budget.log_peak("Step 3")
+        logger.info(f"✅ Ranking and clustering completed successfully. Clusters saved to '{filename}'.")
@@ -33,11 +33,18 @@
 #         comparable_keys_by_module = find_comparable_keys_by_module(similarity_data_sample, self.threshold)
 #         return get_top_comparable_keys_by_module(comparable_keys_by_module, top_n=5)
 
-import spacy
 import logging
 from user_similarity_analyzer import UserSimilarityAnalyzer
-from key_comparator import find_comparable_keys_by_module, get_top_comparable_keys_by_module
+from user2 import UserSimilarityAnalyzerFull
+from embedding import EmbeddingHandler, HYBRID, SPACY
+from key_comparator import (
+    find_comparable_keys_by_module,
+    get_top_comparable_keys_by_module,
+    find_key_alignment_by_module,
+    get_top_key_alignments_by_module,
+)
 from config import get_env_variable  # Import configuration settings
+import config
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -52,10 +59,60 @@ class SampleProfileMatching:
         self.sample_size = sample_size or int(get_env_variable("SAMPLE_SIZE", 5))
         self.threshold = threshold or float(get_env_variable("THRESHOLD", 0.6))
         self.user_similarity_analyzer = UserSimilarityAnalyzer()
-        self.nlp_model = spacy.load("en_core_web_md")
+        # Share the handler's SpaCy model; policies without SpaCy encode through the handler instead
+        uses_spacy = EmbeddingHandler.get_encoder_policy() in (HYBRID, SPACY)
+        self.nlp_model = EmbeddingHandler.load_spacy_model() if uses_spacy else None
+        self.key_alignment = {}  # module -> role1 -> key1 -> role2 -> {key2: frequency}
+
+    def _load_precomputed_embeddings(self, key_value_pairs):
+        """
+        Seed the Step 1 embedding cache (raw value -> vector) from the embedding store, if one is attached.
+        The store holds vectors of canonical texts, so only values that are already canonical are seeded;
+        Step 1 otherwise embeds the raw value, and its scores do not depend on whether a store is attached.
+        """
+        texts = dict.fromkeys(
+            value
+            for *_, profile in key_value_pairs
+            for value in profile.values()
+            if isinstance(value, str) and value and UserSimilarityAnalyzerFull.canonicalize_value(value) == value
+        )
+        texts_by_encoder = {}
+        for text in texts:
+            encoder = SPACY if self.nlp_model is not None else EmbeddingHandler.select_encoder(text, text)
+            texts_by_encoder.setdefault(encoder, []).append(text)
+
+        embeddings_cache = {}
+        for encoder, encoder_texts in texts_by_encoder.items():
+            embeddings_cache.update(EmbeddingHandler.get_stored_embeddings(encoder_texts, encoder))
+        if embeddings_cache:
+            logger.info(f"✅ Loaded {len(embeddings_cache)} precomputed embeddings for the sample.")
+        return embeddings_cache
+
+    def _embed_sample_values(self, key_value_pairs, embeddings_cache):
+        """
+        Embed the compared values of the sample with batched SpaCy encoder calls, instead of one
+        pipeline call per value. Vectors are identical to nlp_model(value).vector; values that
+        fail here are still embedded one by one.
+        """
+        if self.nlp_model is None:
+            return
+        values = list(dict.fromkeys(
+            value
+            for *_, profile in key_value_pairs
+            for key, value in profile.items()
+            if isinstance(value, str) and key.lower() not in UserSimilarityAnalyzer.excluded_keys and value not in embeddings_cache
+        ))
+        for start in range(0, len(values), config.EMBEDDING_BATCH_SIZE):
+            batch = values[start:start + config.EMBEDDING_BATCH_SIZE]
+            for value, vector in zip(batch, EmbeddingHandler.get_embeddings(batch, SPACY)):
+                if vector is not None:
+                    embeddings_cache[value] = vector
 
     def execute(self):
-        """Perform sample profile matching and return top comparable keys."""
+        """Perform sample profile matching and return top comparable keys.
+
+        The learned key-to-key alignment map is kept on ``self.key_alignment``.
+        """
         logger.info("🔹 Executing Step 1: Sample Profile Matching...")
         
         try:
@@ -76,8 +133,9 @@ class SampleProfileMatching:
 
             logger.info(f"✅ Generated {len(sampled_key_value_pairs)} key-value pairs.")
 
-            # Compute similarity scores
-            embeddings_cache = {}
+            # Compute similarity scores, starting from the vectors precomputed at ingestion time
+            embeddings_cache = self._load_precomputed_embeddings(sampled_key_value_pairs)
+            self._embed_sample_values(sampled_key_value_pairs, embeddings_cache)
             similarity_data_sample = self.user_similarity_analyzer.calculate_similarity_scores(
                 sampled_key_value_pairs, embeddings_cache, self.nlp_model, "sample.json", self.threshold
             )
@@ -92,6 +150,11 @@ class SampleProfileMatching:
             comparable_keys_by_module = find_comparable_keys_by_module(similarity_data_sample, self.threshold)
             top_keys = get_top_comparable_keys_by_module(comparable_keys_by_module, top_n=5)
 
+            # Learn which key of one role is worth comparing with which key of another role
+            key_alignment = find_key_alignment_by_module(similarity_data_sample, self.threshold)
+            self.key_alignment = get_top_key_alignments_by_module(key_alignment, top_keys, top_n=5)
+            logger.info(f"✅ Learned key alignments for {len(self.key_alignment)} modules.")
+
             logger.info("✅ Sample profile matching step completed successfully.")
             return top_keys
 
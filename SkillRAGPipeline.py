@@ -1,15 +1,42 @@
-from db import connect_to_mongo
+from db import connect_to_mongo, count_profiles_by_module_role
 from PipelineTemplate import PipelineTemplate
 from SampleProfileMatching import SampleProfileMatching
 from FullProfileMatching import FullProfileMatching
+from AsyncFullProfileMatching import AsyncFullProfileMatching
 from RankingClustering import RankingClustering
-from data_processor import DataProcessor
+from recommendations import RecommendationMaterializer
+from cost_planner import CostPlanner
+from mongo_manager import MongoConnectionManager
+from mongodb_writer import MongoDBWriter
+from pipeline_channel import ResultChannel, MongoResultSink
+from embedding import EmbeddingHandler
+from embedding_store import EmbeddingStore
+from index_manager import IndexManager
+import artifact_cache
+from artifact_cache import ArtifactCache, STEP1, STEP2
+from memory_budget import (
+    MemoryBudget, EMBEDDING_CACHE_SHARE, SCORE_CACHE_SHARE, SCORE_CACHE_ENTRY_BYTES,
+    RESULT_BUFFER_SHARE, RESULT_BYTES_ESTIMATE,
+)
+from user2 import UserSimilarityAnalyzerFull
+from compact_results import count_results, table_collection_name
+from user_pairs import user_pair_collection_name
+from result_runs import ResultRun, read_run
+import sharding
 import config  # Import the new config file
 
 class SkillRAGPipeline(PipelineTemplate):
     """Concrete implementation of the Skill RAG Clustering pipeline."""
 
-    def __init__(self):
+    def __init__(self, async_mode=False, shard=None, merge_shards=None, plan=False, run_id=None):
+        """
+        Args:
+            async_mode (bool): Run Step 2 with asyncio.
+            shard (str | None): 'i/N' to run Step 2 for shard i of N and skip Step 3.
+            merge_shards (int | None): N to merge the output of an N-way sharded run and run Step 3.
+            plan (bool): Estimate the cost of Step 2 instead of running Steps 2 and 3.
+            run_id (str | None): Id shared by the workers and the coordinator of one sharded run (SHARD_RUN_ID).
+        """
         self.mongo_uri = config.MONGO_URI
         self.db_name = config.DB_NAME
         self.collection_name = config.COLLECTION_NAME
@@ -17,38 +44,312 @@ class SkillRAGPipeline(PipelineTemplate):
         self.vector_collection = config.VECTOR_COLLECTION
         self.threshold = config.THRESHOLD
         self.sample_size = config.SAMPLE_SIZE
+        self.async_mode = async_mode
+        self.shard_index, self.shard_count = sharding.parse_shard(shard) if shard else (None, None)
+        self.merge_shards = merge_shards
+        self.plan = plan
+        self.run_id = run_id or config.SHARD_RUN_ID
+        if (self.shard_count or self.merge_shards) and not self.run_id:
+            # Without a run id, the markers and Step 1 result of an earlier, crashed run would be taken for this one's
+            raise ValueError("❌ Sharded runs need a run id shared by all workers: pass --run-id or set SHARD_RUN_ID.")
+        EmbeddingHandler.set_encoder_policy(config.ENCODER_POLICY)
         self.database = connect_to_mongo(self.mongo_uri, self.db_name)
+        if config.USE_PRECOMPUTED_EMBEDDINGS:
+            # Read vectors written by profile_ingestion.py instead of running the models
+            EmbeddingHandler.attach_store(EmbeddingStore(self.database))
+        if config.ENSURE_INDEXES:
+            IndexManager(self.database, self.collection_name_out).bootstrap()
         self.top_comparable_keys = []  # Initialize to prevent potential errors
+        self.key_alignment = {}
+        self.result_channel = None
+        # Sharded runs share Step 1 through the shard registry instead
+        use_cache = config.ARTIFACT_CACHE and not (self.shard_count or self.merge_shards)
+        self.artifact_cache = ArtifactCache(self.database) if use_cache else None
+        self.stage_inputs = None
+        self.step2_key = None  # Set once Step 2 has run, so its output is saved at cleanup
+        self.step2_run = None  # Run collections Step 2 writes to, swapped in once its results are persisted
+        self.memory_budget = MemoryBudget()
+        if self.memory_budget.enabled:
+            self._apply_memory_budget()
+
+    def _apply_memory_budget(self):
+        """Bound the in-memory caches to their share of MAX_MEMORY_MB."""
+        EmbeddingHandler.set_cache_limit(self.memory_budget.share(EMBEDDING_CACHE_SHARE))
+        UserSimilarityAnalyzerFull.value_score_cache.resize(
+            self.memory_budget.batch_size(SCORE_CACHE_ENTRY_BYTES, SCORE_CACHE_SHARE, config.VALUE_SCORE_CACHE_SIZE)
+        )
+        print(f"🔹 Memory budget: {config.MAX_MEMORY_MB} MB.")
 
     def step1_sample_profile_matching(self):
         """Step 1: Perform sample profile matching."""
+        if self.merge_shards:
+            print("🔹 Skipping Step 1: merging sharded results.")
+            return
+
+        if self.artifact_cache is not None:
+            self.stage_inputs = {
+                "data": artifact_cache.data_fingerprint(self.database, self.collection_name),
+                "threshold": self.threshold,
+                "sample_size": self.sample_size,
+                "model_version": artifact_cache.model_version(),
+            }
+            cached = self.artifact_cache.load(STEP1, artifact_cache.fingerprint(STEP1, self.stage_inputs))
+            if cached is not None:
+                print("🔹 Reusing Step 1 result: data and settings are unchanged.")
+                self.top_comparable_keys, self.key_alignment = cached["top_comparable_keys"], cached["key_alignment"]
+                return
+
+        if self.shard_count:
+            # Every shard must match on the same keys, so a result another worker already shared is used as is
+            shared = sharding.read_step1_result(self.database, self.collection_name_out, self.run_id, self.shard_count)
+            if shared is not None:
+                print("🔹 Using the Step 1 result shared by another shard worker.")
+                self.top_comparable_keys, self.key_alignment = shared
+                return
+
         print("🔹 Running Step 1: Sample Profile Matching...")
         sample_matcher = SampleProfileMatching(self.database, self.collection_name, self.sample_size, self.threshold)
         self.top_comparable_keys = sample_matcher.execute()
+        self.key_alignment = sample_matcher.key_alignment
+
+        if self.shard_count and self.top_comparable_keys:
+            # Use whichever worker's sample finished first
+            self.top_comparable_keys, self.key_alignment = sharding.share_step1_result(
+                self.database, self.collection_name_out, self.run_id, self.shard_count,
+                self.top_comparable_keys, self.key_alignment
+            )
+        elif self.shard_count:
+            # Only results with keys are shared; another worker's sample may still find some
+            shared = sharding.wait_for_step1_result(
+                self.database, self.collection_name_out, self.run_id, self.shard_count, config.SHARD_STEP1_WAIT
+            )
+            if shared is not None:
+                print("🔹 Using the Step 1 result shared by another shard worker.")
+                self.top_comparable_keys, self.key_alignment = shared
         
         if not self.top_comparable_keys:
             print("⚠ Warning: No comparable keys found in Step 1!")
+        elif self.artifact_cache is not None:
+            self.artifact_cache.save(
+                STEP1, artifact_cache.fingerprint(STEP1, self.stage_inputs), self.stage_inputs,
+                {"top_comparable_keys": self.top_comparable_keys, "key_alignment": self.key_alignment},
+            )
 
     def step2_full_profile_matching(self):
         """Step 2: Perform full profile matching."""
+        if self.merge_shards:
+            self._merge_shard_results()
+            return
+
         print("🔹 Running Step 2: Full Profile Matching...")
-        
+
+        if self.shard_count:
+            # A shard without keys still marks itself complete, so the coordinator can merge
+            self._run_shard()
+            return
+
         if not self.top_comparable_keys:
             print("⚠ Warning: No comparable keys from Step 1. Skipping full profile matching.")
             return  # Skip Step 2 if no keys are found
 
-        full_matcher = FullProfileMatching(self.database, self.collection_name_out, self.top_comparable_keys, self.threshold)
+        if self.plan:
+            CostPlanner(
+                self.database, self.collection_name, self.top_comparable_keys, self.threshold, self.key_alignment
+            ).execute()
+            return
+
+        step2_key = self._step2_fingerprint()
+        if step2_key is not None and self._reuse_step2(step2_key):
+            return
+
+        output_collection = self._start_step2_run(step2_key)
+        if config.STAGE_HANDOFF == "memory" and self.memory_budget.enabled:
+            # The in-memory handoff holds every result at once, which a budget cannot bound
+            print("🔹 Memory budget set: handing results to Step 3 through MongoDB.")
+        elif config.STAGE_HANDOFF == "memory" and config.USER_PAIR_AGGREGATION:
+            print("🔹 User-pair aggregation: Step 3 ranks the user pairs stored in MongoDB.")
+        elif config.STAGE_HANDOFF == "memory":
+            # Hand results to Step 3 in memory; persisting them to MongoDB becomes a parallel sink
+            sinks = [MongoResultSink(MongoDBWriter(), output_collection)] if config.PERSIST_STEP2_RESULTS else []
+            self.result_channel = ResultChannel(sinks)
+
+        matcher_class = AsyncFullProfileMatching if self.async_mode else FullProfileMatching
+        full_matcher = matcher_class(
+            self.database, output_collection, self.top_comparable_keys, self.threshold, self.key_alignment,
+            self.result_channel
+        )
         full_matcher.execute()
+        self.step2_key = step2_key
+        if self.result_channel is None:
+            self._complete_step2_run()
+
+    def _persists_step2(self):
+        """Whether Step 2 results are written to MongoDB, rather than only handed to Step 3 in memory."""
+        return (config.STAGE_HANDOFF != "memory" or config.PERSIST_STEP2_RESULTS or self.memory_budget.enabled
+                or config.USER_PAIR_AGGREGATION)
+
+    def _start_step2_run(self, fingerprint=None):
+        """Start a run of the output collection when Step 2 persists its results, and return the collection to write."""
+        if not self._persists_step2():
+            return self.collection_name_out
+        self.step2_run = ResultRun(self.database, self.collection_name_out, fingerprint)
+        return self.step2_run.collection_name
+
+    def _complete_step2_run(self):
+        """Swap the Step 2 run in for the output collection. Runs once its results are fully persisted."""
+        if self.step2_run is None:
+            return
+        self.step2_run.complete()
+        self.step2_run = None
+
+    def _step2_fingerprint(self):
+        """Fingerprint of the Step 2 inputs, or None when its results are not cached."""
+        if self.artifact_cache is None or not self._persists_step2():
+            return None
+        return artifact_cache.fingerprint(STEP2, self._step2_inputs())
+
+    def _step2_inputs(self):
+        return dict(
+            self.stage_inputs,
+            top_comparable_keys=self.top_comparable_keys,
+            key_alignment=self.key_alignment,
+            collection_name_out=self.collection_name_out,
+            result_format=config.RESULT_FORMAT,
+            user_pairs=[config.USER_PAIR_AGGREGATION, config.KEY_LEVEL_RESULTS],
+            # A reused Step 2 writes no score matrices, so asking for them invalidates the cache
+            score_matrices=[config.SCORE_MATRIX_DIR, config.SCORE_MATRIX_FLOOR] if config.SCORE_MATRIX_DIR else None,
+            prefilter=[config.PREFILTER_THRESHOLD, config.PREFILTER_TOP_K, config.PREFILTER_ENCODER] if config.PROFILE_PREFILTER else None,
+        )
+
+    def _output_fingerprint(self):
+        """Fingerprint of the run whose results are in the output collection, or None."""
+        run = read_run(self.database, self.collection_name_out)
+        return run.get("fingerprint") if run else None
+
+    def _reuse_step2(self, step2_key):
+        """Skip Step 2 when the output collection still holds the results of identical inputs."""
+        cached = self.artifact_cache.load(STEP2, step2_key)
+        # Only complete runs are swapped in, so the recorded fingerprint describes the whole collection
+        finished = self._output_fingerprint() == step2_key
+        if cached is not None and finished and count_results(self.database, self.collection_name_out) == cached["result_count"]:
+            print(f"🔹 Reusing {cached['result_count']} Step 2 results in '{self.collection_name_out}'.")
+            return True
+        return False
+
+    def _save_step2_artifact(self):
+        """Record the Step 2 output once its results are fully persisted."""
+        if self.step2_key is None:
+            return
+        if self._output_fingerprint() != self.step2_key:
+            print("⚠ Warning: Step 2 did not finish writing its results; they are not cached.")
+            return
+        self.artifact_cache.save(
+            STEP2, self.step2_key, self._step2_inputs(),
+            {"result_count": count_results(self.database, self.collection_name_out)},
+        )
+        self.step2_key = None
+
+    def _run_shard(self):
+        """Run Step 2 for this worker's modules and write them to the shard-tagged collection."""
+        profile_counts = count_profiles_by_module_role(self.database, self.collection_name)
+        module_costs = sharding.estimate_module_costs(profile_counts)
+        modules = sharding.assign_modules(module_costs, self.shard_count)[self.shard_index]
+        shard_collection = sharding.shard_collection_name(self.collection_name_out, self.shard_index, self.shard_count)
+        print(f"🔹 Shard {self.shard_index}/{self.shard_count}: matching {len(modules)} modules into '{shard_collection}'.")
+
+        # Start from an empty shard collection so a re-run does not duplicate results
+        self.database.drop_collection(shard_collection)
+        self.database.drop_collection(table_collection_name(shard_collection))
+        self.database.drop_collection(user_pair_collection_name(shard_collection))
+        self.database[config.RESULT_RUNS_COLLECTION].delete_one({"_id": shard_collection})
+        if config.SCORE_MATRIX_DIR:
+            print("⚠ Warning: Score matrices are not kept by shard workers; SCORE_MATRIX_DIR is ignored.")
+        if self.top_comparable_keys and modules:
+            matcher_class = AsyncFullProfileMatching if self.async_mode else FullProfileMatching
+            full_matcher = matcher_class(
+                self.database, shard_collection, self.top_comparable_keys, self.threshold, self.key_alignment,
+                modules=modules
+            )
+            full_matcher.execute()
+            # Step 2 records its count only when it finished, and failed_writes instead when inserts were lost
+            record = read_run(self.database, shard_collection)
+            if record is None or record.get("failed_writes") or "selected_similarity_count" not in record:
+                reason = f"{record['failed_writes']} results were not written" if record and record.get("failed_writes") else "Step 2 did not finish"
+                raise RuntimeError(f"❌ Shard {self.shard_index}/{self.shard_count} failed: {reason}. It is not marked complete.")
+        elif not modules:
+            print("⚠ Warning: No modules assigned to this shard. The shard completes without results.")
+        else:
+            print("⚠ Warning: No comparable keys from Step 1. The shard completes without results.")
+
+        result_count = count_results(self.database, shard_collection)
+        sharding.mark_shard_complete(
+            self.database, self.collection_name_out, self.run_id, self.shard_index, self.shard_count, modules, result_count
+        )
+
+    def _merge_shard_results(self):
+        """Collect the results of every shard into the result channel consumed by Step 3."""
+        print(f"🔹 Merging results of {self.merge_shards} shards...")
+        if self.memory_budget.enabled or config.USER_PAIR_AGGREGATION:
+            # Copy batch by batch into the output collection; Step 3 streams it from there
+            output_collection = self._start_step2_run()
+            mongo_writer = MongoDBWriter()
+            batch_size = self.memory_budget.batch_size(RESULT_BYTES_ESTIMATE, RESULT_BUFFER_SHARE, default=1000)
+            merged_count = 0
+            for results in sharding.iter_shard_results(self.database, self.collection_name_out, self.run_id, self.merge_shards, batch_size):
+                mongo_writer.write_result_batch(output_collection, results)
+                merged_count += len(results)
+            print(f"✅ Merged {merged_count} similarity results into '{output_collection}'.")
+            if config.USER_PAIR_AGGREGATION:
+                merged_pairs = 0
+                for user_pairs in sharding.iter_shard_user_pairs(self.database, self.collection_name_out, self.run_id, self.merge_shards, batch_size):
+                    mongo_writer.write_user_pairs(user_pair_collection_name(output_collection), user_pairs)
+                    merged_pairs += len(user_pairs)
+                print(f"✅ Merged {merged_pairs} user pairs.")
+            # The count is written last: it marks the run as complete
+            mongo_writer.write_similarity_count(output_collection, merged_count)
+            self._complete_step2_run()
+        else:
+            output_collection = self._start_step2_run() if config.PERSIST_STEP2_RESULTS else self.collection_name_out
+            sinks = [MongoResultSink(MongoDBWriter(), output_collection)] if config.PERSIST_STEP2_RESULTS else []
+            self.result_channel = ResultChannel(sinks)
+            for results in sharding.iter_shard_results(self.database, self.collection_name_out, self.run_id, self.merge_shards):
+                self.result_channel.publish(results)
+            self.result_channel.finish()
+            print(f"✅ Merged {len(self.result_channel)} similarity results.")
+        # The shared Step 1 result and the markers belong to this run only
+        sharding.clear_run(self.database, self.collection_name_out, self.run_id)
 
     def step3_ranking_and_clustering(self):
         """Step 3: Perform ranking and clustering."""
+        if self.plan:
+            print("🔹 Skipping Step 3: dry run.")
+            return
+
+        if self.shard_count:
+            print("🔹 Skipping Step 3: run the coordinator with --merge-shards to rank and cluster.")
+            return
+
         print("🔹 Running Step 3: Ranking and Clustering...")
-        rank_cluster = RankingClustering(self.database, self.collection_name_out)
+        rank_cluster = RankingClustering(self.database, self.collection_name_out, self.result_channel)
         rank_cluster.execute()
+        if self.result_channel is not None:
+            self.result_channel.close()
+        self._complete_step2_run()
+
+    def step4_materialize_recommendations(self):
+        """Step 4: Materialize per-user recommendations for indexed point reads."""
+        if self.plan or self.shard_count or not config.MATERIALIZE_RECOMMENDATIONS:
+            return
+
+        print("🔹 Running Step 4: Materializing Recommendations...")
+        RecommendationMaterializer(self.database, self.collection_name_out, self.result_channel).execute()
 
     def cleanup(self):
         """Close database connections and clean up resources."""
         print("🧹 Cleaning up resources...")
-        data_processor = DataProcessor(self.mongo_uri, self.db_name, self.collection_name)
-        data_processor.close_connection()
+        if self.result_channel is not None:
+            self.result_channel.close()  # Let pending result writes finish before closing connections
+        self._complete_step2_run()
+        self._save_step2_artifact()
+        MongoConnectionManager.close_all()
         print("✅ Cleanup complete!")
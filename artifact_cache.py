@@ -0,0 +1,112 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : artifact_cache.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script caches the outputs of the pipeline stages under a
+                  fingerprint of their inputs (a hash of the profile data, the
+                  processing settings and the encoder model versions). A later
+                  run whose fingerprint is unchanged reuses the stored output
+                  instead of recomputing the stage.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo.errors import OperationFailure, PyMongoError
+from embedding import HYBRID, SPACY, SBERT
+from encoders import get_encoder
+import config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Stage names
+STEP1 = "step1"
+STEP2 = "step2"
+
+def data_fingerprint(database, collection_name):
+    """
+    Hash the content of a collection. Uses the server-side dbHash command when available,
+    otherwise streams the raw BSON of every document in _id order.
+    """
+    try:
+        result = database.command("dbHash", collections=[collection_name])
+        return result["collections"].get(collection_name, "empty")
+    except (OperationFailure, KeyError, NotImplementedError):
+        pass
+    raw_collection = database[collection_name].with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+    digest = hashlib.sha256()
+    for document in raw_collection.find({}, sort=[("_id", 1)], batch_size=1000):
+        digest.update(document.raw)
+    return digest.hexdigest()
+
+def model_version(policy=None):
+    """Describe the encoders (and their package versions) that the encoder policy uses."""
+    policy = (policy or config.ENCODER_POLICY).lower()
+    names = [SPACY, SBERT] if policy == HYBRID else [policy]
+    return {"policy": policy, "encoders": [get_encoder(name).model_version() for name in names]}
+
+def fingerprint(stage, inputs):
+    """Content address of a stage output: a hash of the stage name and its inputs."""
+    payload = json.dumps({"stage": stage, "inputs": inputs}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ArtifactCache:
+    """Stage outputs stored in MongoDB, keyed by the fingerprint of their inputs."""
+
+    def __init__(self, database, collection_name=None):
+        self.collection = database[collection_name or config.ARTIFACT_COLLECTION]
+
+    def load(self, stage, key):
+        """Return the stored output of a stage for this fingerprint, or None."""
+        try:
+            artifact = self.collection.find_one({"_id": key, "stage": stage})
+        except PyMongoError as e:
+            logger.warning(f"⚠️ Could not read the {stage} artifact: {e}")
+            return None
+        if artifact is None:
+            return None
+        logger.info(f"✅ Found {stage} artifact {key[:12]} from {artifact['created_at']}.")
+        return json.loads(artifact["output"])
+
+    def save(self, stage, key, inputs, output):
+        """Store the output of a stage under its fingerprint, keeping the inputs for inspection."""
+        try:
+            self.collection.replace_one(
+                {"_id": key},
+                {
+                    "stage": stage,
+                    # Stored as JSON because profile keys may contain characters MongoDB does not allow in field names
+                    "inputs": json.dumps(inputs, sort_keys=True, default=str),
+                    "output": json.dumps(output),
+                    "created_at": datetime.now(timezone.utc),
+                },
+                upsert=True,
+            )
+            logger.info(f"✅ Saved {stage} artifact {key[:12]}.")
+        except PyMongoError as e:
+            logger.warning(f"⚠️ Could not save the {stage} artifact: {e}")
@@ -0,0 +1,330 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : benchmarks.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script runs microbenchmarks of the functions called per
+                  value, per key pair or per result in a pipeline run. It works
+                  offline: embedding models are replaced by a deterministic stub
+                  encoder. Every benchmark reports calls per second and bytes
+                  allocated per call, compared against the stored baselines in
+                  benchmarks_baseline.json, and the run fails when one of them
+                  regresses beyond its tolerance. Speeds are compared relative
+                  to a calibration loop timed in the same run, so baselines
+                  carry over between machines.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import argparse
+import gc
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+import numpy as np
+import encoders
+from encoders import BaseEncoder
+from embedding import EmbeddingHandler, SPACY, SBERT
+from similarity_calculator import SimilarityCalculator
+from user2 import UserSimilarityAnalyzerFull
+from ranking_and_clustering import RankingAndClustering
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks_baseline.json")
+DEFAULT_TOLERANCE = 0.25  # Allowed relative drop in calls/sec or growth in bytes/call
+MIN_TIME = 0.2  # Seconds each timing repeat runs for
+REPEATS = 5
+ALLOC_CALLS = 50  # Calls traced to measure allocations
+CONFIRM_RUNS = 3  # Calibrated timing runs repeated before a slowdown counts as a regression
+CALIBRATION = "_calibration"  # Baseline entry holding the calibration speed the baselines were saved with
+
+SKILLS = ["Python", "SQL", "Java", "Machine Learning", "Data Engineering", "Go", "Project Management", "Statistics"]
+CITIES = ["Kochi", "Bangalore", "Pune", "Chennai"]
+
+class StubEncoder(BaseEncoder):
+    """Deterministic offline encoder: hashes the words of a text into a fixed-size vector."""
+
+    def __init__(self, dimension):
+        self.dimension = dimension
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dimension] += 1.0
+        return vectors
+
+    def store_key(self):
+        return None
+
+def install_stub_encoders():
+    """Serve the SpaCy and Sentence-BERT encoder names from stub encoders of the same dimensions."""
+    encoders._encoder_instances[SPACY] = StubEncoder(300)
+    encoders._encoder_instances[SBERT] = StubEncoder(384)
+    EmbeddingHandler._embedding_store = None
+
+def sample_profile(rng, index):
+    return {
+        "skills": rng.choice(SKILLS), "city": rng.choice(CITIES), "age": str(20 + index % 40),
+        "tags": rng.sample(SKILLS, 3), "experience": {"years": index % 15, "level": rng.choice(["junior", "senior"])},
+        "notes": "Worked on " + " and ".join(rng.sample(SKILLS, 2)).lower() + " projects",
+    }
+
+def sample_data(rng, profiles_per_role=100):
+    """Nested module -> role -> profiles data shaped like the pipeline input."""
+    return [{
+        "recruitment": {
+            "candidates": [sample_profile(rng, index) for index in range(profiles_per_role)],
+            "interviewers": [sample_profile(rng, index) for index in range(profiles_per_role)],
+        },
+        "shopping": {
+            "buyers": [sample_profile(rng, index) for index in range(profiles_per_role)],
+            "sellers": [sample_profile(rng, index) for index in range(profiles_per_role)],
+        },
+    }]
+
+def sample_results(rng, count=1000):
+    """Similarity result documents with NumPy scalars, as Step 2 produces them before JSON conversion."""
+    modules = ["recruitment", "shopping"]
+    results = []
+    for index in range(count):
+        module = modules[index % len(modules)]
+        results.append({
+            "user1": {"module": module, "role": "candidates", "user_index": np.int64(index % 97), "key": "skills", "value": rng.choice(SKILLS)},
+            "user2": {"module": module, "role": "interviewers", "user_index": np.int64(index % 89), "key": "tags", "value": rng.choice(SKILLS)},
+            "similarity_score": np.float32(rng.random()),
+            "long_text": False,
+        })
+    return results
+
+def build_benchmarks():
+    """Return the benchmarks as (name, zero-argument callable) pairs with their fixtures bound."""
+    rng = random.Random(42)
+    install_stub_encoders()
+    data = sample_data(rng)
+    allowed_keys = {module: {role: ["skills", "city", "age", "tags"] for role in roles} for module, roles in data[0].items()}
+    UserSimilarityAnalyzerFull.initialize_allowed_keys(allowed_keys)
+    profile = data[0]["recruitment"]["candidates"][0]
+    results = sample_results(rng)
+    vector1 = np.asarray(rng.choices(range(100), k=300), dtype=np.float32)
+    vector2 = np.asarray(rng.choices(range(100), k=300), dtype=np.float32)
+
+    word_text, sentence_text = "machine learning", "Built data pipelines in Python and SQL for machine learning teams"
+    EmbeddingHandler.get_word_embedding(word_text)
+    EmbeddingHandler.get_sentence_bert_embedding(sentence_text)
+
+    def word_embedding_miss():
+        EmbeddingHandler._forget((SPACY, word_text))
+        return EmbeddingHandler.get_word_embedding(word_text)
+
+    def sentence_embedding_miss():
+        EmbeddingHandler._forget((SBERT, sentence_text))
+        return EmbeddingHandler.get_sentence_bert_embedding(sentence_text)
+
+    return [
+        ("calculate_cosine_similarity", lambda: SimilarityCalculator.calculate_cosine_similarity(vector1, vector2)),
+        ("get_word_embedding[cached]", lambda: EmbeddingHandler.get_word_embedding(word_text)),
+        ("get_word_embedding[stub model]", word_embedding_miss),
+        ("get_sentence_bert_embedding[cached]", lambda: EmbeddingHandler.get_sentence_bert_embedding(sentence_text)),
+        ("get_sentence_bert_embedding[stub model]", sentence_embedding_miss),
+        ("handle_value[text]", lambda: UserSimilarityAnalyzerFull.handle_value("Data Engineering")),
+        ("handle_value[numeric]", lambda: UserSimilarityAnalyzerFull.handle_value("42")),
+        ("handle_value[list]", lambda: UserSimilarityAnalyzerFull.handle_value(["Python", "SQL", "Go"])),
+        ("_filter_keys", lambda: UserSimilarityAnalyzerFull._filter_keys(profile, "recruitment", "candidates")),
+        ("generate_key_value_pairs_full[400 profiles]", lambda: UserSimilarityAnalyzerFull.generate_key_value_pairs_full(data)),
+        ("convert_numpy_types[1000 results]", lambda: RankingAndClustering.convert_numpy_types(results)),
+        ("rank_and_cluster_by_module[1000 results]", lambda: RankingAndClustering.rank_and_cluster_by_module(results)),
+    ]
+
+def build_calibration():
+    """
+    Return a fixed workload mixing interpreter and small NumPy work like the benchmarks do. Its speed in
+    the current run scales the baselines, so they hold on slower or faster machines.
+    """
+    words = [f"Value {index} of Skill {index % 7}" for index in range(200)]
+    vector = np.arange(300, dtype=np.float32)
+
+    def workload():
+        counts = {}
+        for word in words:
+            key = " ".join(word.split()).casefold()
+            counts[key] = counts.get(key, 0) + 1
+        sorted(counts, key=len)
+        return float(np.dot(vector, vector))
+
+    return workload
+
+def measure_speed(function):
+    """Best calls/sec over REPEATS timing runs of at least MIN_TIME seconds each, with GC paused like timeit."""
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _best_rate(function)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+def _best_rate(function):
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_TIME / 10:
+            break
+        calls *= 10
+    calls = max(1, int(calls * MIN_TIME / elapsed))
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        best = min(best, (time.perf_counter() - start) / calls)
+    return 1.0 / best
+
+def measure_allocations(function):
+    """Mean peak bytes allocated during one call, above what was allocated before it."""
+    function()  # Warm lazily built state so it is not counted
+    tracemalloc.start()
+    try:
+        total = 0
+        for _ in range(ALLOC_CALLS):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            function()
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return total / ALLOC_CALLS
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def check_regression(measured, baseline, tolerance, scale=1.0):
+    """
+    Return the reasons a measurement regressed against its baseline (empty when it did not).
+    scale is this run's calibration speed relative to the one the baseline was saved with.
+    """
+    tolerance = baseline.get("tolerance", tolerance)
+    expected = baseline["ops_per_sec"] * scale
+    reasons = []
+    if measured["ops_per_sec"] < expected * (1 - tolerance):
+        reasons.append(f"{measured['ops_per_sec']:.0f} calls/sec < {expected:.0f} - {tolerance:.0%}")
+    # Tiny allocations vary with interpreter internals, so allow a fixed slack on top
+    if measured["alloc_bytes"] > baseline["alloc_bytes"] * (1 + tolerance) + 256:
+        reasons.append(f"{measured['alloc_bytes']:.0f} B/call > {baseline['alloc_bytes']:.0f} + {tolerance:.0%}")
+    return reasons
+
+def run(selected=None, save=False, baseline_path=BASELINE_FILE, tolerance=DEFAULT_TOLERANCE):
+    """
+    Run the benchmarks and compare them with the baselines.
+
+    Returns:
+        int: Number of regressed benchmarks (0 when saving new baselines).
+    """
+    # Per-call logging would be measured with the functions; keep only warnings and errors
+    logging.getLogger().setLevel(logging.WARNING)
+    for name in ("user2", "ranking_and_clustering", "embedding", "similarity_calculator"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    baselines = load_baselines(baseline_path)
+    calibration = build_calibration()
+    saved_calibration = baselines.get(CALIBRATION, {}).get("ops_per_sec")
+    if baselines and not saved_calibration and not save:
+        print("⚠️ The baselines have no calibration entry; speeds are not checked. Regenerate them with --save.")
+    measurements = {}
+    regressions = 0
+    print(f"{'benchmark':<46} {'calls/sec':>14} {'B/call':>10} {'baseline':>14}  status")
+    for name, function in build_benchmarks():
+        if selected and not any(pattern in name for pattern in selected):
+            continue
+        # Timed next to every benchmark, so load that changes during the run scales both alike
+        calibration_speed = measure_speed(calibration)
+        measured = {"ops_per_sec": measure_speed(function), "alloc_bytes": measure_allocations(function)}
+        measurements[name] = (measured, calibration_speed)
+        baseline = baselines.get(name)
+        scale = calibration_speed / saved_calibration if saved_calibration else None
+        if baseline is None:
+            # Reported, never failed: a new benchmark gets its baseline with the next --save
+            status, baseline_text = "no baseline", "-"
+        else:
+            # Without a calibration entry only allocations are comparable across machines
+            checked = measured if scale else dict(measured, ops_per_sec=float("inf"))
+            reasons = [] if save else check_regression(checked, baseline, tolerance, scale or 1.0)
+            for _ in range(CONFIRM_RUNS if reasons and scale else 0):
+                # Confirm with calibrated reruns, so one noisy run does not fail the check; a real slowdown persists
+                rerun_scale = measure_speed(calibration) / saved_calibration
+                rerun = dict(measured, ops_per_sec=measure_speed(function))
+                if rerun["ops_per_sec"] / rerun_scale > measured["ops_per_sec"] / scale:
+                    measured, scale = rerun, rerun_scale
+                reasons = check_regression(measured, baseline, tolerance, scale)
+                if not reasons:
+                    break
+            regressions += bool(reasons)
+            status = "❌ REGRESSION: " + "; ".join(reasons) if reasons else "✅ ok"
+            baseline_text = f"{baseline['ops_per_sec'] * (scale or 1.0):.0f}"
+        print(f"{name:<46} {measured['ops_per_sec']:>14.0f} {measured['alloc_bytes']:>10.0f} {baseline_text:>14}  {status}")
+
+    if save:
+        # Speeds are stored relative to one calibration, so saving a subset keeps the other baselines valid
+        if not saved_calibration:
+            saved_calibration = max(calibration_speed for _, calibration_speed in measurements.values())
+            baselines[CALIBRATION] = {"ops_per_sec": round(saved_calibration, 1)}
+        for name, (measured, calibration_speed) in measurements.items():
+            measured["ops_per_sec"] *= saved_calibration / calibration_speed
+            # Keep hand-tuned tolerances of existing entries
+            entry = {key: round(value, 1) for key, value in measured.items()}
+            if "tolerance" in baselines.get(name, {}):
+                entry["tolerance"] = baselines[name]["tolerance"]
+            baselines[name] = entry
+        with open(baseline_path, "w", encoding="utf-8") as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+            file.write("\n")
+        print(f"✅ Saved {len(measurements)} baselines to '{baseline_path}'.")
+        return 0
+    if regressions:
+        print(f"❌ {regressions} benchmark(s) regressed beyond tolerance.")
+    return regressions
+
+def parse_args():
+    """Parse command line options for the benchmarks."""
+    parser = argparse.ArgumentParser(description="Run the hot-path microbenchmarks and compare them with the stored baselines.")
+    parser.add_argument("patterns", nargs="*", help="Run only benchmarks whose name contains one of these substrings.")
+    parser.add_argument("--save", action="store_true", help="Store the measurements as the new baselines instead of checking them.")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file (default: benchmarks_baseline.json).")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative regression for benchmarks without their own tolerance (default: 0.25).")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    sys.exit(1 if run(args.patterns, args.save, args.baseline, args.tolerance) else 0)
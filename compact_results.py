@@ -0,0 +1,316 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : compact_results.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script defines the compact representation of similarity
+                  results. Roles, keys and values are interned into id tables
+                  and every result is one row of a NumPy structured array (ids
+                  plus a float32 score). Rows expand to the nested result
+                  documents on demand, and can be stored in MongoDB in a compact
+                  id-based schema whose value texts live in a separate table
+                  collection. Readers accept both schemas.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import logging
+import threading
+import numpy as np
+from bson import ObjectId
+from pymongo import InsertOne
+from pymongo.errors import PyMongoError
+from value_memo import ValueInterner
+import config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Result storage schemas
+DOCUMENTS = "documents"
+COMPACT = "compact"
+
+RESULT_DTYPE = np.dtype([
+    ("module", np.uint32),
+    ("role1", np.uint32), ("user1", np.uint32), ("key1", np.uint32), ("value1", np.uint32),
+    ("role2", np.uint32), ("user2", np.uint32), ("key2", np.uint32), ("value2", np.uint32),
+    ("score", np.float32),
+    ("long_text", np.bool_),
+])
+
+TABLE_NAMES = ("modules", "roles", "keys", "values")
+
+class ResultTables:
+    """Id tables for the module, role, key and display value strings referenced by result rows."""
+
+    def __init__(self):
+        self.modules = ValueInterner()
+        self.roles = ValueInterner()
+        self.keys = ValueInterner()
+        self.values = ValueInterner()
+        # Identifies this set of ids in MongoDB, since another process assigns different ids
+        self.table_set = ObjectId()
+
+    def table(self, name):
+        return getattr(self, name)
+
+    def clear(self):
+        """Forget all ids and start a new table set."""
+        for name in TABLE_NAMES:
+            self.table(name).clear()
+        self.table_set = ObjectId()
+
+# Process-wide tables used by Step 2
+RESULT_TABLES = ResultTables()
+
+class ResultBatch:
+    """A batch of similarity results stored as a structured array of ids."""
+
+    __slots__ = ("rows", "tables")
+
+    def __init__(self, rows=None, tables=None):
+        self.rows = rows if rows is not None else np.empty(0, dtype=RESULT_DTYPE)
+        self.tables = tables or RESULT_TABLES
+
+    @staticmethod
+    def from_tuples(tuples, tables=None):
+        """Build a batch from row tuples in RESULT_DTYPE field order."""
+        return ResultBatch(np.array(tuples, dtype=RESULT_DTYPE), tables)
+
+    @staticmethod
+    def concatenate(batches, tables=None):
+        """Join batches that share the same tables."""
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return ResultBatch(tables=tables)
+        return ResultBatch(np.concatenate([batch.rows for batch in batches]), batches[0].tables)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def split_by_module(self):
+        """Return the rows of each module as module name -> ResultBatch."""
+        return {
+            self.tables.modules.text(int(module_id)): ResultBatch(self.rows[self.rows["module"] == module_id], self.tables)
+            for module_id in np.unique(self.rows["module"])
+        }
+
+    def sorted_by_score(self):
+        """Return the rows in descending score order (stable for equal scores)."""
+        return ResultBatch(self.rows[np.argsort(-self.rows["score"], kind="stable")], self.tables)
+
+    def to_documents(self):
+        """Expand the rows into the nested result documents."""
+        tables = self.tables
+        text = lambda table, value_id: table.text(int(value_id))
+        documents = []
+        for row in self.rows:
+            module = text(tables.modules, row["module"])
+            documents.append({
+                "user1": {"module": module, "role": text(tables.roles, row["role1"]), "user_index": int(row["user1"]),
+                          "key": text(tables.keys, row["key1"]), "value": text(tables.values, row["value1"])},
+                "user2": {"module": module, "role": text(tables.roles, row["role2"]), "user_index": int(row["user2"]),
+                          "key": text(tables.keys, row["key2"]), "value": text(tables.values, row["value2"])},
+                "similarity_score": float(row["score"]),
+                "long_text": bool(row["long_text"]),
+            })
+        return documents
+
+    def to_compact_documents(self):
+        """
+        Convert the rows into compact MongoDB documents. The module name is kept as text so results
+        stay queryable per module; roles, keys and values are ids into the table set 't'.
+        """
+        tables = self.tables
+        return [
+            {
+                "t": tables.table_set, "m": tables.modules.text(int(row["module"])),
+                "r1": int(row["role1"]), "u1": int(row["user1"]), "k1": int(row["key1"]), "v1": int(row["value1"]),
+                "r2": int(row["role2"]), "u2": int(row["user2"]), "k2": int(row["key2"]), "v2": int(row["value2"]),
+                "s": float(row["score"]), "l": bool(row["long_text"]),
+            }
+            for row in self.rows
+        ]
+
+    @staticmethod
+    def from_documents(documents, tables=None):
+        """Intern nested result documents into a batch."""
+        tables = tables or RESULT_TABLES
+        return ResultBatch.from_tuples([
+            (
+                tables.modules.intern(document["user1"]["module"]),
+                tables.roles.intern(document["user1"]["role"]), document["user1"]["user_index"],
+                tables.keys.intern(document["user1"]["key"]), tables.values.intern(str(document["user1"]["value"])),
+                tables.roles.intern(document["user2"]["role"]), document["user2"]["user_index"],
+                tables.keys.intern(document["user2"]["key"]), tables.values.intern(str(document["user2"]["value"])),
+                document["similarity_score"], document.get("long_text", False),
+            )
+            for document in documents
+        ], tables)
+
+    @staticmethod
+    def from_compact_documents(documents, stored_tables, tables=None):
+        """Translate compact documents through their stored table sets into a batch with local ids."""
+        tables = tables or RESULT_TABLES
+        rows = []
+        for document in documents:
+            stored = stored_tables[document["t"]]
+            rows.append((
+                tables.modules.intern(document["m"]),
+                tables.roles.intern(stored["roles"][document["r1"]]), document["u1"],
+                tables.keys.intern(stored["keys"][document["k1"]]), tables.values.intern(stored["values"][document["v1"]]),
+                tables.roles.intern(stored["roles"][document["r2"]]), document["u2"],
+                tables.keys.intern(stored["keys"][document["k2"]]), tables.values.intern(stored["values"][document["v2"]]),
+                document["s"], document["l"],
+            ))
+        return ResultBatch.from_tuples(rows, tables)
+
+def table_collection_name(collection_name_out):
+    """Name of the collection holding the id tables of a compact output collection."""
+    return f"{collection_name_out}__tables"
+
+class CompactTableWriter:
+    """Persists the table entries referenced by compact results, each entry once per table set."""
+
+    def __init__(self, database, collection_name_out, tables=None):
+        self.collection = database[table_collection_name(collection_name_out)]
+        self.tables = tables or RESULT_TABLES
+        self._persisted = {}  # table set -> table name -> entries written
+        self._lock = threading.Lock()
+
+    def write_new_entries(self, tables=None):
+        """
+        Insert the entries added to the tables since the last call. Must run before the results that use them.
+        tables defaults to the writer's tables; batches read back from MongoDB bring their own.
+        """
+        tables = tables or self.tables
+        with self._lock:
+            table_set = tables.table_set
+            persisted = self._persisted.get(table_set, {name: 0 for name in TABLE_NAMES})
+            operations = []
+            sizes = {}
+            for name in TABLE_NAMES:
+                table = tables.table(name)
+                sizes[name] = len(table)
+                operations.extend(
+                    InsertOne({"t": table_set, "table": name, "id": entry_id, "text": table.text(entry_id)})
+                    for entry_id in range(persisted[name], sizes[name])
+                )
+            if operations:
+                try:
+                    self.collection.bulk_write(operations, ordered=False)
+                except PyMongoError as e:
+                    logger.error(f"Error writing result tables: {e}")
+                    raise Exception(f"Error writing result tables: {e}")
+            self._persisted[table_set] = sizes
+
+def load_table_sets(database, collection_name_out):
+    """Read the stored id tables of a compact output collection as table set -> table name -> {id: text}."""
+    table_sets = {}
+    for entry in database[table_collection_name(collection_name_out)].find({}, {"_id": 0}):
+        table_sets.setdefault(entry["t"], {name: {} for name in TABLE_NAMES})[entry["table"]][entry["id"]] = entry["text"]
+    return table_sets
+
+class StoredTableSets:
+    """
+    The stored id tables of compact output collections, each read from MongoDB once on first use.
+    A reader that reads a collection module by module keeps one instance instead of reloading the tables per module.
+    """
+
+    def __init__(self):
+        self._table_sets = {}  # collection -> table set -> table name -> {id: text}
+
+    def get(self, database, collection_name_out):
+        if collection_name_out not in self._table_sets:
+            self._table_sets[collection_name_out] = load_table_sets(database, collection_name_out)
+        return self._table_sets[collection_name_out]
+
+def result_query(result_format=None, module=None):
+    """Filter matching the result documents (not the count document) of an output collection."""
+    if (result_format or config.RESULT_FORMAT) == COMPACT:
+        query = {"s": {"$exists": True}}
+        if module is not None:
+            query["m"] = module
+        return query
+    query = {"similarity_score": {"$exists": True}}
+    if module is not None:
+        query["user1.module"] = module
+    return query
+
+def score_field(result_format=None):
+    """Name of the score field in stored result documents."""
+    return "s" if (result_format or config.RESULT_FORMAT) == COMPACT else "similarity_score"
+
+def stored_result_format(database, collection_name):
+    """
+    Return the schema of the results stored in a collection, detected from one of them,
+    so a collection written with another RESULT_FORMAT is still read. Empty collections use RESULT_FORMAT.
+    """
+    document = database[collection_name].find_one(
+        {"$or": [result_query(COMPACT), result_query(DOCUMENTS)]}, {"s": 1}
+    )
+    if document is None:
+        return config.RESULT_FORMAT
+    return COMPACT if "s" in document else DOCUMENTS
+
+def count_results(database, collection_name, module=None):
+    """Count the stored results of an output collection, optionally for one module."""
+    return database[collection_name].count_documents(result_query(stored_result_format(database, collection_name), module))
+
+def result_modules(database, collection_name):
+    """Return the modules that have stored results."""
+    result_format = stored_result_format(database, collection_name)
+    field = "m" if result_format == COMPACT else "user1.module"
+    return database[collection_name].distinct(field, result_query(result_format))
+
+def iter_result_batches(database, collection_name, batch_size=1000, module=None, sort_by_score=False,
+                        stored_tables=None, tables=None):
+    """
+    Yield the stored results of an output collection as ResultBatch objects with local ids.
+
+    Args:
+        stored_tables: StoredTableSets shared by the reads of one reader; by default the tables are loaded for this call.
+        tables: ResultTables the batches are interned into. By default every batch gets its own,
+            which is freed with the batch; pass one to keep the ids of consecutive batches comparable.
+    """
+    result_format = stored_result_format(database, collection_name)
+    compact = result_format == COMPACT
+    if compact:
+        table_sets = (stored_tables or StoredTableSets()).get(database, collection_name)
+    cursor = database[collection_name].find(
+        result_query(result_format, module), {"_id": 0},
+        sort=[(score_field(result_format), -1)] if sort_by_score else None, batch_size=batch_size, allow_disk_use=True,
+    )
+
+    def to_batch(documents):
+        batch_tables = tables or ResultTables()
+        if compact:
+            return ResultBatch.from_compact_documents(documents, table_sets, batch_tables)
+        return ResultBatch.from_documents(documents, batch_tables)
+
+    documents = []
+    for document in cursor:
+        documents.append(document)
+        if len(documents) >= batch_size:
+            yield to_batch(documents)
+            documents = []
+    if documents:
+        yield to_batch(documents)
@@ -59,7 +59,103 @@ COLLECTION_NAME = get_env_variable("COLLECTION_NAME", "modified_data", required=
 COLLECTION_NAME_OUT = get_env_variable("COLLECTION_NAME_OUT", "sample_001", required=False)
 VECTOR_COLLECTION = get_env_variable("vECTOR_COLLECTION", "sample_002", required=False)
 
+# Load MongoDB connection pool settings
+MONGO_MAX_POOL_SIZE = int(get_env_variable("MONGO_MAX_POOL_SIZE", "50", required=False))
+MONGO_MIN_POOL_SIZE = int(get_env_variable("MONGO_MIN_POOL_SIZE", "0", required=False))
+MONGO_MAX_IDLE_TIME_MS = int(get_env_variable("MONGO_MAX_IDLE_TIME_MS", "60000", required=False))
+MONGO_CONNECT_TIMEOUT_MS = int(get_env_variable("MONGO_CONNECT_TIMEOUT_MS", "10000", required=False))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(get_env_variable("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000", required=False))
+MONGO_SOCKET_TIMEOUT_MS = int(get_env_variable("MONGO_SOCKET_TIMEOUT_MS", "0", required=False))  # 0 = no timeout
+MONGO_COMPRESSORS = get_env_variable("MONGO_COMPRESSORS", "zlib", required=False)  # e.g. "zstd,snappy,zlib"
+MONGO_BULK_WRITE_CONCERN = get_env_variable("MONGO_BULK_WRITE_CONCERN", "1", required=False)  # w for bulk loads
+MONGO_BULK_JOURNAL = get_env_variable("MONGO_BULK_JOURNAL", "false", required=False).lower() == "true"
+
 # Load processing settings
 THRESHOLD = float(get_env_variable("THRESHOLD", "0.6", required=False))
 SAMPLE_SIZE = int(get_env_variable("SAMPLE_SIZE", "5", required=False))
 NUM_CLUSTERS = int(get_env_variable("NUM_CLUSTERS", "6", required=False))
+
+# Load embedding settings
+ENCODER_POLICY = get_env_variable("ENCODER_POLICY", "hybrid", required=False)  # hybrid | any registered encoder (sbert, spacy, hashing)
+EMBEDDING_BATCH_SIZE = int(get_env_variable("EMBEDDING_BATCH_SIZE", "256", required=False))
+SPACY_VECTORS_ONLY = get_env_variable("SPACY_VECTORS_ONLY", "true", required=False).lower() == "true"  # spaCy: load only the tokenizer and vectors (same vectors)
+HASHING_DIM = int(get_env_variable("HASHING_DIM", "1024", required=False))
+HASHING_TFIDF = get_env_variable("HASHING_TFIDF", "false", required=False).lower() == "true"
+
+# Ingest-time embeddings
+EMBEDDING_COLLECTION = get_env_variable("EMBEDDING_COLLECTION", "profile_embeddings", required=False)
+INGEST_BATCH_SIZE = int(get_env_variable("INGEST_BATCH_SIZE", "500", required=False))
+USE_PRECOMPUTED_EMBEDDINGS = get_env_variable("USE_PRECOMPUTED_EMBEDDINGS", "true", required=False).lower() == "true"
+VECTOR_ENCODING = get_env_variable("VECTOR_ENCODING", "binary", required=False).lower()  # binary (float32 bytes) | list (legacy)
+
+# Result schema in MongoDB: documents (nested documents) | compact (ids, texts in <collection>__tables)
+RESULT_FORMAT = get_env_variable("RESULT_FORMAT", "documents", required=False).lower()
+
+# Create the pipeline's MongoDB indexes at start and warn about collection scans in hot-path queries
+ENSURE_INDEXES = get_env_variable("ENSURE_INDEXES", "true", required=False).lower() == "true"
+
+# Reuse stage outputs whose inputs (data, THRESHOLD, SAMPLE_SIZE, encoder models) are unchanged
+ARTIFACT_CACHE = get_env_variable("ARTIFACT_CACHE", "true", required=False).lower() == "true"
+ARTIFACT_COLLECTION = get_env_variable("ARTIFACT_COLLECTION", "pipeline_artifacts", required=False)
+
+# Sharded runs: id shared by the workers and the coordinator of one run (or --run-id)
+SHARD_RUN_ID = get_env_variable("SHARD_RUN_ID", "", required=False)
+SHARD_STEP1_WAIT = float(get_env_variable("SHARD_STEP1_WAIT", "60", required=False))  # seconds a worker without keys waits for another's
+
+# Run-versioned Step 2 output: a run writes <COLLECTION_NAME_OUT>__run_<id> and replaces the output when complete
+RESULT_RUNS_COLLECTION = get_env_variable("RESULT_RUNS_COLLECTION", "result_runs", required=False)  # run records and result counts
+
+# User-pair results: one key-weighted score per user pair in <COLLECTION_NAME_OUT>__user_pairs, ranked by Step 3
+USER_PAIR_AGGREGATION = get_env_variable("USER_PAIR_AGGREGATION", "false", required=False).lower() == "true"
+KEY_LEVEL_RESULTS = get_env_variable("KEY_LEVEL_RESULTS", "true", required=False).lower() == "true"  # keep key-level rows for drill-down
+
+# Per-user recommendations materialized after Step 3: best matches per (module, role, user), capped
+MATERIALIZE_RECOMMENDATIONS = get_env_variable("MATERIALIZE_RECOMMENDATIONS", "true", required=False).lower() == "true"
+RECOMMENDATIONS_COLLECTION = get_env_variable("RECOMMENDATIONS_COLLECTION", "recommendations", required=False)
+RECOMMENDATIONS_TOP_K = int(get_env_variable("RECOMMENDATIONS_TOP_K", "20", required=False))
+
+# Step 2 scheduling: work is split into about STEP2_WORKERS * STEP2_TILES_PER_WORKER tiles of similar cost
+STEP2_WORKERS = int(get_env_variable("STEP2_WORKERS", "4", required=False))
+STEP2_TILES_PER_WORKER = int(get_env_variable("STEP2_TILES_PER_WORKER", "8", required=False))
+STEP2_MIN_TILE_COST = int(get_env_variable("STEP2_MIN_TILE_COST", "10000", required=False))  # key pairs; smaller role pairs are not split
+
+# Profile prefilter: compare key-weighted mean profile vectors first; only candidates are compared key by key
+PROFILE_PREFILTER = get_env_variable("PROFILE_PREFILTER", "false", required=False).lower() == "true"
+PREFILTER_THRESHOLD = float(get_env_variable("PREFILTER_THRESHOLD", "0.5", required=False))  # always keep pairs at or above
+PREFILTER_TOP_K = int(get_env_variable("PREFILTER_TOP_K", "50", required=False))  # always keep the most similar profiles per role
+PREFILTER_ENCODER = get_env_variable("PREFILTER_ENCODER", "", required=False)  # "" = the policy's short-text encoder
+
+# Per-module sparse score matrices kept down to a floor threshold, for re-thresholding without Step 2 ("" = off)
+SCORE_MATRIX_DIR = get_env_variable("SCORE_MATRIX_DIR", "", required=False)
+SCORE_MATRIX_FLOOR = float(get_env_variable("SCORE_MATRIX_FLOOR", "0.3", required=False))
+
+# Memory budget (0 = unlimited); Step 2 and Step 3 size their tiles, caches and batches to stay under it
+MAX_MEMORY_MB = int(get_env_variable("MAX_MEMORY_MB", "0", required=False))
+STEP2_TILE_SIZE = int(get_env_variable("STEP2_TILE_SIZE", "256", required=False))  # initial work tiles per dask round under a budget
+
+# Dry-run cost planner (--plan)
+PLAN_SAMPLE_PROFILES = int(get_env_variable("PLAN_SAMPLE_PROFILES", "50", required=False))
+PLAN_SAMPLE_COMPARISONS = int(get_env_variable("PLAN_SAMPLE_COMPARISONS", "2000", required=False))
+PLAN_OUTPUT_FILE = get_env_variable("PLAN_OUTPUT_FILE", "plan.json", required=False)
+VALUE_SCORE_CACHE_SIZE = int(get_env_variable("VALUE_SCORE_CACHE_SIZE", "1000000", required=False))
+
+# Load stage handoff settings
+STAGE_HANDOFF = get_env_variable("STAGE_HANDOFF", "memory", required=False).lower()  # memory | mongo
+PERSIST_STEP2_RESULTS = get_env_variable("PERSIST_STEP2_RESULTS", "true", required=False).lower() == "true"
+
+# Load async execution settings
+ASYNC_WORKERS = int(get_env_variable("ASYNC_WORKERS", "4", required=False))
+ASYNC_QUEUE_SIZE = int(get_env_variable("ASYNC_QUEUE_SIZE", "64", required=False))
+ASYNC_FETCH_BATCH_SIZE = int(get_env_variable("ASYNC_FETCH_BATCH_SIZE", "100", required=False))
+
+# Load logging settings
+LOG_LEVEL = get_env_variable("LOG_LEVEL", "INFO", required=False).upper()
+LOG_SAMPLE_RATE = float(get_env_variable("LOG_SAMPLE_RATE", "0.01", required=False))  # fraction of hot-path debug events kept
+LOG_RATE_LIMIT = int(get_env_variable("LOG_RATE_LIMIT", "20", required=False))  # max hot-path debug lines per second
+
+# On-demand profiling: stages to profile ("step1,step2", "all"; "" = off), profilers and report location
+PROFILE_STAGES = get_env_variable("PROFILE_STAGES", "", required=False)
+PROFILERS = get_env_variable("PROFILERS", "cprofile,tracemalloc", required=False)  # cprofile, sampling (pyinstrument), tracemalloc
+PROFILE_DIR = get_env_variable("PROFILE_DIR", "profiles", required=False)
+PROFILE_TOP_N = int(get_env_variable("PROFILE_TOP_N", "30", required=False))  # entries per report
+PROFILE_TRACEMALLOC_FRAMES = int(get_env_variable("PROFILE_TRACEMALLOC_FRAMES", "1", required=False))
@@ -0,0 +1,317 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : cost_planner.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script implements the dry-run cost planner (--plan). It
+                  reads profile counts and only the profile fields Step 1
+                  selected, counts exactly how many key-pair comparisons full
+                  profile matching would make per module, estimates the number
+                  of distinct texts to embed, and projects wall time, peak
+                  memory and result volume from per-operation costs measured
+                  on a small sample of real comparisons.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import json
+import logging
+import random
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+import bson
+from db import count_profiles_by_module_role
+from embedding import EmbeddingHandler, SHORT_TEXT_MAX_LENGTH
+from encoders import get_encoder
+from similarity_calculator import SimilarityCalculator
+from user2 import UserSimilarityAnalyzerFull
+from value_memo import ValueScoreCache
+from compact_results import ResultBatch, ResultTables, COMPACT
+import config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class CostPlanner:
+    """Estimates the work and cost of Step 2 without running it."""
+
+    def __init__(self, database, collection_name, top_comparable_keys, threshold, key_alignment=None, output_filename=None):
+        self.database = database
+        self.collection_name = collection_name
+        self.top_comparable_keys = top_comparable_keys
+        self.threshold = threshold
+        self.key_alignment = key_alignment or {}
+        self.output_filename = output_filename or config.PLAN_OUTPUT_FILE
+        self.sample_profiles = config.PLAN_SAMPLE_PROFILES
+        self.sample_comparisons = config.PLAN_SAMPLE_COMPARISONS
+        self._random = random.Random(0)
+
+    def execute(self):
+        """Build, report and save the plan."""
+        print("🔹 Planning Step 2 (dry run, nothing is written to the output collection)...")
+        UserSimilarityAnalyzerFull.initialize_allowed_keys(self.top_comparable_keys)
+        UserSimilarityAnalyzerFull.initialize_key_alignment(self.key_alignment)
+
+        profile_counts = count_profiles_by_module_role(self.database, self.collection_name)
+        key_sets, texts_by_module, distinct_texts, samples = self._scan_profiles()
+        comparisons = {module: self._count_comparisons(module, roles) for module, roles in key_sets.items()}
+        try:
+            costs = self._measure_costs(self._sample_comparison_texts(samples))
+        except Exception as e:
+            logger.error(f"❌ Could not measure per-operation costs, projecting counts only: {e}")
+            costs = self._measure_costs([])
+        plan = self._project(profile_counts, key_sets, comparisons, texts_by_module, len(distinct_texts), costs)
+        self._report(plan)
+        try:
+            with open(self.output_filename, "w") as file:
+                json.dump(plan, file, indent=4)
+            print(f"✅ Plan written to {self.output_filename}")
+        except Exception as e:
+            print(f"Error writing plan to file {self.output_filename}: {e}")
+        return plan
+
+    def _projection(self):
+        """Project only the profile fields Step 2 compares."""
+        projection = {
+            f"{module}.{role}.{key}": 1
+            for module, roles in self.top_comparable_keys.items()
+            for role, keys in roles.items()
+            for key in keys
+        }
+        return projection or None
+
+    def _scan_profiles(self):
+        """
+        Read the compared fields of every profile once.
+
+        Returns:
+            tuple: module -> role -> Counter of usable key sets, module -> number of distinct texts,
+                   the set of distinct text hashes, and module -> role -> sampled prepared profiles.
+        """
+        key_sets = defaultdict(lambda: defaultdict(Counter))
+        module_texts = defaultdict(set)
+        distinct_texts = set()
+        samples = defaultdict(lambda: defaultdict(list))
+        seen = defaultdict(Counter)
+
+        profiles = (
+            profile
+            for document in self.database[self.collection_name].find({}, self._projection())
+            for profile in UserSimilarityAnalyzerFull.generate_key_value_pairs_full(document)
+        )
+        for module, role, _, _, user in profiles:
+            profile = {}
+            for key, value in user.items():
+                text = UserSimilarityAnalyzerFull.canonicalize_value(value)
+                if text:
+                    profile[key] = text
+            if not profile:
+                continue  # Step 2 skips profiles without a usable value
+            key_sets[module][role][frozenset(profile)] += 1
+            for text in profile.values():
+                # Hashes keep the planner's memory small on large collections
+                module_texts[module].add(hash(text))
+                distinct_texts.add(hash(text))
+            # Reservoir sample of profiles per role, used to measure real comparisons
+            seen[module][role] += 1
+            role_sample = samples[module][role]
+            if len(role_sample) < self.sample_profiles:
+                role_sample.append(profile)
+            else:
+                slot = self._random.randrange(seen[module][role])
+                if slot < self.sample_profiles:
+                    role_sample[slot] = profile
+
+        texts_by_module = {module: len(hashes) for module, hashes in module_texts.items()}
+        return key_sets, texts_by_module, distinct_texts, samples
+
+    def _count_comparisons(self, module, roles):
+        """Count the key-pair comparisons _calculate_similarity_for_pair_full makes in a module."""
+        total = 0
+        for role1, key_sets1 in roles.items():
+            for role2, key_sets2 in roles.items():
+                if role1 == role2:
+                    continue
+                for keys1, count1 in key_sets1.items():
+                    profile1 = dict.fromkeys(keys1)
+                    for keys2, count2 in key_sets2.items():
+                        pairs = sum(1 for _ in UserSimilarityAnalyzerFull._aligned_key_pairs(
+                            profile1, dict.fromkeys(keys2), module, role1, role2
+                        ))
+                        total += count1 * count2 * pairs
+        return total
+
+    def _sample_comparison_texts(self, samples):
+        """Build a sample of real (text1, text2) comparisons from the sampled profiles."""
+        comparisons = []
+        for module, roles in samples.items():
+            for role1, profiles1 in roles.items():
+                for role2, profiles2 in roles.items():
+                    if role1 == role2:
+                        continue
+                    for profile1 in profiles1:
+                        for profile2 in profiles2:
+                            for key1, key2 in UserSimilarityAnalyzerFull._aligned_key_pairs(profile1, profile2, module, role1, role2):
+                                comparisons.append((profile1[key1], profile2[key2]))
+        if len(comparisons) > self.sample_comparisons:
+            comparisons = self._random.sample(comparisons, self.sample_comparisons)
+        return comparisons
+
+    def _measure_costs(self, comparisons):
+        """Measure embedding, scoring and memory costs on the sampled comparisons."""
+        costs = {
+            "embed_seconds_per_text": 0.0, "stored_fraction": 0.0, "score_seconds_per_pair": 0.0,
+            "lookup_seconds_per_comparison": 0.0, "match_rate": 0.0, "result_bytes": 0.0,
+            "result_memory_bytes": 0.0, "vector_memory_bytes": 0.0, "score_cache_entry_bytes": 0.0,
+        }
+        if not comparisons:
+            return costs
+
+        # Embedding: time the encoders directly on the distinct sampled texts, bypassing every cache
+        texts_by_encoder = defaultdict(list)
+        for text in dict.fromkeys(text for pair in comparisons for text in pair):
+            texts_by_encoder[EmbeddingHandler.select_encoder(text, text)].append(text)
+        sample_text_count = sum(len(texts) for texts in texts_by_encoder.values())
+        embed_seconds, stored, vector_bytes = 0.0, 0, 0
+        for encoder, texts in texts_by_encoder.items():
+            stored += len(EmbeddingHandler.get_stored_embeddings(texts, encoder))
+            get_encoder(encoder).encode(texts[:1])  # Load the model outside the measurement
+            start = time.perf_counter()
+            vectors = get_encoder(encoder).encode(texts)
+            embed_seconds += time.perf_counter() - start
+            vector_bytes += sum(vector.nbytes for vector in vectors)
+        costs["embed_seconds_per_text"] = embed_seconds / sample_text_count
+        costs["stored_fraction"] = stored / sample_text_count
+        costs["vector_memory_bytes"] = vector_bytes / sample_text_count
+
+        # Scoring: the same encoder choice and cosine similarity Step 2 uses
+        vectors = {}
+        for text1, text2 in comparisons:
+            encoder = EmbeddingHandler.select_encoder(text1, text2)
+            for text in (text1, text2):
+                if (encoder, text) not in vectors:
+                    vectors[(encoder, text)] = EmbeddingHandler.get_embedding(text, encoder)
+        scores = []
+        start = time.perf_counter()
+        for text1, text2 in comparisons:
+            encoder = EmbeddingHandler.select_encoder(text1, text2)
+            emb1, emb2 = vectors[(encoder, text1)], vectors[(encoder, text2)]
+            if emb1 is not None and emb2 is not None:
+                scores.append((text1, text2, SimilarityCalculator.calculate_cosine_similarity(emb1, emb2)))
+        costs["score_seconds_per_pair"] = (time.perf_counter() - start) / len(comparisons)
+        matches = [(text1, text2, float(score)) for text1, text2, score in scores if score is not None and score >= self.threshold]
+        costs["match_rate"] = len(matches) / len(comparisons)
+
+        # Comparisons whose value pair was already scored only cost a score cache lookup
+        score_cache = ValueScoreCache(len(comparisons))
+        for index in range(len(comparisons)):
+            score_cache.get_or_compute(index, index + 1, lambda: (0.0, False))
+        start = time.perf_counter()
+        for index in range(len(comparisons)):
+            score_cache.get_or_compute(index, index + 1, lambda: (0.0, False))
+        costs["lookup_seconds_per_comparison"] = (time.perf_counter() - start) / len(comparisons)
+
+        # Memory and stored size of the results Step 2 builds
+        sample_results = [
+            {
+                "user1": {"module": "module", "role": "role", "user_index": 1, "key": "key", "value": text1},
+                "user2": {"module": "module", "role": "role", "user_index": 2, "key": "key", "value": text2},
+                "similarity_score": score,
+                "long_text": len(text1) >= SHORT_TEXT_MAX_LENGTH or len(text2) >= SHORT_TEXT_MAX_LENGTH,
+            }
+            for text1, text2, score in (matches or scores[:1])
+        ]
+        # Step 2 holds results as compact rows; their texts are shared through the id tables
+        sample_batch = ResultBatch.from_documents(sample_results, ResultTables())
+        costs["result_memory_bytes"] = sample_batch.rows.itemsize
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        entry_cache = ValueScoreCache(len(comparisons))
+        for index in range(len(comparisons)):
+            entry_cache.get_or_compute(index, index + 1, lambda: (0.5, False))
+        costs["score_cache_entry_bytes"] = (tracemalloc.get_traced_memory()[0] - before) / len(comparisons)
+        tracemalloc.stop()
+        stored_results = sample_batch.to_compact_documents() if config.RESULT_FORMAT == COMPACT else sample_results
+        costs["result_bytes"] = sum(len(bson.encode(result)) for result in stored_results) / len(stored_results)
+        return costs
+
+    def _project(self, profile_counts, key_sets, comparisons, texts_by_module, distinct_text_count, costs):
+        """Combine the exact counts with the measured costs."""
+        total_comparisons = sum(comparisons.values())
+        # Every distinct value pair is scored once; other comparisons hit the score cache
+        scored_pairs = min(total_comparisons, distinct_text_count * (distinct_text_count - 1) // 2 + distinct_text_count)
+        texts_to_embed = distinct_text_count * (1 - costs["stored_fraction"])
+        results = total_comparisons * costs["match_rate"]
+        seconds = {
+            "embedding": texts_to_embed * costs["embed_seconds_per_text"],
+            "scoring": scored_pairs * costs["score_seconds_per_pair"],
+            "cache_lookups": (total_comparisons - scored_pairs) * costs["lookup_seconds_per_comparison"],
+        }
+        memory = {
+            "embeddings": distinct_text_count * costs["vector_memory_bytes"],
+            "score_cache": min(scored_pairs, config.VALUE_SCORE_CACHE_SIZE) * costs["score_cache_entry_bytes"],
+            # Step 2 holds every result until the run finishes
+            "results": results * costs["result_memory_bytes"],
+        }
+        modules = []
+        for module, module_comparisons in sorted(comparisons.items(), key=lambda item: -item[1]):
+            modules.append({
+                "module": module,
+                "profiles": sum(profile_counts.get(module, {}).values()),
+                "profiles_compared": sum(sum(counter.values()) for counter in key_sets[module].values()),
+                "comparisons": module_comparisons,
+                "share": module_comparisons / total_comparisons if total_comparisons else 0.0,
+                "distinct_texts": texts_by_module.get(module, 0),
+                "estimated_results": round(module_comparisons * costs["match_rate"]),
+            })
+        return {
+            "comparisons": total_comparisons,
+            "distinct_texts": distinct_text_count,
+            "texts_to_embed": round(texts_to_embed),
+            "scored_value_pairs_max": scored_pairs,
+            "estimated_results": round(results),
+            "estimated_result_bytes": round(results * costs["result_bytes"]),
+            "estimated_seconds": {name: round(value, 2) for name, value in seconds.items()},
+            "estimated_total_seconds": round(sum(seconds.values()), 2),
+            "estimated_peak_memory_bytes": {name: round(value) for name, value in memory.items()},
+            "estimated_total_peak_memory_bytes": round(sum(memory.values())),
+            "measured_costs": costs,
+            "modules": modules,
+        }
+
+    @staticmethod
+    def _report(plan):
+        """Print a readable summary of the plan."""
+        megabyte = 1024 * 1024
+        print(f"📊 Comparisons: {plan['comparisons']:,} | distinct texts: {plan['distinct_texts']:,} "
+              f"(to embed: {plan['texts_to_embed']:,})")
+        print(f"📊 Estimated results: {plan['estimated_results']:,} "
+              f"(~{plan['estimated_result_bytes'] / megabyte:.1f} MB in MongoDB)")
+        seconds = plan["estimated_seconds"]
+        print(f"⏱ Estimated time: {plan['estimated_total_seconds'] / 60:.1f} min single-threaded "
+              f"(embedding {seconds['embedding']:.0f}s, scoring {seconds['scoring']:.0f}s, "
+              f"cache lookups {seconds['cache_lookups']:.0f}s)")
+        print(f"💾 Estimated peak memory: {plan['estimated_total_peak_memory_bytes'] / megabyte:.1f} MB")
+        for module in plan["modules"]:
+            print(f"   {module['module']}: {module['comparisons']:,} comparisons ({module['share']:.1%}), "
+                  f"{module['profiles_compared']:,}/{module['profiles']:,} profiles, "
+                  f"~{module['estimated_results']:,} results")
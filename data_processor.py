@@ -27,7 +27,7 @@ For questions or permissions, please contact: info@gofreelab.com
 ===============================================================================  
 """
 
-from pymongo import MongoClient
+from mongo_manager import MongoConnectionManager
 
 class DataProcessor:
     def __init__(self, mongo_uri, db_name, collection_name):
@@ -44,7 +44,7 @@ class DataProcessor:
             if not self.mongo_uri.startswith(('mongodb://', 'mongodb+srv://')):
                 raise ValueError("Invalid URI scheme: URI must begin with 'mongodb://' or 'mongodb+srv://'")
 
-            self.client = MongoClient(self.mongo_uri)
+            self.client = MongoConnectionManager.get_client(self.mongo_uri)
             self.database = self.client[self.db_name]
             self.collection = self.database[self.collection_name]
         except Exception as e:
@@ -63,5 +63,7 @@ class DataProcessor:
             return []
 
     def close_connection(self):
-        if self.client:
-            self.client.close()
+        # The client is shared across the process; MongoConnectionManager.close_all() closes it
+        self.client = None
+        self.database = None
+        self.collection = None
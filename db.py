@@ -11,6 +11,7 @@ Version         : <Version>
 Description     : This script manages MongoDB operations, including establishing  
                   database connections, retrieving stored vectors, and storing  
                   vectorized representations of text with upsert functionality.  
+                  It also counts profiles per module and role server-side.  
                   It includes logging and error handling to ensure database  
                   reliability.  
 
@@ -30,19 +31,18 @@ For questions or permissions, please contact: info@gofreelab.com
 """
 
 import logging
-from pymongo import MongoClient
 from pymongo.errors import PyMongoError
-import numpy as np
+from mongo_manager import MongoConnectionManager
+from vector_codec import decode_vector, encode_vector_fields
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def connect_to_mongo(mongo_uri, database_name):
-    """Establish a connection to the MongoDB database."""
+    """Return the database on the shared, pooled MongoDB client."""
     try:
-        client = MongoClient(mongo_uri)
-        database = client[database_name]
+        database = MongoConnectionManager.get_database(database_name, mongo_uri)
         logger.info(f"Connected to MongoDB database: {database_name}")
         return database
     except PyMongoError as e:
@@ -56,7 +56,7 @@ def retrieve_vector_from_db(text, database, vector_collection, timeout_ms=5000):
         result = vector_collection.find_one({"text": text}, max_time_ms=timeout_ms)
         if result and "vector" in result:
             logger.info(f"Retrieved vector for text: {text}")
-            return np.array(result["vector"])
+            return decode_vector(result["vector"])
         logger.info(f"No vector found for text: {text}")
         return None
     except PyMongoError as e:
@@ -82,19 +82,40 @@ def store_vector_in_db(doc, database, vector_collection):
             filter_query = {"text": doc.get("text")}
         else:
             raise ValueError("Document format not recognized. Expected keys: 'text' or both 'text1' and 'text2'.")
-        # Ensure that if the vector is a numpy array, we convert it to a list
-        if "vector" in doc and hasattr(doc["vector"], "tolist"):
-            doc["vector"] = doc["vector"].tolist()
-        if "vector1" in doc and hasattr(doc["vector1"], "tolist"):
-            doc["vector1"] = doc["vector1"].tolist()
-        if "vector2" in doc and hasattr(doc["vector2"], "tolist"):
-            doc["vector2"] = doc["vector2"].tolist()
+        # Store vectors as float32 bytes (VECTOR_ENCODING=binary) instead of arrays of doubles
         vector_collection.update_one(
             filter_query,
-            {"$set": doc},
+            {"$set": encode_vector_fields(doc)},
             upsert=True
         )
-        logger.info(f"Stored vector document: {doc}")
+        logger.info(f"Stored vector document: {filter_query}")
     except PyMongoError as e:
         logger.error(f"Error storing vector document: {e}")
         raise Exception(f"Error storing vector document: {e}")
+
+def count_profiles_by_module_role(database, collection_name):
+    """
+    Count profiles per (module, role) with a server-side aggregation, without fetching the profiles.
+
+    Returns:
+        dict: module -> role -> number of profiles.
+    """
+    pipeline = [
+        {"$project": {"modules": {"$objectToArray": "$$ROOT"}}},
+        {"$unwind": "$modules"},
+        {"$match": {"modules.k": {"$ne": "_id"}, "modules.v": {"$type": "object"}}},
+        {"$project": {"module": "$modules.k", "roles": {"$objectToArray": "$modules.v"}}},
+        {"$unwind": "$roles"},
+        {"$group": {
+            "_id": {"module": "$module", "role": "$roles.k"},
+            "count": {"$sum": {"$cond": [{"$isArray": "$roles.v"}, {"$size": "$roles.v"}, 0]}},
+        }},
+    ]
+    try:
+        counts = {}
+        for row in database[collection_name].aggregate(pipeline, allowDiskUse=True):
+            counts.setdefault(row["_id"]["module"], {})[row["_id"]["role"]] = row["count"]
+        return counts
+    except PyMongoError as e:
+        logger.error(f"Error counting profiles in '{collection_name}': {e}")
+        raise Exception(f"Error counting profiles in '{collection_name}': {e}")
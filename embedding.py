@@ -10,8 +10,11 @@ Created Date    : <Date>
 Version         : <Version>  
 Description     : This script handles text vectorization using SpaCy and  
                   Sentence-BERT. It supports lazy loading of models, caching  
-                  embeddings for efficiency, and includes error handling for  
-                  embedding generation failures.  
+                  embeddings for efficiency, a configurable encoder policy  
+                  (hybrid or any single registered encoder), batch encoding  
+                  through the pluggable encoders, reads vectors precomputed at  
+                  ingestion time when an embedding store is attached, and  
+                  includes error handling for embedding generation failures.  
 
 -------------------------------------------------------------------------------  
 Copyright (c) 2025 GoFreeLab. All rights reserved.  
@@ -29,75 +32,242 @@ For questions or permissions, please contact: info@gofreelab.com
 """
 
 import logging
+import threading
 import numpy as np
-import spacy
-from sentence_transformers import SentenceTransformer
+import config
+from encoders import get_encoder, available_encoders
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Built-in encoder names and the policy that combines them
+SPACY = "spacy"
+SBERT = "sbert"
+HASHING = "hashing"
+HYBRID = "hybrid"
+
+# Texts shorter than this go to SpaCy under the hybrid policy
+SHORT_TEXT_MAX_LENGTH = 150
+
 class EmbeddingHandler:
-    _nlp = None
-    _sentence_bert = None
     _embeddings_cache = {}
+    _cache_max_bytes = None  # Set under a memory budget; oldest vectors are evicted first
+    _cache_bytes = 0
+    _cache_lock = threading.Lock()
+    _encoder_policy = config.ENCODER_POLICY.lower()
+    _embedding_store = None  # Precomputed vectors written at ingestion time
+
+    @staticmethod
+    def attach_store(embedding_store):
+        """Read precomputed vectors from the given EmbeddingStore before running any model (None detaches)."""
+        EmbeddingHandler._embedding_store = embedding_store
+
+    @staticmethod
+    def set_encoder_policy(policy):
+        """
+        Select how texts are encoded: 'hybrid' (SpaCy for short texts, Sentence-BERT otherwise)
+        or the name of any registered encoder, which is then used for every text.
+        """
+        policy = (policy or HYBRID).lower()
+        policies = [HYBRID] + available_encoders()
+        if policy not in policies:
+            raise ValueError(f"❌ Unknown encoder policy '{policy}'. Expected one of: {', '.join(policies)}")
+        EmbeddingHandler._encoder_policy = policy
+
+    @staticmethod
+    def get_encoder_policy():
+        """Return the active encoder policy."""
+        return EmbeddingHandler._encoder_policy
+
+    @staticmethod
+    def select_encoder(text1, text2):
+        """
+        Pick the encoder used to score a pair of texts under the active policy.
+        Both texts of a pair always go through the same encoder so their vectors are comparable.
+        """
+        policy = EmbeddingHandler._encoder_policy
+        if policy != HYBRID:
+            return policy
+        if len(text1) < SHORT_TEXT_MAX_LENGTH and len(text2) < SHORT_TEXT_MAX_LENGTH:
+            return SPACY
+        return SBERT
+
+    @staticmethod
+    def group_by_encoder(texts, mixed_pairs=None):
+        """
+        Group texts by every encoder the policy may score them with. Under the hybrid policy a short text
+        paired with a long one goes through Sentence-BERT, so short texts are grouped under both encoders
+        when they can take part in mixed pairs: by default, when the texts include a long one.
+
+        Returns:
+            dict: encoder -> list of texts.
+        """
+        policy = EmbeddingHandler._encoder_policy
+        texts = list(dict.fromkeys(texts))
+        if policy != HYBRID:
+            return {policy: texts} if texts else {}
+        short = [text for text in texts if len(text) < SHORT_TEXT_MAX_LENGTH]
+        long = [text for text in texts if len(text) >= SHORT_TEXT_MAX_LENGTH]
+        if mixed_pairs is None:
+            mixed_pairs = bool(long)
+        groups = {SPACY: short, SBERT: long + short if mixed_pairs else long}
+        return {encoder: group for encoder, group in groups.items() if group}
 
     @staticmethod
     def load_spacy_model():
         """Lazy load SpaCy model."""
-        if EmbeddingHandler._nlp is None:
-            try:
-                EmbeddingHandler._nlp = spacy.load("en_core_web_md")
-                logger.info("SpaCy model loaded successfully.")
-            except Exception as e:
-                logger.error(f"Error loading SpaCy model: {e}")
+        try:
+            return get_encoder(SPACY).load()
+        except Exception as e:
+            logger.error(f"Error loading SpaCy model: {e}")
+            return None
 
     @staticmethod
     def load_sentence_bert_model():
         """Lazy load Sentence-BERT model."""
-        if EmbeddingHandler._sentence_bert is None:
+        try:
+            return get_encoder(SBERT).load()
+        except Exception as e:
+            logger.error(f"Error loading Sentence-BERT model: {e}")
+            return None
+
+    @staticmethod
+    def get_embeddings(texts, encoder):
+        """
+        Retrieve embeddings for a batch of texts with one encoder call for all uncached texts.
+        Returns one vector (or None for invalid texts and failures) per input text.
+        """
+        cache = EmbeddingHandler._embeddings_cache
+        missing = [
+            text for text in dict.fromkeys(texts)
+            if isinstance(text, str) and text.strip() and (encoder, text) not in cache
+        ]
+        # Vectors of this batch are returned even if a bounded cache already evicted them
+        found = {}
+        if missing and EmbeddingHandler._embedding_store is not None:
+            found = EmbeddingHandler.get_stored_embeddings(missing, encoder)
+            missing = [text for text in missing if text not in found]
+        if missing:
             try:
-                EmbeddingHandler._sentence_bert = SentenceTransformer("all-MiniLM-L6-v2")
-                logger.info("Sentence-BERT model loaded successfully.")
+                vectors = get_encoder(encoder).encode(missing)
+                for text, vector in zip(missing, vectors):
+                    if np.isnan(vector).any():
+                        logger.error(f"NaN detected in {encoder} embedding for text: {text}")
+                        continue
+                    found[text] = vector
+                    EmbeddingHandler._remember((encoder, text), vector)
             except Exception as e:
-                logger.error(f"Error loading Sentence-BERT model: {e}")
+                logger.error(f"Error generating {encoder} embeddings for {len(missing)} texts: {e}")
+        return [
+            (found[text] if text in found else cache.get((encoder, text))) if isinstance(text, str) else None
+            for text in texts
+        ]
 
     @staticmethod
-    def get_word_embedding(text):
-        """Retrieve word embeddings using SpaCy."""
-        EmbeddingHandler.load_spacy_model()
+    def set_cache_limit(max_bytes):
+        """Bound the embedding cache to roughly max_bytes (None removes the bound)."""
+        EmbeddingHandler._cache_max_bytes = max_bytes
+        EmbeddingHandler._evict()
+        if max_bytes:
+            logger.info(f"Embedding cache limited to {max_bytes // (1024 * 1024)} MB.")
+
+    @staticmethod
+    def _entry_bytes(key, vector):
+        # Vector data plus the key text and the object overheads of the entry
+        return getattr(vector, "nbytes", 0) + len(key[1]) + 200
+
+    @staticmethod
+    def _remember(key, vector):
+        """Add a vector to the cache, evicting the oldest entries beyond the limit."""
+        with EmbeddingHandler._cache_lock:
+            if key not in EmbeddingHandler._embeddings_cache:
+                EmbeddingHandler._cache_bytes += EmbeddingHandler._entry_bytes(key, vector)
+            EmbeddingHandler._embeddings_cache[key] = vector
+        EmbeddingHandler._evict()
+
+    @staticmethod
+    def _forget(key):
+        """Remove one vector from the cache."""
+        with EmbeddingHandler._cache_lock:
+            vector = EmbeddingHandler._embeddings_cache.pop(key, None)
+            if vector is not None:
+                EmbeddingHandler._cache_bytes -= EmbeddingHandler._entry_bytes(key, vector)
+
+    @staticmethod
+    def _evict():
+        max_bytes = EmbeddingHandler._cache_max_bytes
+        if not max_bytes:
+            return
+        with EmbeddingHandler._cache_lock:
+            cache = EmbeddingHandler._embeddings_cache
+            while cache and EmbeddingHandler._cache_bytes > max_bytes:
+                key = next(iter(cache))
+                EmbeddingHandler._cache_bytes -= EmbeddingHandler._entry_bytes(key, cache.pop(key))
+
+    @staticmethod
+    def get_stored_embeddings(texts, encoder):
+        """
+        Read precomputed vectors from the attached embedding store without running any model.
+
+        Returns:
+            dict: text -> vector, for the texts that have a stored vector.
+        """
+        store = EmbeddingHandler._embedding_store
+        store_key = get_encoder(encoder).store_key() if store is not None else None
+        if store_key is None:
+            return {}
+        stored = store.fetch(store_key, texts)
+        for text, vector in stored.items():
+            EmbeddingHandler._remember((encoder, text), vector)
+        if stored:
+            logger.debug(f"Loaded {len(stored)} precomputed {encoder} embeddings.")
+        return stored
+
+    @staticmethod
+    def get_embedding(text, encoder=None):
+        """Retrieve an embedding with the given encoder, defaulting to the one the policy uses for this text alone."""
         if not isinstance(text, str) or not text.strip():
-            logger.warning("Invalid or empty text for word embedding.")
-            return None
-        if text in EmbeddingHandler._embeddings_cache:
-            return EmbeddingHandler._embeddings_cache[text]
-        try:
-            vector = EmbeddingHandler._nlp(text).vector
-            if np.isnan(vector).any():
-                logger.error(f"NaN detected in word embedding for text: {text}")
-                return None
-            EmbeddingHandler._embeddings_cache[text] = vector
-            return vector
-        except Exception as e:
-            logger.error(f"Error generating word embedding for text '{text}': {e}")
+            logger.warning("Invalid or empty text for embedding.")
             return None
+        encoder = encoder or EmbeddingHandler.select_encoder(text, text)
+        return EmbeddingHandler.get_embeddings([text], encoder)[0]
+
+    @staticmethod
+    def get_word_embedding(text):
+        """Retrieve word embeddings using SpaCy."""
+        return EmbeddingHandler.get_embedding(text, SPACY)
 
     @staticmethod
     def get_sentence_bert_embedding(text):
         """Retrieve sentence embeddings using Sentence-BERT."""
-        EmbeddingHandler.load_sentence_bert_model()
-        if not isinstance(text, str) or not text.strip():
-            logger.warning("Invalid or empty text for sentence embedding.")
-            return None
-        if text in EmbeddingHandler._embeddings_cache:
-            return EmbeddingHandler._embeddings_cache[text]
-        try:
-            vector = EmbeddingHandler._sentence_bert.encode(text, convert_to_numpy=True)
-            if np.isnan(vector).any():
-                logger.error(f"NaN detected in sentence embedding for text: {text}")
-                return None
-            EmbeddingHandler._embeddings_cache[text] = vector
-            return vector
-        except Exception as e:
-            logger.error(f"Error generating sentence embedding for text '{text}': {e}")
-            return None
+        return EmbeddingHandler.get_embedding(text, SBERT)
+
+    @staticmethod
+    def warm_cache(texts):
+        """
+        Batch-encode texts with every encoder the policy may score them with, including the Sentence-BERT
+        vectors of short texts that meet long ones in mixed pairs, so Step 2 does not encode them one miss at a time.
+        """
+        for encoder, encoder_texts in EmbeddingHandler.group_by_encoder(texts).items():
+            for start in range(0, len(encoder_texts), config.EMBEDDING_BATCH_SIZE):
+                EmbeddingHandler.get_embeddings(encoder_texts[start:start + config.EMBEDDING_BATCH_SIZE], encoder)
+
+    @staticmethod
+    def prepare_corpus(texts, score_cache=None):
+        """
+        Fit corpus-dependent encoders (e.g. hashing with TF-IDF) on the texts, then warm the cache.
+        score_cache holds scores computed from these vectors and is cleared when an encoder is refit.
+        """
+        policy = EmbeddingHandler._encoder_policy
+        for encoder in ((SPACY, SBERT) if policy == HYBRID else (policy,)):
+            try:
+                if get_encoder(encoder).fit(texts):
+                    # Vectors encoded before fitting are no longer comparable
+                    for key in [key for key in list(EmbeddingHandler._embeddings_cache) if key[0] == encoder]:
+                        EmbeddingHandler._forget(key)
+                    if score_cache is not None:
+                        score_cache.clear()
+            except Exception as e:
+                logger.error(f"Error fitting {encoder} encoder: {e}")
+        EmbeddingHandler.warm_cache(texts)
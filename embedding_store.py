@@ -0,0 +1,108 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : embedding_store.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script manages the persisted per-value embedding store.
+                  Vectors are keyed by the encoder that produced them and the
+                  canonical text of the profile value, so they can be computed
+                  once when profiles are ingested and read back in bulk by the
+                  matching steps instead of running the models again.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import hashlib
+import logging
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from vector_codec import decode_vector, encode_vector
+import config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class EmbeddingStore:
+    """Embeddings persisted in MongoDB, one document per (encoder, canonical text)."""
+
+    def __init__(self, database, collection_name=None):
+        self.collection = database[collection_name or config.EMBEDDING_COLLECTION]
+
+    @staticmethod
+    def document_id(store_key, text):
+        """Deterministic id of the vector of a text, so unchanged values map to the same document."""
+        return hashlib.sha1(f"{store_key}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _find(self, store_key, texts, projection):
+        """Yield the stored documents of the given texts, querying in batches of ids."""
+        ids = [EmbeddingStore.document_id(store_key, text) for text in dict.fromkeys(texts)]
+        for start in range(0, len(ids), config.EMBEDDING_BATCH_SIZE):
+            yield from self.collection.find({"_id": {"$in": ids[start:start + config.EMBEDDING_BATCH_SIZE]}}, projection)
+
+    def fetch(self, store_key, texts):
+        """
+        Read the stored vectors of the given texts.
+
+        Returns:
+            dict: text -> float32 vector, for the texts that have a stored vector.
+        """
+        try:
+            return {
+                document["text"]: decode_vector(document["vector"])
+                for document in self._find(store_key, texts, {"text": 1, "vector": 1})
+            }
+        except PyMongoError as e:
+            logger.error(f"Error reading stored embeddings for '{store_key}': {e}")
+            return {}
+
+    def existing(self, store_key, texts):
+        """Return the subset of texts that already have a stored vector."""
+        return {document["text"] for document in self._find(store_key, texts, {"text": 1})}
+
+    def store(self, store_key, vectors):
+        """
+        Upsert vectors in one unordered bulk write.
+
+        Args:
+            store_key (str): The encoder's store key.
+            vectors (dict): text -> vector.
+
+        Returns:
+            int: The number of vectors written.
+        """
+        now = datetime.now(timezone.utc)
+        operations = [
+            UpdateOne(
+                {"_id": EmbeddingStore.document_id(store_key, text)},
+                {"$set": {"encoder": store_key, "text": text, "vector": encode_vector(vector), "updated_at": now}},
+                upsert=True,
+            )
+            for text, vector in vectors.items() if vector is not None
+        ]
+        if not operations:
+            return 0
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+        except PyMongoError as e:
+            logger.error(f"Error storing embeddings for '{store_key}': {e}")
+            raise Exception(f"Error storing embeddings for '{store_key}': {e}")
+        return len(operations)
@@ -0,0 +1,236 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : encoders.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script defines the pluggable text encoder interface used
+                  by the embedding handler. Encoders register themselves under
+                  a name and turn a batch of texts into a float32 matrix. It
+                  ships SpaCy and Sentence-BERT encoders plus a lightweight
+                  hashing encoder (character n-grams with optional TF-IDF
+                  weighting) that needs no downloaded model weights.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import logging
+import threading
+from importlib import metadata
+from abc import ABC, abstractmethod
+import numpy as np
+import config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ENCODER_REGISTRY = {}
+_encoder_instances = {}
+_instances_lock = threading.Lock()
+
+def register_encoder(name):
+    """Class decorator that registers an encoder under the given name."""
+    def decorator(cls):
+        cls.name = name
+        ENCODER_REGISTRY[name] = cls
+        return cls
+    return decorator
+
+def get_encoder(name):
+    """
+    Return the shared instance of a registered encoder.
+
+    Raises:
+        ValueError: If no encoder is registered under the name.
+    """
+    if name not in ENCODER_REGISTRY:
+        raise ValueError(f"❌ Unknown encoder '{name}'. Registered encoders: {', '.join(sorted(ENCODER_REGISTRY))}")
+    with _instances_lock:
+        if name not in _encoder_instances:
+            _encoder_instances[name] = ENCODER_REGISTRY[name]()
+        return _encoder_instances[name]
+
+def available_encoders():
+    """Return the names of all registered encoders."""
+    return sorted(ENCODER_REGISTRY)
+
+class BaseEncoder(ABC):
+    """Interface every encoder implements: batch encoding of texts into a 2-D float32 array."""
+
+    name = None
+    package = None  # Distribution whose version identifies the model
+
+    @abstractmethod
+    def encode(self, texts):
+        """Encode a list of texts into an array of shape (len(texts), dimension)."""
+
+    def fit(self, texts):
+        """Learn corpus statistics, if the encoder uses any. Returns True when the encoder changed."""
+        return False
+
+    def store_key(self):
+        """
+        Identify the vectors this encoder produces in the persisted embedding store.
+        Returns None when its vectors depend on state that is not persisted, so they must not be stored.
+        """
+        return self.name
+
+    def model_version(self):
+        """Identify the model and package version, so cached outputs are invalidated when either changes."""
+        try:
+            version = metadata.version(self.package) if self.package else "unknown"
+        except metadata.PackageNotFoundError:
+            version = "unknown"
+        return f"{self.store_key() or self.name}@{version}"
+
+# Pipeline components of en_core_web_md. Doc vectors only need the tokenizer and the vectors table.
+SPACY_COMPONENTS = ("tok2vec", "tagger", "parser", "senter", "attribute_ruler", "lemmatizer", "ner")
+
+@register_encoder("spacy")
+class SpacyEncoder(BaseEncoder):
+    """Averaged word vectors from the SpaCy en_core_web_md model."""
+
+    package = "en_core_web_md"
+
+    def __init__(self, vectors_only=None):
+        self.model = None
+        self.vectors_only = config.SPACY_VECTORS_ONLY if vectors_only is None else vectors_only
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Lazy load the SpaCy model; with SPACY_VECTORS_ONLY, only its tokenizer and vectors table."""
+        with self._lock:
+            if self.model is None:
+                import spacy
+                exclude = SPACY_COMPONENTS if self.vectors_only else ()
+                self.model = spacy.load("en_core_web_md", exclude=list(exclude))
+                logger.info(f"SpaCy model loaded successfully{' (tokenizer and vectors only)' if self.vectors_only else ''}.")
+        return self.model
+
+    def store_key(self):
+        # Both paths produce the same vectors, so they share stored vectors
+        return "spacy:en_core_web_md"
+
+    @staticmethod
+    def average_token_vectors(nlp, texts):
+        """
+        Compute Doc.vector for a batch of texts with NumPy: the mean of the rows of the vectors
+        table for the tokens of each text. Tokens without a vector count as zeros and empty texts
+        get a zero vector, as in SpaCy. Rows are summed in token order in float32, like Doc.vector,
+        so the result is identical.
+        """
+        vectors = nlp.vocab.vectors
+        docs = list(nlp.tokenizer.pipe(texts, batch_size=config.EMBEDDING_BATCH_SIZE))
+        if vectors.mode != "default" or not vectors.size:
+            # Floret vectors and vector-less models need SpaCy's own lookup
+            return np.array([doc.vector for doc in docs], dtype=np.float32)
+        lengths = np.array([len(doc) for doc in docs], dtype=np.int64)
+        sums = np.zeros((len(docs), vectors.shape[1]), dtype=np.float32)
+        nonempty = lengths > 0
+        if not nonempty.any():
+            return sums
+        keys = np.concatenate([doc.to_array(vectors.attr) for doc in docs if len(doc)])
+        rows = np.asarray(vectors.find(keys=keys))
+        token_vectors = vectors.data[np.maximum(rows, 0)]
+        token_vectors[rows < 0] = 0
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        # One token position at a time across the batch: NumPy's own reductions may reorder the additions
+        for position in range(int(lengths.max())):
+            active = lengths > position
+            sums[active] += token_vectors[offsets[active] + position]
+        sums[nonempty] /= lengths[nonempty, None].astype(np.float32)
+        return sums
+
+    def encode(self, texts):
+        nlp = self.load()
+        if self.vectors_only:
+            return SpacyEncoder.average_token_vectors(nlp, list(texts))
+        return np.array([doc.vector for doc in nlp.pipe(texts)], dtype=np.float32)
+
+@register_encoder("sbert")
+class SentenceBertEncoder(BaseEncoder):
+    """Sentence embeddings from the all-MiniLM-L6-v2 Sentence-BERT model."""
+
+    package = "sentence-transformers"
+
+    def __init__(self):
+        self.model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Lazy load the Sentence-BERT model."""
+        with self._lock:
+            if self.model is None:
+                from sentence_transformers import SentenceTransformer
+                self.model = SentenceTransformer("all-MiniLM-L6-v2")
+                logger.info("Sentence-BERT model loaded successfully.")
+        return self.model
+
+    def store_key(self):
+        return "sbert:all-MiniLM-L6-v2"
+
+    def encode(self, texts):
+        model = self.load()
+        return np.asarray(model.encode(list(texts), convert_to_numpy=True, batch_size=config.EMBEDDING_BATCH_SIZE), dtype=np.float32)
+
+@register_encoder("hashing")
+class HashingEncoder(BaseEncoder):
+    """
+    Character n-gram hashing encoder. It needs no model download, so it suits a fast first
+    pass and offline runs. With HASHING_TFIDF enabled, fit() learns IDF weights over the corpus.
+    """
+
+    package = "scikit-learn"
+
+    def __init__(self, n_features=None, ngram_range=(2, 4), use_tfidf=None):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        self.n_features = n_features or config.HASHING_DIM
+        self.use_tfidf = config.HASHING_TFIDF if use_tfidf is None else use_tfidf
+        self.vectorizer = HashingVectorizer(
+            analyzer="char_wb", ngram_range=ngram_range, n_features=self.n_features,
+            alternate_sign=False, norm=None, lowercase=True,
+        )
+        self.idf = None
+
+    def fit(self, texts):
+        if not self.use_tfidf or not texts:
+            return False
+        counts = self.vectorizer.transform(texts).tocsr()
+        # Each row lists a feature at most once, so counting column indices gives the document frequency
+        document_frequency = np.bincount(counts.indices, minlength=self.n_features)
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+        logger.info(f"Fitted hashing encoder IDF weights on {len(texts)} texts.")
+        return True
+
+    def store_key(self):
+        # IDF weights are fitted per run, so only plain hashed vectors are stable enough to persist
+        return None if self.idf is not None else f"hashing:{self.n_features}"
+
+    def model_version(self):
+        weighting = "tfidf" if self.use_tfidf else "tf"
+        return f"hashing:{self.n_features}:{weighting}@{metadata.version(self.package)}"
+
+    def encode(self, texts):
+        matrix = self.vectorizer.transform(texts)
+        if self.idf is not None:
+            matrix = matrix.multiply(self.idf).tocsr()
+        dense = matrix.toarray().astype(np.float32)
+        norms = np.linalg.norm(dense, axis=1, keepdims=True)
+        return dense / np.where(norms == 0, 1, norms)
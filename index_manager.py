@@ -0,0 +1,172 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : index_manager.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script bootstraps the MongoDB indexes the pipeline
+                  relies on. It declares the required indexes per collection,
+                  creates them idempotently at pipeline start and checks the
+                  query plans of the hot-path lookups with explain(), warning
+                  when one of them would scan the whole collection.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import logging
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+from compact_results import COMPACT, result_query, score_field, table_collection_name
+from user_pairs import user_pair_collection_name
+from config import get_env_variable
+import config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class IndexManager:
+    """Declares, creates and verifies the indexes of the pipeline's collections."""
+
+    def __init__(self, database, collection_name_out=None, vector_collection=None):
+        self.database = database
+        self.collection_name_out = collection_name_out or config.COLLECTION_NAME_OUT
+        # Same lookup as the matching steps, which read VECTOR_COLLECTION with this default
+        self.vector_collection = vector_collection or get_env_variable("VECTOR_COLLECTION", "vector_1")
+
+    @staticmethod
+    def recommendation_indexes():
+        """Indexes of the recommendations collection: reads are point lookups of one user."""
+        return [
+            ([("module", ASCENDING), ("role", ASCENDING), ("user_index", ASCENDING)], {"name": "user", "unique": True}),
+        ]
+
+    @staticmethod
+    def result_indexes(collection_name_out):
+        """Indexes of an output collection and of its id-table and user-pair companions."""
+        if config.RESULT_FORMAT == COMPACT:
+            result_indexes = [([("m", ASCENDING), ("s", DESCENDING)], {"name": "module_score"})]
+        else:
+            result_indexes = [([("user1.module", ASCENDING), ("similarity_score", DESCENDING)], {"name": "module_score"})]
+        indexes = {
+            collection_name_out: result_indexes,
+            table_collection_name(collection_name_out): [
+                ([("t", ASCENDING), ("table", ASCENDING), ("id", ASCENDING)], {"name": "table_entry", "unique": True}),
+            ],
+        }
+        if config.USER_PAIR_AGGREGATION:
+            indexes[user_pair_collection_name(collection_name_out)] = [
+                ([("m", ASCENDING), ("s", DESCENDING)], {"name": "module_score"}),
+            ]
+        return indexes
+
+    def required_indexes(self):
+        """
+        Return the indexes each collection needs.
+
+        Returns:
+            dict: collection name -> list of (keys, options) as accepted by create_index.
+        """
+        indexes = {
+            # Simple vector documents are looked up by text, combined long-text documents by both texts
+            self.vector_collection: [
+                ([("text", ASCENDING)], {"name": "text", "sparse": True}),
+                ([("text1", ASCENDING), ("text2", ASCENDING)], {"name": "text_pair", "sparse": True}),
+            ],
+        }
+        indexes.update(IndexManager.result_indexes(self.collection_name_out))
+        if config.MATERIALIZE_RECOMMENDATIONS:
+            indexes[config.RECOMMENDATIONS_COLLECTION] = IndexManager.recommendation_indexes()
+        return indexes
+
+    def hot_path_queries(self):
+        """Return the (collection, description, filter, sort) of the queries that run per value or per module."""
+        queries = [
+            (self.vector_collection, "vector lookup by text", {"text": ""}, None),
+            (self.vector_collection, "combined vector upsert", {"text1": "", "text2": ""}, None),
+            (self.collection_name_out, "ranking read per module",
+             result_query(module=""), [(score_field(), DESCENDING)]),
+        ]
+        if config.USER_PAIR_AGGREGATION:
+            queries.append((user_pair_collection_name(self.collection_name_out), "user-pair ranking read per module",
+                            {"m": ""}, [("s", DESCENDING)]))
+        if config.MATERIALIZE_RECOMMENDATIONS:
+            queries.append((config.RECOMMENDATIONS_COLLECTION, "recommendation lookup per user",
+                            {"module": "", "role": "", "user_index": 0}, None))
+        return queries
+
+    def ensure_indexes(self):
+        """Create every required index. Existing identical indexes are left alone."""
+        created = 0
+        for collection_name, indexes in self.required_indexes().items():
+            collection = self.database[collection_name]
+            for keys, options in indexes:
+                try:
+                    collection.create_index(keys, **options)
+                    created += 1
+                except OperationFailure as e:
+                    # An index with the same name or keys but different options already exists
+                    logger.warning(f"⚠️ Could not create index '{options['name']}' on '{collection_name}': {e}")
+                except PyMongoError as e:
+                    logger.error(f"Error creating index '{options['name']}' on '{collection_name}': {e}")
+        logger.info(f"✅ Ensured {created} indexes.")
+        return created
+
+    @staticmethod
+    def _plan_stages(plan):
+        """Yield the stage names of a query plan tree."""
+        if not isinstance(plan, dict):
+            return
+        if "stage" in plan:
+            yield plan["stage"]
+        for key in ("inputStage", "queryPlan"):
+            yield from IndexManager._plan_stages(plan.get(key))
+        for child in plan.get("inputStages", []):
+            yield from IndexManager._plan_stages(child)
+
+    def check_query_plans(self):
+        """
+        Explain the hot-path queries and warn about collection scans.
+
+        Returns:
+            dict: description -> list of the winning plan's stages (empty when the plan could not be read).
+        """
+        plans = {}
+        for collection_name, description, query, sort in self.hot_path_queries():
+            try:
+                cursor = self.database[collection_name].find(query)
+                if sort:
+                    cursor = cursor.sort(sort)
+                explanation = cursor.explain()
+            except Exception as e:
+                logger.warning(f"⚠️ Could not explain the {description} query on '{collection_name}': {e}")
+                plans[description] = []
+                continue
+            stages = list(IndexManager._plan_stages(explanation.get("queryPlanner", {}).get("winningPlan", {})))
+            plans[description] = stages
+            if "COLLSCAN" in stages:
+                logger.warning(f"⚠️ The {description} query on '{collection_name}' scans the whole collection: {' <- '.join(stages)}")
+            else:
+                logger.info(f"Query plan for the {description} query on '{collection_name}': {' <- '.join(stages)}")
+        return plans
+
+    def bootstrap(self):
+        """Create the indexes, then verify the hot-path query plans."""
+        self.ensure_indexes()
+        return self.check_query_plans()
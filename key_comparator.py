@@ -11,7 +11,9 @@ Version         : <Version>
 Description     : This script analyzes and identifies comparable keys between  
                   users based on similarity scores. It processes similarity  
                   data, filters keys by modules and roles, and extracts the  
-                  top comparable keys per module.  
+                  top comparable keys per module. It also learns a key-to-key  
+                  alignment map recording which key of one role is worth  
+                  comparing with which key of another role.  
 
 -------------------------------------------------------------------------------  
 Copyright (c) 2025 GoFreeLab. All rights reserved.  
@@ -86,3 +88,81 @@ def get_top_comparable_keys_by_module(comparable_keys_by_module, top_n=5):
             top_comparable_keys_by_module[module][role] = [key for key, count in sorted_comparable_keys[:top_n]]
 
     return top_comparable_keys_by_module
+
+def find_key_alignment_by_module(similarity_data, similarity_threshold=0.6):
+    """
+    Identify which key of one role matches which key of another role within a module.
+
+    The map is symmetric: a match between (role1, key1) and (role2, key2) is counted
+    in both directions so Step 2 can look it up from either user's side.
+    """
+    key_alignment_by_module = defaultdict(
+        lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(int))))
+    )  # module -> role1 -> key1 -> role2 -> key2 -> frequency
+
+    for result in similarity_data:
+        user1 = result.get('user1')
+        user2 = result.get('user2')
+        similarity_score = result.get('similarity_score', 0)
+
+        if not user1 or not user2 or similarity_score < similarity_threshold:
+            continue
+
+        module = user1.get('module')
+        role1, key1 = user1.get('role'), user1.get('key')
+        role2, key2 = user2.get('role'), user2.get('key')
+
+        # Step 2 only compares users of the same module, so cross-module matches are not useful here
+        if not module or module != user2.get('module') or not all((role1, key1, role2, key2)):
+            continue
+
+        key_alignment_by_module[module][role1][key1][role2][key2] += 1
+        if (role1, key1) != (role2, key2):
+            key_alignment_by_module[module][role2][key2][role1][key1] += 1
+
+    return {
+        module: {
+            role1: {
+                key1: {role2: dict(keys2) for role2, keys2 in roles2.items()}
+                for key1, roles2 in keys1.items()
+            }
+            for role1, keys1 in roles1.items()
+        }
+        for module, roles1 in key_alignment_by_module.items()
+    }
+
+def get_top_key_alignments_by_module(key_alignment_by_module, top_comparable_keys_by_module=None, top_n=5):
+    """
+    Keep the top N aligned keys of each other role for every (module, role, key).
+
+    When top comparable keys are given, only keys that survive that selection on both
+    sides are kept, since Step 2 filters user data down to those keys anyway.
+    """
+    top_key_alignments_by_module = {}
+
+    for module, roles1 in key_alignment_by_module.items():
+        allowed = (top_comparable_keys_by_module or {}).get(module)
+        top_key_alignments_by_module[module] = {}
+        for role1, keys1 in roles1.items():
+            for key1, roles2 in keys1.items():
+                if allowed is not None and key1 not in allowed.get(role1, []):
+                    continue
+                for role2, keys2 in roles2.items():
+                    candidates = [
+                        (key2, count) for key2, count in keys2.items()
+                        if allowed is None or key2 in allowed.get(role2, [])
+                    ]
+                    if not candidates:
+                        continue
+                    sorted_candidates = sorted(candidates, key=lambda x: x[1], reverse=True)[:top_n]
+                    top_key_alignments_by_module[module].setdefault(role1, {}).setdefault(key1, {})[role2] = dict(sorted_candidates)
+
+        # Truncation is done per side, so restore the reverse entries to keep the map symmetric
+        module_alignment = top_key_alignments_by_module[module]
+        for role1, keys1 in list(module_alignment.items()):
+            for key1, roles2 in list(keys1.items()):
+                for role2, keys2 in list(roles2.items()):
+                    for key2, count in list(keys2.items()):
+                        module_alignment.setdefault(role2, {}).setdefault(key2, {}).setdefault(role1, {}).setdefault(key1, count)
+
+    return top_key_alignments_by_module
@@ -1,9 +1,35 @@
-
-
-
-
+import argparse
+import sys
 from SkillRAGPipeline import SkillRAGPipeline
+from pipeline_logging import configure_logging
+from stage_profiler import enable_profiling
+
+def parse_args():
+    """Parse command line options for the pipeline."""
+    parser = argparse.ArgumentParser(description="Run the Skill RAG Clustering pipeline.")
+    parser.add_argument("--async", dest="async_mode", action="store_true",
+                        help="Run Step 2 with asyncio, overlapping MongoDB I/O with embedding and scoring.")
+    shard_group = parser.add_mutually_exclusive_group()
+    shard_group.add_argument("--shard", metavar="i/N",
+                             help="Run Step 2 for shard i of N (0-based) into a shard-tagged collection.")
+    shard_group.add_argument("--merge-shards", metavar="N", type=int,
+                             help="Merge the output of an N-way sharded run and run Step 3.")
+    shard_group.add_argument("--plan", action="store_true",
+                             help="Run Step 1, then estimate the comparisons, time, memory and results of Step 2 without running it.")
+    parser.add_argument("--run-id", metavar="ID",
+                        help="Id of a sharded run, shared by its --shard workers and --merge-shards (default: SHARD_RUN_ID).")
+    parser.add_argument("--profile", metavar="STAGES",
+                        help="Profile these stages (comma-separated: step1,step2,step3 or all); reports go to PROFILE_DIR.")
+    parser.add_argument("--profilers", metavar="NAMES",
+                        help="Profilers for --profile (comma-separated: cprofile, sampling, tracemalloc; default: PROFILERS).")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    pipeline = SkillRAGPipeline()
-    pipeline.run_pipeline()
+    args = parse_args()
+    configure_logging()
+    if args.profile:
+        enable_profiling(args.profile, args.profilers)
+    pipeline = SkillRAGPipeline(async_mode=args.async_mode, shard=args.shard, merge_shards=args.merge_shards,
+                                plan=args.plan, run_id=args.run_id)
+    # A failed step exits non-zero, so launchers such as run_shards_local.py see shard and merge failures
+    sys.exit(0 if pipeline.run_pipeline() else 1)
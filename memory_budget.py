@@ -0,0 +1,147 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : memory_budget.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script enforces the MAX_MEMORY_MB budget. It measures
+                  the resident memory of the process, splits the budget between
+                  the embedding cache, the score cache and the result buffers,
+                  derives batch sizes from it and adapts the size of the Step 2
+                  work tiles at runtime so the pipeline stays under the limit.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import logging
+import os
+import tracemalloc
+import config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Approximate in-memory sizes (as measured by --plan on typical profiles)
+RESULT_BYTES_ESTIMATE = 1536  # one expanded result document
+COMPACT_RESULT_BYTES = 64  # one compact result row plus its share of batch overhead
+SCORE_CACHE_ENTRY_BYTES = 200
+DOCUMENT_BYTES_ESTIMATE = 16 * 1024
+
+# Shares of the budget given to each consumer; the rest is left for profiles and models
+EMBEDDING_CACHE_SHARE = 0.25
+SCORE_CACHE_SHARE = 0.15
+RESULT_BUFFER_SHARE = 0.25
+FETCH_BUFFER_SHARE = 0.05
+SCORE_MATRIX_BUFFER_SHARE = 0.1  # rows kept for SCORE_MATRIX_DIR before they are spilled to disk
+
+# Memory pressure (resident / budget) above which tiles shrink, and below which they may grow
+HIGH_PRESSURE = 0.9
+LOW_PRESSURE = 0.7
+
+class MemoryBudget:
+    """Process memory budget. Without MAX_MEMORY_MB every method returns the unbudgeted default."""
+
+    def __init__(self, max_mb=None):
+        max_mb = config.MAX_MEMORY_MB if max_mb is None else max_mb
+        self.max_bytes = int(max_mb * MB) if max_mb and max_mb > 0 else None
+        self.peak_bytes = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes is not None
+
+    @staticmethod
+    def current_bytes():
+        """Resident set size of the process; falls back to tracemalloc where /proc is unavailable."""
+        try:
+            with open("/proc/self/statm") as file:
+                return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            return tracemalloc.get_traced_memory()[0]
+
+    def sample(self):
+        """Measure current memory use and track the peak."""
+        used = MemoryBudget.current_bytes()
+        self.peak_bytes = max(self.peak_bytes, used)
+        return used
+
+    def pressure(self):
+        """Fraction of the budget in use (0 when no budget is set)."""
+        return self.sample() / self.max_bytes if self.enabled else 0.0
+
+    def share(self, fraction):
+        """Bytes of the budget given to one consumer, or None without a budget."""
+        return int(self.max_bytes * fraction) if self.enabled else None
+
+    def batch_size(self, item_bytes, fraction, default, minimum=1):
+        """Number of items of the given size that fit in a share of the budget, capped at the default."""
+        if not self.enabled:
+            return default
+        return max(minimum, min(default, self.share(fraction) // item_bytes))
+
+    def log_peak(self, label):
+        """Log the peak memory seen against the budget."""
+        self.sample()
+        if self.enabled:
+            logger.info(f"{label}: peak memory {self.peak_bytes / MB:.0f} MB of {self.max_bytes / MB:.0f} MB budget.")
+        else:
+            logger.info(f"{label}: peak memory {self.peak_bytes / MB:.0f} MB.")
+
+class AdaptiveChunker:
+    """
+    Sizes the rounds of Step 2 work tiles. A round's results must fit the result buffer share of the budget;
+    rounds halve when memory pressure is high and grow again when it drops.
+    """
+
+    def __init__(self, budget, initial, maximum, minimum=1):
+        self.budget = budget
+        self.maximum = max(1, maximum)
+        self.minimum = min(minimum, self.maximum)
+        self.size = self.maximum if not budget.enabled else max(self.minimum, min(initial, self.maximum))
+        self._tasks = 0
+        self._results = 0
+
+    def next_size(self):
+        """Number of tasks to run in the next round."""
+        return self.size
+
+    def record(self, tasks, results):
+        """Adapt the round size after a round of `tasks` tasks produced `results` results."""
+        if not self.budget.enabled:
+            return
+        self._tasks += tasks
+        self._results += results
+        results_per_task = max(self._results / self._tasks, 1e-3)
+        target = int(self.budget.share(RESULT_BUFFER_SHARE) / (results_per_task * COMPACT_RESULT_BYTES))
+        pressure = self.budget.pressure()
+        if pressure > HIGH_PRESSURE:
+            size = self.size // 2
+        elif pressure < LOW_PRESSURE:
+            size = min(target, self.size * 2)
+        else:
+            size = min(target, self.size)
+        size = max(self.minimum, min(size, self.maximum))
+        if size != self.size:
+            logger.info(f"Step 2 round size {self.size} -> {size} (memory pressure {pressure:.0%}).")
+        self.size = size
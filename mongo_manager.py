@@ -0,0 +1,146 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : mongo_manager.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script manages the process-wide MongoDB connection. It
+                  creates one tuned MongoClient per URI (pool size, timeouts,
+                  compression), hands out databases to every pipeline stage,
+                  applies a configurable write concern for bulk loads and
+                  closes all clients deterministically on shutdown. An
+                  asyncio (Motor) client is offered when Motor is installed.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import atexit
+import logging
+import threading
+from pymongo import MongoClient
+from pymongo.write_concern import WriteConcern
+import config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:  # Motor is optional; async mode falls back to pymongo in an executor
+    AsyncIOMotorClient = None
+
+class MongoConnectionManager:
+    _clients = {}
+    _async_clients = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _client_options():
+        """Build the MongoClient keyword arguments from the configuration."""
+        options = {
+            "maxPoolSize": config.MONGO_MAX_POOL_SIZE,
+            "minPoolSize": config.MONGO_MIN_POOL_SIZE,
+            "maxIdleTimeMS": config.MONGO_MAX_IDLE_TIME_MS,
+            "connectTimeoutMS": config.MONGO_CONNECT_TIMEOUT_MS,
+            "serverSelectionTimeoutMS": config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            "socketTimeoutMS": config.MONGO_SOCKET_TIMEOUT_MS or None,
+        }
+        if config.MONGO_COMPRESSORS:
+            options["compressors"] = config.MONGO_COMPRESSORS
+        return options
+
+    @staticmethod
+    def get_client(mongo_uri=None):
+        """Return the shared client for the URI, creating it on first use."""
+        mongo_uri = mongo_uri or config.MONGO_URI
+        client = MongoConnectionManager._clients.get(mongo_uri)
+        if client is not None:
+            return client
+        with MongoConnectionManager._lock:
+            client = MongoConnectionManager._clients.get(mongo_uri)
+            if client is None:
+                client = MongoClient(mongo_uri, **MongoConnectionManager._client_options())
+                MongoConnectionManager._clients[mongo_uri] = client
+                logger.info("Created shared MongoDB client (maxPoolSize=%s).", config.MONGO_MAX_POOL_SIZE)
+            return client
+
+    @staticmethod
+    def get_database(database_name=None, mongo_uri=None, bulk=False):
+        """
+        Return a database handle on the shared client.
+        With bulk=True the handle uses the bulk-load write concern from the configuration.
+        """
+        database = MongoConnectionManager.get_client(mongo_uri)[database_name or config.DB_NAME]
+        if bulk:
+            database = database.with_options(write_concern=MongoConnectionManager.bulk_write_concern())
+        return database
+
+    @staticmethod
+    def get_async_database(database_name=None, mongo_uri=None, bulk=False):
+        """
+        Return a Motor database handle with the same pool settings, or None when Motor is not installed.
+        Must be called from inside a running event loop.
+        """
+        if AsyncIOMotorClient is None:
+            return None
+        mongo_uri = mongo_uri or config.MONGO_URI
+        with MongoConnectionManager._lock:
+            client = MongoConnectionManager._async_clients.get(mongo_uri)
+            if client is None:
+                client = AsyncIOMotorClient(mongo_uri, **MongoConnectionManager._client_options())
+                MongoConnectionManager._async_clients[mongo_uri] = client
+                logger.info("Created shared async MongoDB client (maxPoolSize=%s).", config.MONGO_MAX_POOL_SIZE)
+        database = client[database_name or config.DB_NAME]
+        if bulk:
+            database = database.with_options(write_concern=MongoConnectionManager.bulk_write_concern())
+        return database
+
+    @staticmethod
+    def bulk_write_concern():
+        """Write concern used for large result and vector loads."""
+        w = config.MONGO_BULK_WRITE_CONCERN
+        return WriteConcern(w=int(w) if str(w).isdigit() else w, j=config.MONGO_BULK_JOURNAL or None)
+
+    @staticmethod
+    def close_async_clients():
+        """Close the Motor clients, which are bound to the event loop that created them."""
+        with MongoConnectionManager._lock:
+            clients = list(MongoConnectionManager._async_clients.values())
+            MongoConnectionManager._async_clients.clear()
+        for client in clients:
+            client.close()
+
+    @staticmethod
+    def close_all():
+        """Close every shared client. Safe to call more than once."""
+        with MongoConnectionManager._lock:
+            clients = list(MongoConnectionManager._clients.values()) + list(MongoConnectionManager._async_clients.values())
+            MongoConnectionManager._clients.clear()
+            MongoConnectionManager._async_clients.clear()
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                logger.error(f"Error closing MongoDB client: {e}")
+        if clients:
+            logger.info(f"Closed {len(clients)} MongoDB client(s).")
+
+# Make sure pooled connections are released even if cleanup is skipped
+atexit.register(MongoConnectionManager.close_all)
@@ -29,10 +29,15 @@ For questions or permissions, please contact: info@gofreelab.com
 
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient
 from pymongo.errors import PyMongoError
 import logging
-import numpy as np
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from mongo_manager import MongoConnectionManager
+from compact_results import COMPACT, CompactTableWriter
+from vector_codec import decode_vector, encode_vector
+import config
 
 # Load environment variables from .env file
 load_dotenv()
@@ -52,15 +57,20 @@ class MongoDBWriter:
         if not self.uri or not self.db_name:
             raise ValueError("MONGO_URI and DB_NAME must be set in the .env file")
 
-        # Initialize the MongoDB client with the URI
-        self.client = MongoClient(self.uri)
-        self.db = self.client[self.db_name]
-        logger.info(f"Connected to MongoDB at {self.uri} and using database {self.db_name}")
+        # Reuse the shared client; result and vector writes are bulk loads
+        self.client = MongoConnectionManager.get_client(self.uri)
+        self.db = MongoConnectionManager.get_database(self.db_name, self.uri, bulk=True)
+        self._table_writers = {}  # collection -> CompactTableWriter
+        # Results that could not be inserted, per collection; a run with any is not counted as complete
+        self._failed_writes = Counter()
+        self._failed_lock = threading.Lock()
+        logger.info(f"Using shared MongoDB client for database {self.db_name}")
         
     def close(self) -> None:
-        """Close the MongoDB client connection."""
-        self.client.close()
-        logger.info("MongoDB client connection closed.")
+        """Release the writer. The shared client is closed by MongoConnectionManager.close_all()."""
+        self.client = None
+        self.db = None
+        logger.info("MongoDB writer released.")
 
     def write_similarity_scores(self, collection_name_out: str, results: list) -> None:
         
@@ -74,15 +84,62 @@ class MongoDBWriter:
                 logger.warning("No results to insert.")
         except PyMongoError as e:
             logger.error(f"Error writing similarity scores to MongoDB: {e}")
+            self.record_failed_write(collection_name_out, len(results))
+
+    def record_failed_write(self, collection_name, count):
+        """Count results lost by a failed insert, including inserts made outside this writer (e.g. with Motor)."""
+        with self._failed_lock:
+            self._failed_writes[collection_name] += count
+
+    def write_result_batch(self, collection_name_out: str, batch) -> None:
+        """Write a ResultBatch in the configured result schema (RESULT_FORMAT)."""
+        if not len(batch):
+            logger.warning("No results to insert.")
+            return
+        if config.RESULT_FORMAT == COMPACT:
+            table_writer = self._table_writers.get(collection_name_out)
+            if table_writer is None:
+                table_writer = self._table_writers.setdefault(collection_name_out, CompactTableWriter(self.db, collection_name_out))
+            # Table entries go first so every stored result can be resolved
+            table_writer.write_new_entries(batch.tables)
+            documents = batch.to_compact_documents()
+        else:
+            documents = batch.to_documents()
+        self.write_similarity_scores(collection_name_out, documents)
+
+    def write_user_pairs(self, collection_name: str, batch) -> None:
+        """Write a UserPairBatch to a user-pair collection."""
+        if not len(batch):
+            return
+        try:
+            self.db[collection_name].insert_many(batch.to_compact_documents())
+            logger.info(f"Inserted {len(batch)} user pairs into {collection_name}.")
+        except PyMongoError as e:
+            logger.error(f"Error writing user pairs to MongoDB: {e}")
+            self.record_failed_write(collection_name, len(batch))
 
     def write_similarity_count(self, collection_name_out: str, selected_similarity_count: int) -> None:
-        """Write the count of selected similarity scores to a MongoDB collection."""
+        """
+        Record the count of selected similarity scores written to a collection in RESULT_RUNS_COLLECTION.
+        The count marks a run as complete, so if inserts into the collection or its companions failed,
+        the failures are recorded instead and the run is not swapped in.
+        """
+        with self._failed_lock:
+            failed = sum(
+                count for name, count in self._failed_writes.items()
+                if name == collection_name_out or name.startswith(f"{collection_name_out}__")
+            )
+        if failed:
+            update = {"failed_writes": failed, "counted_at": datetime.now(timezone.utc)}
+        else:
+            update = {"selected_similarity_count": selected_similarity_count, "counted_at": datetime.now(timezone.utc)}
         try:
-            collection = self.db[collection_name_out]
-            count_document = {"selected_similarity_count": selected_similarity_count}
-            # Insert count as a single document
-            collection.update_one({}, {"$set": count_document}, upsert=True)
-            logger.info(f"Inserted similarity count into {collection_name_out}.")
+            # Kept out of the results, so the output collection holds similarity results only
+            self.db[config.RESULT_RUNS_COLLECTION].update_one({"_id": collection_name_out}, {"$set": update}, upsert=True)
+            if failed:
+                logger.error(f"❌ {failed} results could not be written to {collection_name_out}; its count is not recorded.")
+            else:
+                logger.info(f"Recorded similarity count of {collection_name_out}.")
         except PyMongoError as e:
             logger.error(f"Error writing similarity count to MongoDB: {e}")
 
@@ -93,7 +150,7 @@ class MongoDBWriter:
             result = vector_collection.find_one({"text": text}, max_time_ms=timeout_ms)
             if result and "vector" in result:
                 logger.info(f"Retrieved vector for text '{text}'")
-                return np.array(result["vector"])
+                return decode_vector(result["vector"])
             logger.warning(f"No vector found for text '{text}'")
             return None
         except PyMongoError as e:
@@ -106,7 +163,7 @@ class MongoDBWriter:
             vector_collection = self.db[vector_collection]
             result = vector_collection.update_one(
                 {"text": text},
-                {"$set": {"vector": vector.tolist()}},  # Convert numpy array to list for JSON compatibility
+                {"$set": {"vector": encode_vector(vector)}},  # float32 bytes (VECTOR_ENCODING=binary) or a list
                 upsert=True
             )
             logger.info(f"Stored vector for text '{text}' in the collection '{vector_collection}'")
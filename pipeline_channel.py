@@ -0,0 +1,124 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : pipeline_channel.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script provides the in-process data channel between full
+                  profile matching (Step 2) and ranking and clustering (Step 3).
+                  Step 2 publishes similarity results into per-module
+                  partitions that Step 3 consumes directly, while optional
+                  sinks such as MongoDB persistence run in parallel on a
+                  background thread.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from compact_results import ResultBatch
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class MongoResultSink:
+    """Persists published results to the output collection."""
+
+    def __init__(self, mongo_writer, collection_name_out):
+        self.mongo_writer = mongo_writer
+        self.collection_name_out = collection_name_out
+
+    def write(self, results):
+        """Insert a ResultBatch in the configured result schema."""
+        self.mongo_writer.write_result_batch(self.collection_name_out, results)
+
+    def close(self, total_count):
+        """Record the number of results written."""
+        self.mongo_writer.write_similarity_count(self.collection_name_out, total_count)
+
+class ResultChannel:
+    """Holds Step 2 results as per-module compact partitions and fans them out to optional sinks."""
+
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks or [])
+        self._partitions = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._finished = False  # Set by the producer once every result was published
+        # A single worker keeps sink writes ordered while Step 2 and Step 3 keep running
+        self._sink_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-sink") if self.sinks else None
+        self._pending = []
+
+    def publish(self, results):
+        """Add a ResultBatch of similarity results to the channel."""
+        if not len(results):
+            return
+        with self._lock:
+            for module, module_results in results.split_by_module().items():
+                self._partitions.setdefault(module, []).append(module_results)
+            self._count += len(results)
+        for sink in self.sinks:
+            self._pending.append(self._sink_executor.submit(sink.write, results))
+
+    def partitions(self):
+        """Return the results grouped by module, as module name -> ResultBatch."""
+        with self._lock:
+            for module, batches in self._partitions.items():
+                if len(batches) > 1:
+                    self._partitions[module] = [ResultBatch.concatenate(batches)]
+            return {module: batches[0] for module, batches in self._partitions.items()}
+
+    def __len__(self):
+        return self._count
+
+    def finish(self):
+        """Mark that Step 2 completed and published all of its results."""
+        self._finished = True
+
+    def close(self):
+        """
+        Wait for the sinks to drain and finalize them. Safe to call more than once.
+        Sinks are only finalized (which records the result count and so completes the run) when the
+        producer finished and every sink write succeeded; otherwise the partial run is left incomplete.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        failed = 0
+        for future in self._pending:
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                logger.error(f"Error in result sink: {e}")
+        if not self._finished or failed:
+            reason = f"{failed} sink writes failed" if failed else "Step 2 did not finish"
+            logger.warning(f"⚠️ {reason}; the {self._count} published results are not recorded as complete.")
+            self.sinks = []
+        for sink in self.sinks:
+            try:
+                sink.close(self._count)
+            except Exception as e:
+                logger.error(f"Error closing result sink: {e}")
+        if self._sink_executor is not None:
+            self._sink_executor.shutdown(wait=True)
+        self._pending = []
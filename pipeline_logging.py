@@ -0,0 +1,116 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : pipeline_logging.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script provides the logging layer used in the pipeline
+                  hot paths. It configures the log level once for the whole
+                  process, aggregates per-event outcomes into counters that are
+                  emitted per task, and offers a sampled, rate-limited debug
+                  logger with lazy formatting for per-event detail.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+import config
+
+def configure_logging(level=None):
+    """Set the process-wide log level, defaulting to the LOG_LEVEL setting."""
+    level = level or config.LOG_LEVEL
+    logging.basicConfig(level=level)
+    logging.getLogger().setLevel(level)
+
+class StageCounters:
+    """Thread-safe event counters aggregated per task and per run."""
+
+    SKIPPED_NUMERIC = "skipped_numeric"
+    EMPTY_TEXT = "empty_text"
+    BELOW_THRESHOLD = "below_threshold"
+    NONE_EMBEDDING = "none_embedding"
+    MATCHED = "matched"
+
+    def __init__(self, counts=None):
+        self._counts = Counter(counts or {})
+        self._lock = threading.Lock()
+
+    def increment(self, name, amount=1):
+        """Add to a named counter."""
+        with self._lock:
+            self._counts[name] += amount
+
+    def merge(self, other):
+        """Add the counts of another StageCounters or plain mapping into this one."""
+        counts = other.as_dict() if isinstance(other, StageCounters) else other
+        with self._lock:
+            self._counts.update(counts or {})
+
+    def as_dict(self):
+        """Return a plain dict snapshot of the counters."""
+        with self._lock:
+            return dict(self._counts)
+
+    def log_summary(self, logger, label, level=logging.INFO):
+        """Emit one line with all non-zero counters."""
+        if not logger.isEnabledFor(level):
+            return
+        counts = self.as_dict()
+        summary = ", ".join(f"{name}={count}" for name, count in sorted(counts.items()) if count) or "no events"
+        logger.log(level, "%s: %s", label, summary)
+
+class SampledLogger:
+    """
+    Debug logger for hot loops: keeps one event in every 1/sample_rate and at most
+    max_per_second lines per second. Arguments are only formatted for emitted lines.
+    """
+
+    def __init__(self, logger, sample_rate=None, max_per_second=None):
+        self.logger = logger
+        sample_rate = config.LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.sample_every = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self.max_per_second = config.LOG_RATE_LIMIT if max_per_second is None else max_per_second
+        self.suppressed = 0
+        self._seen = 0
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._lock = threading.Lock()
+
+    def _should_emit(self):
+        with self._lock:
+            self._seen += 1
+            if not self.sample_every or self._seen % self.sample_every:
+                return False
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_count = 0
+            if self._window_count >= self.max_per_second:
+                self.suppressed += 1
+                return False
+            self._window_count += 1
+            return True
+
+    def debug(self, msg, *args):
+        """Log a sampled, rate-limited debug line using lazy %-style formatting."""
+        if self.logger.isEnabledFor(logging.DEBUG) and self._should_emit():
+            self.logger.debug(msg, *args)
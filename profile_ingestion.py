@@ -0,0 +1,158 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : profile_ingestion.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script ingests profile documents into the input
+                  collection and embeds their field values at the same time.
+                  Profiles and vectors are written in bulk batches, and values
+                  that already have a stored vector are skipped, so the
+                  matching steps read precomputed vectors instead of running
+                  the models during the nightly batch.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import argparse
+import json
+import logging
+from pymongo import InsertOne, ReplaceOne
+from pymongo.errors import PyMongoError
+from embedding import EmbeddingHandler
+from embedding_store import EmbeddingStore
+from encoders import get_encoder
+from mongo_manager import MongoConnectionManager
+from user_similarity_analyzer import UserSimilarityAnalyzer
+from user2 import UserSimilarityAnalyzerFull
+from pipeline_logging import configure_logging
+import config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ProfileIngestor:
+    """Writes profile documents to the input collection and precomputes the vectors of their values."""
+
+    def __init__(self, database=None, collection_name=None, batch_size=None, embed=True):
+        self.database = database if database is not None else MongoConnectionManager.get_database(bulk=True)
+        self.collection = self.database[collection_name or config.COLLECTION_NAME]
+        self.batch_size = batch_size or config.INGEST_BATCH_SIZE
+        self.embed = embed
+        self.embedding_store = EmbeddingStore(self.database)
+
+    @staticmethod
+    def iter_profile_texts(document):
+        """Yield the canonical text of every embeddable profile value in a {module: {role: [profile]}} document."""
+        for module, roles_data in document.items():
+            if not isinstance(roles_data, dict):
+                continue
+            for role, role_data in roles_data.items():
+                if not isinstance(role_data, list):
+                    continue
+                for profile in role_data:
+                    if not isinstance(profile, dict):
+                        continue
+                    for key, value in profile.items():
+                        if key == "id" or key.lower() in UserSimilarityAnalyzer.excluded_keys:
+                            continue
+                        text = UserSimilarityAnalyzerFull.canonicalize_value(value)
+                        if text:
+                            yield text
+
+    def ingest(self, documents):
+        """
+        Ingest profile documents in batches.
+
+        Returns:
+            dict: Counts of written profiles, embedded values and skipped (already stored) values.
+        """
+        stats = {"documents": 0, "embedded": 0, "skipped": 0}
+        batch = []
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= self.batch_size:
+                self._ingest_batch(batch, stats)
+                batch = []
+        if batch:
+            self._ingest_batch(batch, stats)
+        logger.info(
+            f"✅ Ingested {stats['documents']} documents: {stats['embedded']} values embedded, "
+            f"{stats['skipped']} unchanged values skipped."
+        )
+        return stats
+
+    def ingest_file(self, path):
+        """Ingest a JSON file holding one profile document or a list of them."""
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        return self.ingest(data if isinstance(data, list) else [data])
+
+    def _ingest_batch(self, documents, stats):
+        """Embed the new values of a batch, then write its documents."""
+        if self.embed:
+            self._embed_values(documents, stats)
+        operations = [
+            ReplaceOne({"_id": document["_id"]}, document, upsert=True) if "_id" in document else InsertOne(document)
+            for document in documents
+        ]
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+        except PyMongoError as e:
+            logger.error(f"Error writing profile documents: {e}")
+            raise Exception(f"Error writing profile documents: {e}")
+        stats["documents"] += len(documents)
+
+    def _embed_values(self, documents, stats):
+        """Encode and store the values of a batch that have no stored vector yet."""
+        texts = [text for document in documents for text in ProfileIngestor.iter_profile_texts(document)]
+        # A short value may meet a long value of any other batch, so its mixed-pair vector is stored as well
+        texts_by_encoder = EmbeddingHandler.group_by_encoder(texts, mixed_pairs=True)
+        for encoder, texts in texts_by_encoder.items():
+            store_key = get_encoder(encoder).store_key()
+            if store_key is None:
+                logger.warning(f"⚠️ The {encoder} encoder's vectors cannot be stored. Skipping its {len(texts)} values.")
+                continue
+            existing = self.embedding_store.existing(store_key, texts)
+            new_texts = [text for text in texts if text not in existing]
+            stats["skipped"] += len(existing)
+            if not new_texts:
+                continue
+            vectors = EmbeddingHandler.get_embeddings(new_texts, encoder)
+            stats["embedded"] += self.embedding_store.store(store_key, dict(zip(new_texts, vectors)))
+
+def parse_args():
+    """Parse command line options for ingestion."""
+    parser = argparse.ArgumentParser(description="Ingest profiles and precompute the embeddings of their values.")
+    parser.add_argument("paths", nargs="+", help="JSON files holding a profile document or a list of them.")
+    parser.add_argument("--batch-size", type=int, help="Documents per bulk write (default: INGEST_BATCH_SIZE).")
+    parser.add_argument("--no-embed", action="store_true", help="Write the profiles without computing embeddings.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    configure_logging()
+    EmbeddingHandler.set_encoder_policy(config.ENCODER_POLICY)
+    ingestor = ProfileIngestor(batch_size=args.batch_size, embed=not args.no_embed)
+    try:
+        for path in args.paths:
+            ingestor.ingest_file(path)
+    finally:
+        MongoConnectionManager.close_all()
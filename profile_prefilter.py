@@ -0,0 +1,172 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : profile_prefilter.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script implements the first stage of a two-stage Step 2.
+                  Every profile gets one vector, the key-weighted mean of the
+                  embeddings of its allowed values, computed in batch. Profiles
+                  of two roles in a module are compared with one matrix product,
+                  and only the top candidates of each profile, or those above a
+                  coarse threshold, go on to the key-by-key comparison.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import logging
+from collections import defaultdict
+from itertools import combinations
+import numpy as np
+from scipy import sparse
+from embedding import EmbeddingHandler, HYBRID, SPACY
+import config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rows of the profile similarity matrix computed at once
+SIMILARITY_CHUNK_ROWS = 1024
+
+class ProfilePrefilter:
+    """Selects, for every profile, the profiles of other roles worth comparing key by key."""
+
+    def __init__(self, value_interner, key_alignment=None, threshold=None, top_k=None, encoder=None, embedding_handler=None):
+        """
+        Args:
+            value_interner: Interner holding the canonical text of the value ids in prepared profiles.
+            key_alignment: Key alignment learned in Step 1; a key's weight is how often it matched.
+            threshold: Profile similarity at or above which a pair is always kept (PREFILTER_THRESHOLD).
+            top_k: Number of most similar profiles always kept per profile and role (PREFILTER_TOP_K).
+            encoder: Encoder for the value embeddings (PREFILTER_ENCODER, default: the policy's short-text encoder).
+        """
+        self.value_interner = value_interner
+        self.key_alignment = key_alignment or {}
+        self.threshold = config.PREFILTER_THRESHOLD if threshold is None else threshold
+        self.top_k = config.PREFILTER_TOP_K if top_k is None else top_k
+        policy = EmbeddingHandler.get_encoder_policy()
+        # Profile vectors must share one vector space, so a single encoder embeds every value
+        self.encoder = encoder or config.PREFILTER_ENCODER or (SPACY if policy == HYBRID else policy)
+        self.embedding_handler = embedding_handler or EmbeddingHandler
+
+    def key_weight(self, module, role, key):
+        """Importance of a key: how often Step 1 saw it match a key of another role (1 without alignment)."""
+        roles2 = self.key_alignment.get(module, {}).get(role, {}).get(key)
+        if not roles2:
+            return 1.0
+        return float(sum(count for keys2 in roles2.values() for count in keys2.values()))
+
+    def _value_embeddings(self, value_ids):
+        """Embed the values in batches into an L2-normalized matrix, one row per value id."""
+        matrix = None
+        for start in range(0, len(value_ids), config.EMBEDDING_BATCH_SIZE):
+            batch = value_ids[start:start + config.EMBEDDING_BATCH_SIZE]
+            vectors = self.embedding_handler.get_embeddings([self.value_interner.text(value_id) for value_id in batch], self.encoder)
+            for offset, vector in enumerate(vectors):
+                if vector is None:
+                    continue
+                if matrix is None:
+                    matrix = np.zeros((len(value_ids), len(vector)), dtype=np.float32)
+                matrix[start + offset] = vector
+        if matrix is None:
+            return np.zeros((len(value_ids), 1), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def profile_vectors(self, profiles):
+        """Return the L2-normalized key-weighted mean value embedding of each prepared profile."""
+        value_ids = sorted({value_id for profile in profiles for _, value_id in profile[4].values()})
+        column = {value_id: index for index, value_id in enumerate(value_ids)}
+        rows, columns, weights = [], [], []
+        for row, (module, role, _, _, prepared) in enumerate(profiles):
+            for key, (_, value_id) in prepared.items():
+                rows.append(row)
+                columns.append(column[value_id])
+                weights.append(self.key_weight(module, role, key))
+        weight_matrix = sparse.csr_matrix((weights, (rows, columns)), shape=(len(profiles), len(value_ids)), dtype=np.float32)
+        vectors = np.asarray(weight_matrix @ self._value_embeddings(value_ids))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def _select(self, vectors1, vectors2):
+        """For each row of vectors1, the indices of the rows of vectors2 that pass the prefilter."""
+        selected = []
+        top_k = min(self.top_k, len(vectors2))
+        for start in range(0, len(vectors1), SIMILARITY_CHUNK_ROWS):
+            similarity = vectors1[start:start + SIMILARITY_CHUNK_ROWS] @ vectors2.T
+            keep = similarity >= self.threshold
+            if top_k:
+                top = np.argpartition(-similarity, top_k - 1, axis=1)[:, :top_k]
+                np.put_along_axis(keep, top, True, axis=1)
+            selected.extend(np.flatnonzero(row) for row in keep)
+        return selected
+
+    @staticmethod
+    def _union(selected1, selected2, count2):
+        """
+        Merge the selections of both directions of a role pair, so a pair kept in either direction is kept
+        in both and the results of (role1, role2) and (role2, role1) cover the same profile pairs.
+
+        Returns:
+            tuple: The candidates of each profile of role1 and of each profile of role2.
+        """
+        def as_matrix(selected, columns):
+            indptr = np.cumsum([0] + [len(indices) for indices in selected])
+            indices = np.concatenate(selected) if selected else np.empty(0, dtype=np.int64)
+            return sparse.csr_matrix((np.ones(len(indices), dtype=np.int8), indices, indptr), shape=(len(selected), columns))
+
+        keep = (as_matrix(selected1, count2) + as_matrix(selected2, len(selected1)).T).tocsr()
+        keep.sort_indices()
+        keep_t = keep.T.tocsr()
+        keep_t.sort_indices()
+        return ([keep.indices[keep.indptr[i]:keep.indptr[i + 1]] for i in range(keep.shape[0])],
+                [keep_t.indices[keep_t.indptr[j]:keep_t.indptr[j + 1]] for j in range(keep_t.shape[0])])
+
+    def plan(self, prepared_pairs):
+        """
+        Select the candidate pairs of every ordered role pair of every module.
+
+        Returns:
+            dict: (module, role1, role2) -> list with, for each profile of role1 (in prepared order,
+                profiles without usable keys left out), an array of indices into the profiles of role2.
+        """
+        profiles_by_role = defaultdict(lambda: defaultdict(list))
+        for profile in prepared_pairs:
+            if profile[4]:
+                profiles_by_role[profile[0]][profile[1]].append(profile)
+
+        candidates = {}
+        kept = total = 0
+        for module, roles in profiles_by_role.items():
+            vectors = {role: self.profile_vectors(profiles) for role, profiles in roles.items()}
+            for role1, role2 in combinations(roles, 2):
+                # Each profile picks its top candidates; the union of both directions keeps the pairs symmetric
+                selected1, selected2 = self._union(
+                    self._select(vectors[role1], vectors[role2]),
+                    self._select(vectors[role2], vectors[role1]),
+                    len(roles[role2]),
+                )
+                candidates[(module, role1, role2)] = selected1
+                candidates[(module, role2, role1)] = selected2
+                kept += 2 * sum(len(indices) for indices in selected1)
+                total += 2 * len(roles[role1]) * len(roles[role2])
+        if total:
+            logger.info(f"🔹 Profile prefilter kept {kept} of {total} profile pairs ({kept / total:.1%}) for key-level comparison.")
+        return candidates
@@ -0,0 +1,226 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : recommendations.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script materializes the recommendations collection after
+                  ranking and clustering: one document per (module, role, user)
+                  with its best matches, sorted by score and capped, each with
+                  the cluster Step 3 assigned it. The collection is rebuilt in a
+                  staging collection, module by module, copying the documents of
+                  unchanged modules instead of recomputing them, and then swapped
+                  in with an atomic rename. Reads are a single indexed lookup.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import hashlib
+import logging
+from datetime import datetime, timezone
+from functools import partial
+import numpy as np
+from compact_results import (
+    ResultBatch, StoredTableSets, iter_result_batches, result_modules, result_query, score_field, stored_result_format,
+)
+from user_pairs import iter_user_pair_batches, user_pair_modules, user_pair_collection_name
+from index_manager import IndexManager
+from config import get_env_variable
+import config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def staging_collection_name(collection_name):
+    """Name of the collection a recommendations rebuild is written to before it is swapped in."""
+    return f"{collection_name}__staging"
+
+def get_recommendations(database, module, role, user_index, collection_name=None):
+    """
+    Read the materialized recommendations of one user with a single indexed lookup.
+
+    Returns:
+        dict | None: The user's document, with 'matches' sorted by score, or None if the user has none.
+    """
+    collection = database[collection_name or config.RECOMMENDATIONS_COLLECTION]
+    return collection.find_one({"module": module, "role": role, "user_index": user_index}, {"_id": 0, "signature": 0})
+
+class RecommendationMaterializer:
+    """Builds the per-user recommendations collection from the ranked Step 2 results."""
+
+    def __init__(self, database, collection_name_out=None, result_channel=None, collection_name=None, top_k=None, batch_size=1000):
+        """
+        Args:
+            database: MongoDB database instance.
+            collection_name_out: Name of the collection storing similarity results.
+            result_channel: Optional in-process channel holding the Step 2 results; when given,
+                the results are not read back from MongoDB.
+            collection_name: Recommendations collection (RECOMMENDATIONS_COLLECTION).
+            top_k: Matches kept per user (RECOMMENDATIONS_TOP_K).
+        """
+        self.database = database
+        self.collection_name_out = collection_name_out or get_env_variable("COLLECTION_NAME_OUT", "modified_data")
+        self.collection_name = collection_name or config.RECOMMENDATIONS_COLLECTION
+        self.top_k = top_k or config.RECOMMENDATIONS_TOP_K
+        self.batch_size = batch_size
+        self.num_clusters = int(get_env_variable("NUM_CLUSTERS", 6))
+        # Read the same results Step 3 ranked
+        self.result_channel = None if config.USER_PAIR_AGGREGATION else result_channel
+        if config.USER_PAIR_AGGREGATION:
+            self.source_name = user_pair_collection_name(self.collection_name_out)
+            self.source_query = lambda module: {"m": module}
+            self.source_score = lambda: "s"
+            self._iter_batches, self._modules = iter_user_pair_batches, user_pair_modules
+        else:
+            self.source_name = self.collection_name_out
+            # Read in the schema the results were stored with
+            self.source_query = lambda module: result_query(stored_result_format(self.database, self.source_name), module)
+            self.source_score = lambda: score_field(stored_result_format(self.database, self.source_name))
+            self._iter_batches = partial(iter_result_batches, stored_tables=StoredTableSets())
+            self._modules = result_modules
+
+    def _signature(self, count, score_sum):
+        """
+        Identify the results of a module and the settings the recommendations are built with.
+        A module whose signature is unchanged since the last build is copied instead of rebuilt.
+        """
+        settings = f"{self.source_name}|{config.RESULT_FORMAT}|{self.top_k}|{self.num_clusters}|{count}|{score_sum:.6f}"
+        return hashlib.sha1(settings.encode("utf-8")).hexdigest()
+
+    def _module_sources(self):
+        """
+        Return every module with its result count, signature and a function yielding its results by score.
+
+        Returns:
+            list: (module, count, signature, results) tuples.
+        """
+        if self.result_channel is not None:
+            sources = []
+            for module, partition in self.result_channel.partitions().items():
+                score_sum = float(partition.rows["score"].astype(np.float64).sum())
+                sources.append((module, len(partition), self._signature(len(partition), score_sum),
+                                lambda partition=partition: self._channel_results(partition)))
+            return sources
+
+        sources = []
+        for module in self._modules(self.database, self.collection_name_out):
+            totals = list(self.database[self.source_name].aggregate([
+                {"$match": self.source_query(module)},
+                {"$group": {"_id": None, "count": {"$sum": 1}, "score_sum": {"$sum": f"${self.source_score()}"}}},
+            ]))
+            count, score_sum = (totals[0]["count"], totals[0]["score_sum"]) if totals else (0, 0.0)
+            sources.append((module, count, self._signature(count, score_sum),
+                            lambda module=module: self._stored_results(module)))
+        return sources
+
+    def _channel_results(self, partition):
+        ranked = partition.sorted_by_score()
+        for start in range(0, len(ranked), self.batch_size):
+            yield from ResultBatch(ranked.rows[start:start + self.batch_size], ranked.tables).to_documents()
+
+    def _stored_results(self, module):
+        for batch in self._iter_batches(self.database, self.collection_name_out, self.batch_size, module=module, sort_by_score=True):
+            yield from batch.to_documents()
+
+    def _build_module(self, module, count, signature, results):
+        """
+        Turn one module's results, best first, into per-user documents. A user keeps the first
+        top_k users it matched, i.e. its best ones; key-level results of a listed pair are counted.
+        """
+        # Same assignment as Step 3: equal slices of the module's ranking
+        cluster_size = max(count // self.num_clusters, 1)
+        users = {}
+        for index, result in enumerate(results):
+            user1, user2 = result["user1"], result["user2"]
+            matches = users.setdefault((user1["role"], user1["user_index"]), {})
+            other = (user2["role"], user2["user_index"])
+            match = matches.get(other)
+            if match is not None:
+                match["matched_keys"] += 1
+                continue
+            if len(matches) >= self.top_k:
+                continue
+            match = {
+                "role": user2["role"], "user_index": user2["user_index"],
+                "score": result["similarity_score"], "cluster": min(index // cluster_size, self.num_clusters - 1),
+                "matched_keys": result.get("matched_keys", 1),
+            }
+            if "key" in user1:
+                match["key1"], match["key2"] = user1["key"], user2["key"]
+            matches[other] = match
+
+        now = datetime.now(timezone.utc)
+        for (role, user_index), matches in users.items():
+            yield {
+                "module": module, "role": role, "user_index": user_index,
+                "matches": list(matches.values()), "signature": signature, "updated_at": now,
+            }
+
+    def _live_signature(self, module):
+        """Signature the live collection was built with for a module, or None if it has no documents for it."""
+        document = self.database[self.collection_name].find_one({"module": module}, {"signature": 1})
+        return document.get("signature") if document else None
+
+    def execute(self):
+        """
+        Rebuild the recommendations collection and swap it in atomically.
+
+        Returns:
+            int: The number of user documents in the new collection.
+        """
+        logger.info(f"🔹 Materializing recommendations into '{self.collection_name}'...")
+        staging_name = staging_collection_name(self.collection_name)
+        self.database.drop_collection(staging_name)
+        staging = self.database[staging_name]
+        # Indexes are built on the staging collection, so the swapped-in collection is ready for reads
+        for keys, options in IndexManager.recommendation_indexes():
+            staging.create_index(keys, **options)
+
+        rebuilt = copied = 0
+        for module, count, signature, results in self._module_sources():
+            if count and self._live_signature(module) == signature:
+                # Unchanged results: copy the module's documents server-side
+                list(self.database[self.collection_name].aggregate([
+                    {"$match": {"module": module}},
+                    {"$merge": {"into": staging_name, "whenMatched": "fail"}},
+                ]))
+                copied += 1
+                continue
+            documents = []
+            for document in self._build_module(module, count, signature, results()):
+                documents.append(document)
+                if len(documents) >= self.batch_size:
+                    staging.insert_many(documents, ordered=False)
+                    documents = []
+            if documents:
+                staging.insert_many(documents, ordered=False)
+            rebuilt += 1
+
+        total = staging.count_documents({})
+        if not total:
+            # An empty build is swapped in as well, so modules without results keep no stale recommendations
+            logger.warning(f"⚠️ No similarity results found in '{self.source_name}'. Clearing the recommendations.")
+        # renameCollection with dropTarget replaces the live collection in one step
+        staging.rename(self.collection_name, dropTarget=True)
+        logger.info(
+            f"✅ Materialized recommendations for {total} users into '{self.collection_name}' "
+            f"({rebuilt} modules rebuilt, {copied} unchanged modules copied)."
+        )
+        return total
@@ -0,0 +1,169 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : result_runs.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script versions the Step 2 output by run. A run writes
+                  its results, id tables and user pairs into collections named
+                  <COLLECTION_NAME_OUT>__run_<id>. When the run has finished,
+                  their indexes are built and they replace the output
+                  collections with renameCollection, so readers always see the
+                  complete results of one run. The result count of each run is
+                  kept in RESULT_RUNS_COLLECTION, and abandoned runs are dropped.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import logging
+from datetime import datetime, timezone
+from compact_results import table_collection_name
+from user_pairs import user_pair_collection_name
+from index_manager import IndexManager
+import config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RUN_SEPARATOR = "__run_"
+
+def run_collection_name(collection_name_out, run_id):
+    """Name of the collection a run writes its results to before it is swapped in."""
+    return f"{collection_name_out}{RUN_SEPARATOR}{run_id}"
+
+def result_collections(collection_name_out):
+    """The output collection and its companions, in the order a run swaps them in: the results last."""
+    return [table_collection_name(collection_name_out), user_pair_collection_name(collection_name_out), collection_name_out]
+
+def read_run(database, collection_name_out):
+    """
+    Return the record of the run whose results are in the output collection.
+
+    Returns:
+        dict | None: run_id, fingerprint and selected_similarity_count of the run, or None if no run was swapped in.
+    """
+    return database[config.RESULT_RUNS_COLLECTION].find_one({"_id": collection_name_out})
+
+def collect_garbage(database, collection_name_out, before_run_id=None):
+    """
+    Drop the collections of runs that were never swapped in. With before_run_id, only runs
+    started earlier are dropped; later runs may still be writing.
+
+    Returns:
+        int: The number of collections dropped.
+    """
+    prefix = f"{collection_name_out}{RUN_SEPARATOR}"
+    dropped = 0
+    for name in database.list_collection_names():
+        if not name.startswith(prefix):
+            continue
+        run_id = name[len(prefix):].split("__")[0]
+        if before_run_id is not None and run_id >= before_run_id:
+            continue
+        database.drop_collection(name)
+        dropped += 1
+    query = {"output": collection_name_out, "_id": {"$ne": collection_name_out}}
+    if before_run_id is not None:
+        query["run_id"] = {"$lt": before_run_id}
+    database[config.RESULT_RUNS_COLLECTION].delete_many(query)
+    if dropped:
+        logger.info(f"🧹 Dropped {dropped} collections of abandoned runs of '{collection_name_out}'.")
+    return dropped
+
+class ResultRun:
+    """One run of Step 2, written under run collection names and swapped in for the output when complete."""
+
+    def __init__(self, database, collection_name_out, fingerprint=None):
+        """
+        Args:
+            database: MongoDB database instance.
+            collection_name_out: Output collection the run replaces.
+            fingerprint: Fingerprint of the run's inputs, recorded so a later run can reuse its results.
+        """
+        self.database = database
+        self.collection_name_out = collection_name_out
+        self.fingerprint = fingerprint
+        self.registry = database[config.RESULT_RUNS_COLLECTION]
+        started_at = datetime.now(timezone.utc)
+        # Run ids sort by start time
+        self.run_id = started_at.strftime("%Y%m%d%H%M%S%f")
+        self.collection_name = run_collection_name(collection_name_out, self.run_id)
+        self.registry.insert_one({
+            "_id": self.collection_name, "output": collection_name_out, "run_id": self.run_id, "started_at": started_at,
+        })
+
+    def discard(self):
+        """Drop the run's collections and its record."""
+        for name in result_collections(self.collection_name):
+            self.database.drop_collection(name)
+        self.registry.delete_one({"_id": self.collection_name})
+
+    def complete(self, keep=()):
+        """
+        Build the indexes of the run's collections and swap them in for the output collections.
+
+        Args:
+            keep: Live companion collections the run does not rebuild, e.g. the user pairs a re-threshold
+                leaves as they are. Other companions the run did not write are dropped.
+
+        Returns:
+            bool: Whether the run was swapped in. A run that did not finish writing, failed to write
+                some results, or that an already swapped-in later run supersedes, is dropped instead.
+        """
+        record = self.registry.find_one({"_id": self.collection_name})
+        if record is not None and record.get("failed_writes"):
+            logger.warning(
+                f"⚠️ {record['failed_writes']} results of '{self.collection_name}' were not written. "
+                f"Keeping the current results in '{self.collection_name_out}'."
+            )
+            self.discard()
+            return False
+        # The result count is written last, so a run without it did not finish
+        if record is None or "selected_similarity_count" not in record:
+            logger.warning(f"⚠️ '{self.collection_name}' is incomplete. Keeping the current results in '{self.collection_name_out}'.")
+            self.discard()
+            return False
+        live = read_run(self.database, self.collection_name_out)
+        if live is not None and live.get("run_id", "") > self.run_id:
+            logger.warning(f"⚠️ A later run is already in '{self.collection_name_out}'. Dropping '{self.collection_name}'.")
+            self.discard()
+            return False
+
+        existing = set(self.database.list_collection_names())
+        indexes = IndexManager.result_indexes(self.collection_name)
+        for run_name, live_name in zip(result_collections(self.collection_name), result_collections(self.collection_name_out)):
+            if run_name != self.collection_name and run_name not in existing:
+                # A companion the run did not write must not outlive the results it belonged to
+                if live_name not in keep:
+                    self.database.drop_collection(live_name)
+                continue
+            collection = self.database[run_name]
+            # Built after the bulk load, so the swapped-in collection is ready for reads
+            for keys, options in indexes.get(run_name, []):
+                collection.create_index(keys, **options)
+            # renameCollection with dropTarget replaces the live collection in one step
+            collection.rename(live_name, dropTarget=True)
+
+        record.update(_id=self.collection_name_out, fingerprint=self.fingerprint, completed_at=datetime.now(timezone.utc))
+        self.registry.replace_one({"_id": self.collection_name_out}, record, upsert=True)
+        self.registry.delete_one({"_id": self.collection_name})
+        collect_garbage(self.database, self.collection_name_out, before_run_id=self.run_id)
+        logger.info(f"✅ Run {self.run_id}: {record['selected_similarity_count']} similarity results swapped into '{self.collection_name_out}'.")
+        return True
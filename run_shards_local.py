@@ -0,0 +1,87 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : run_shards_local.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script runs a sharded pipeline on one machine: it starts
+                  N shard workers as separate processes (main.py --shard i/N)
+                  with one run id, waits for all of them, and then runs the
+                  coordinator (main.py --merge-shards N). It exits with an error
+                  when a worker or the coordinator fails, so it doubles as a
+                  local end-to-end test of sharding against the configured
+                  MongoDB.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+def run_sharded(shard_count, run_id, extra_args=()):
+    """
+    Run the shard workers in parallel, then the coordinator.
+
+    Returns:
+        int: 0 when every process succeeded, otherwise the first non-zero exit code.
+    """
+    workers = []
+    for shard_index in range(shard_count):
+        command = [sys.executable, MAIN, "--shard", f"{shard_index}/{shard_count}", "--run-id", run_id, *extra_args]
+        logger.info(f"🔹 Starting shard worker {shard_index}/{shard_count}: {' '.join(command[1:])}")
+        workers.append(subprocess.Popen(command))
+    exit_codes = [worker.wait() for worker in workers]
+    failed = [index for index, code in enumerate(exit_codes) if code != 0]
+    if failed:
+        logger.error(f"❌ Shard workers {failed} failed; not merging run '{run_id}'.")
+        return next(code for code in exit_codes if code != 0)
+
+    command = [sys.executable, MAIN, "--merge-shards", str(shard_count), "--run-id", run_id, *extra_args]
+    logger.info(f"🔹 All {shard_count} shards completed. Merging: {' '.join(command[1:])}")
+    exit_code = subprocess.call(command)
+    if exit_code == 0:
+        logger.info(f"✅ Sharded run '{run_id}' with {shard_count} workers completed.")
+    else:
+        logger.error(f"❌ The coordinator of run '{run_id}' failed with exit code {exit_code}.")
+    return exit_code
+
+def parse_args():
+    """Parse command line options for a local sharded run."""
+    parser = argparse.ArgumentParser(description="Run N shard workers as local processes, then merge their results.")
+    parser.add_argument("shards", type=int, help="Number of shard worker processes.")
+    parser.add_argument("--run-id", help="Id of the sharded run (default: a new id per invocation).")
+    parser.add_argument("--async", dest="async_mode", action="store_true", help="Run Step 2 of every worker with asyncio.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.shards < 1:
+        sys.exit("❌ The number of shards must be at least 1.")
+    run_id = args.run_id or f"local-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')}"
+    sys.exit(run_sharded(args.shards, run_id, ["--async"] if args.async_mode else []))
@@ -0,0 +1,320 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : score_matrix.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script persists the Step 2 scores of every module as a
+                  sparse value-by-value score matrix (.npz) that keeps every
+                  comparison down to a low floor threshold, together with the
+                  user pairs that share each value pair. The re-threshold
+                  command rebuilds the output collection and the clusters for
+                  a new threshold from those matrices, without rerunning Step 2.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timezone
+import numpy as np
+from scipy import sparse
+from compact_results import ResultBatch, RESULT_DTYPE, RESULT_TABLES
+from result_runs import ResultRun
+from user_pairs import user_pair_collection_name
+from memory_budget import MemoryBudget, SCORE_MATRIX_BUFFER_SHARE
+from RankingClustering import RankingClustering
+from mongo_manager import MongoConnectionManager
+from mongodb_writer import MongoDBWriter
+from pipeline_logging import configure_logging
+import config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Per-user fields of a comparison; the score lives in the matrix
+PAIR_FIELDS = ("role1", "user1", "key1", "value1", "role2", "user2", "key2", "value2", "long_text")
+
+# Run directories are named run_<id>; the manifest names the one the re-threshold command reads
+RUN_PREFIX = "run_"
+MANIFEST = "manifest.json"
+
+def module_matrix_path(directory, module):
+    """File holding the score matrix of one module. Hashed, since module names may not be valid file names."""
+    return os.path.join(directory, hashlib.sha1(module.encode("utf-8")).hexdigest()[:16] + ".npz")
+
+def read_manifest(directory):
+    """
+    Return the manifest of the last complete Step 2 run saved in a directory.
+
+    Returns:
+        dict | None: run (directory name), floor, threshold and modules (module -> file), or None if none was saved.
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+def manifest_paths(directory, manifest):
+    """The matrix files of the run a manifest describes."""
+    run_directory = os.path.join(directory, manifest["run"])
+    return [os.path.join(run_directory, name) for _, name in sorted(manifest["modules"].items())]
+
+def _pack_texts(texts):
+    """Encode texts as one UTF-8 byte array plus offsets, which loads without pickle."""
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(data) for data in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def _unpack_texts(blob, offsets):
+    data = blob.tobytes()
+    return [data[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])]
+
+def _local_ids(global_ids, table):
+    """Renumber global table ids densely; returns the local ids and the texts they stand for."""
+    unique_ids, local = np.unique(global_ids, return_inverse=True)
+    return local.astype(np.uint32), [table.text(int(entry_id)) for entry_id in unique_ids]
+
+class ScoreMatrixWriter:
+    """
+    Collects Step 2 result rows down to the floor threshold and saves one score matrix per module.
+    Each run writes to its own run_<id> directory; the manifest is switched to it once every module is saved,
+    and older run directories are then removed. Under a memory budget, buffered rows beyond their share are
+    spilled to the run directory.
+    """
+
+    def __init__(self, directory=None, floor=None, memory_budget=None):
+        self.directory = directory or config.SCORE_MATRIX_DIR
+        self.floor = config.SCORE_MATRIX_FLOOR if floor is None else floor
+        self.run = RUN_PREFIX + datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
+        self.run_directory = os.path.join(self.directory, self.run)
+        self._parts = {}  # module id -> list of row arrays
+        self._spills = {}  # module id -> list of spilled part files
+        self._buffered = 0
+        budget = memory_budget or MemoryBudget()
+        self._max_buffered = max(1, budget.share(SCORE_MATRIX_BUFFER_SHARE) // RESULT_DTYPE.itemsize) if budget.enabled else None
+        self._tables = RESULT_TABLES
+
+    def add(self, batch):
+        """Keep the rows of a ResultBatch."""
+        if batch is None or not len(batch):
+            return
+        self._tables = batch.tables
+        for module_id in np.unique(batch.rows["module"]):
+            self._parts.setdefault(int(module_id), []).append(batch.rows[batch.rows["module"] == module_id])
+        self._buffered += len(batch)
+        if self._max_buffered is not None and self._buffered > self._max_buffered:
+            self._spill()
+
+    def _spill(self):
+        """Move the buffered rows of every module to part files in the run directory."""
+        os.makedirs(self.run_directory, exist_ok=True)
+        for module_id, parts in self._parts.items():
+            spills = self._spills.setdefault(module_id, [])
+            path = os.path.join(self.run_directory, f"module-{module_id}.part{len(spills)}.npy")
+            np.save(path, np.concatenate(parts), allow_pickle=False)
+            spills.append(path)
+        self._parts = {}
+        self._buffered = 0
+
+    def _module_rows(self, module_id):
+        """All rows of a module, spilled and buffered, in the order they were added."""
+        parts = [np.load(path, allow_pickle=False) for path in self._spills.get(module_id, [])]
+        parts.extend(self._parts.get(module_id, []))
+        for path in self._spills.get(module_id, []):
+            os.remove(path)
+        return np.concatenate(parts)
+
+    def save(self, threshold):
+        """Write the matrix of every module seen and point the manifest at this run. Returns the number of files written."""
+        os.makedirs(self.run_directory, exist_ok=True)
+        modules = {}
+        for module_id in sorted(set(self._parts) | set(self._spills)):
+            module = self._tables.modules.text(module_id)
+            rows = self._module_rows(module_id)
+            path = module_matrix_path(self.run_directory, module)
+            self._save_module(path, module, rows, threshold)
+            modules[module] = os.path.basename(path)
+            logger.info(f"Saved score matrix of module '{module}' ({len(rows)} comparisons) to '{path}'.")
+        self._parts, self._spills, self._buffered = {}, {}, 0
+
+        manifest = {
+            "run": self.run, "floor": self.floor, "threshold": threshold, "modules": modules,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        # Written to a temporary file and renamed, so the re-threshold command never reads a partial manifest
+        temporary = os.path.join(self.directory, f"{MANIFEST}.{self.run}.tmp")
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=2)
+        os.replace(temporary, os.path.join(self.directory, MANIFEST))
+        self._remove_old_runs()
+        return len(modules)
+
+    def _remove_old_runs(self):
+        """Remove the matrices of earlier runs; runs started later may still be writing and are kept."""
+        for path in glob.glob(os.path.join(self.directory, f"{RUN_PREFIX}*")):
+            if os.path.isdir(path) and os.path.basename(path) < self.run:
+                shutil.rmtree(path, ignore_errors=True)
+        # Matrices saved directly in the directory by earlier versions
+        for path in glob.glob(os.path.join(self.directory, "*.npz")):
+            os.remove(path)
+
+    def _save_module(self, path, module, rows, threshold):
+        tables = self._tables
+        count = len(rows)
+        # Both sides share one value index, so the matrix is square over the module's values
+        value_ids, values = _local_ids(np.concatenate([rows["value1"], rows["value2"]]), tables.values)
+        value1, value2 = value_ids[:count], value_ids[count:]
+        role_ids, roles = _local_ids(np.concatenate([rows["role1"], rows["role2"]]), tables.roles)
+        key_ids, keys = _local_ids(np.concatenate([rows["key1"], rows["key2"]]), tables.keys)
+
+        # Every comparison of the same value pair has the same score; keep one entry per pair
+        _, first = np.unique(value1.astype(np.int64) * len(values) + value2, return_index=True)
+        matrix = sparse.csr_matrix(
+            (rows["score"][first], (value1[first], value2[first])), shape=(len(values), len(values)), dtype=np.float32
+        )
+        value_blob, value_offsets = _pack_texts(values)
+        role_blob, role_offsets = _pack_texts(roles)
+        key_blob, key_offsets = _pack_texts(keys)
+        np.savez_compressed(
+            path,
+            module=np.array(module), floor=np.float64(self.floor), threshold=np.float64(threshold),
+            data=matrix.data, indices=matrix.indices, indptr=matrix.indptr, shape=np.array(matrix.shape),
+            value_blob=value_blob, value_offsets=value_offsets,
+            role_blob=role_blob, role_offsets=role_offsets,
+            key_blob=key_blob, key_offsets=key_offsets,
+            role1=role_ids[:count], user1=rows["user1"], key1=key_ids[:count], value1=value1,
+            role2=role_ids[count:], user2=rows["user2"], key2=key_ids[count:], value2=value2,
+            long_text=rows["long_text"],
+        )
+
+class ModuleScoreMatrix:
+    """The saved score matrix and comparisons of one module."""
+
+    def __init__(self, path):
+        with np.load(path, allow_pickle=False) as data:
+            self.module = str(data["module"])
+            self.floor = float(data["floor"])
+            self.threshold = float(data["threshold"])
+            self.matrix = sparse.csr_matrix((data["data"], data["indices"], data["indptr"]), shape=tuple(data["shape"]))
+            self.values = _unpack_texts(data["value_blob"], data["value_offsets"])
+            self.roles = _unpack_texts(data["role_blob"], data["role_offsets"])
+            self.keys = _unpack_texts(data["key_blob"], data["key_offsets"])
+            self.pairs = {field: data[field] for field in PAIR_FIELDS}
+
+    def __len__(self):
+        return len(self.pairs["user1"])
+
+    @staticmethod
+    def read_floor(path):
+        """Read only the floor threshold a matrix was saved with."""
+        with np.load(path, allow_pickle=False) as data:
+            return float(data["floor"])
+
+    def results(self, threshold, tables=None):
+        """Return the comparisons scoring at least the threshold as a ResultBatch."""
+        if threshold < self.floor:
+            raise ValueError(f"❌ Threshold {threshold} is below the floor {self.floor} the matrix of '{self.module}' was saved with.")
+        tables = tables or RESULT_TABLES
+        scores = np.asarray(self.matrix[self.pairs["value1"], self.pairs["value2"]]).ravel()
+        keep = scores >= threshold
+        value_ids = np.array([tables.values.intern(text) for text in self.values], dtype=np.uint32)
+        role_ids = np.array([tables.roles.intern(text) for text in self.roles], dtype=np.uint32)
+        key_ids = np.array([tables.keys.intern(text) for text in self.keys], dtype=np.uint32)
+
+        rows = np.empty(int(keep.sum()), dtype=RESULT_DTYPE)
+        rows["module"] = tables.modules.intern(self.module)
+        for side in ("1", "2"):
+            rows["role" + side] = role_ids[self.pairs["role" + side][keep]]
+            rows["user" + side] = self.pairs["user" + side][keep]
+            rows["key" + side] = key_ids[self.pairs["key" + side][keep]]
+            rows["value" + side] = value_ids[self.pairs["value" + side][keep]]
+        rows["score"] = scores[keep]
+        rows["long_text"] = self.pairs["long_text"][keep]
+        return ResultBatch(rows, tables)
+
+class ReThresholder:
+    """Rebuilds the output collection and the clusters from saved score matrices for a new threshold."""
+
+    def __init__(self, database=None, collection_name_out=None, directory=None, batch_size=1000):
+        self.database = database if database is not None else MongoConnectionManager.get_database(bulk=True)
+        self.collection_name_out = collection_name_out or config.COLLECTION_NAME_OUT
+        self.directory = directory or config.SCORE_MATRIX_DIR
+        self.batch_size = batch_size
+
+    def execute(self, threshold, cluster=True):
+        """Replace the stored results with those scoring at least the threshold, then rank and cluster them."""
+        manifest = read_manifest(self.directory)
+        if manifest is None:
+            raise FileNotFoundError(f"❌ No score matrices found in '{self.directory}'. Run Step 2 with SCORE_MATRIX_DIR set first.")
+        # Only the matrices of the last complete run, never files left by earlier or interrupted runs
+        paths = manifest_paths(self.directory, manifest)
+        floor = max(ModuleScoreMatrix.read_floor(path) for path in paths)
+        if threshold < floor:
+            raise ValueError(f"❌ Threshold {threshold} is below the floor {floor} the score matrices were saved with.")
+        logger.info(f"🔹 Re-thresholding {len(paths)} module score matrices of {manifest['run']} at {threshold}...")
+        if config.USER_PAIR_AGGREGATION:
+            # User-pair scores average every compared key pair, including those below the floor
+            logger.warning("⚠️ The score matrices rebuild key-level results only; user pairs are left as they are.")
+
+        # The current results stay readable until the rebuilt ones are swapped in
+        run = ResultRun(self.database, self.collection_name_out)
+        mongo_writer = MongoDBWriter()
+        total = 0
+        for path in paths:
+            matrix = ModuleScoreMatrix(path)
+            results = matrix.results(threshold)
+            for start in range(0, len(results), self.batch_size):
+                mongo_writer.write_result_batch(
+                    run.collection_name, ResultBatch(results.rows[start:start + self.batch_size], results.tables)
+                )
+            logger.info(f"Module '{matrix.module}': {len(results)} of {len(matrix)} comparisons at or above {threshold}.")
+            total += len(results)
+        mongo_writer.write_similarity_count(run.collection_name, total)
+        # The user pairs are not rebuilt, so the current ones stay live
+        run.complete(keep=[user_pair_collection_name(self.collection_name_out)])
+        logger.info(f"✅ Wrote {total} similarity results to '{self.collection_name_out}'.")
+
+        if cluster:
+            RankingClustering(self.database, self.collection_name_out).execute()
+        return total
+
+def parse_args():
+    """Parse command line options for re-thresholding."""
+    parser = argparse.ArgumentParser(description="Rebuild the similarity results and clusters for a new threshold from saved score matrices.")
+    parser.add_argument("--threshold", type=float, required=True, help="New similarity threshold (at least SCORE_MATRIX_FLOOR).")
+    parser.add_argument("--matrix-dir", help="Directory holding the score matrices (default: SCORE_MATRIX_DIR).")
+    parser.add_argument("--no-cluster", action="store_true", help="Only rebuild the output collection; skip ranking and clustering.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    configure_logging()
+    try:
+        ReThresholder(directory=args.matrix_dir).execute(args.threshold, cluster=not args.no_cluster)
+    finally:
+        MongoConnectionManager.close_all()
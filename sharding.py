@@ -0,0 +1,199 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : sharding.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script supports running full profile matching across
+                  several workers. It estimates the pair count of each module,
+                  deterministically assigns modules to shards so that every
+                  shard gets a similar amount of work, names the shard-tagged
+                  output collections, shares the Step 1 result between workers
+                  and lets a coordinator check and merge the finished shards.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from pymongo import ReturnDocument
+from compact_results import ResultTables, iter_result_batches
+from user_pairs import iter_user_pair_batches
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def parse_shard(spec):
+    """
+    Parse a shard spec of the form 'i/N' (0 <= i < N).
+
+    Returns:
+        tuple: (shard_index, shard_count)
+
+    Raises:
+        ValueError: If the spec is malformed or out of range.
+    """
+    try:
+        index, count = (int(part) for part in str(spec).split("/"))
+    except ValueError:
+        raise ValueError(f"❌ Invalid shard '{spec}'. Expected the form i/N, e.g. 0/4.")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"❌ Invalid shard '{spec}'. The index must satisfy 0 <= i < N.")
+    return index, count
+
+def estimate_module_costs(profile_counts):
+    """Estimate the number of profile pairs Step 2 compares in each module (ordered pairs of different roles)."""
+    costs = {}
+    for module, roles in profile_counts.items():
+        total = sum(roles.values())
+        costs[module] = sum(count * (total - count) for count in roles.values())
+    return costs
+
+def assign_modules(module_costs, shard_count):
+    """
+    Assign modules to shards, largest first, always to the least loaded shard.
+    Ties are broken by name and shard index so every worker computes the same assignment.
+
+    Returns:
+        list: One list of module names per shard.
+    """
+    shards = [[] for _ in range(shard_count)]
+    loads = [0] * shard_count
+    for module, cost in sorted(module_costs.items(), key=lambda item: (-item[1], item[0])):
+        target = min(range(shard_count), key=lambda index: (loads[index], index))
+        shards[target].append(module)
+        loads[target] += cost
+    for index, (modules, load) in enumerate(zip(shards, loads)):
+        logger.info(f"Shard {index}/{shard_count}: {len(modules)} modules, ~{load} profile pairs.")
+    return shards
+
+def shard_collection_name(collection_name_out, shard_index, shard_count):
+    """Name of the output collection written by one shard."""
+    return f"{collection_name_out}__shard_{shard_index}_of_{shard_count}"
+
+def shard_registry_name(collection_name_out):
+    """Name of the collection holding the shared Step 1 result and shard completion markers."""
+    return f"{collection_name_out}__shards"
+
+def _step1_id(run_id, shard_count):
+    return f"{run_id}:step1_of_{shard_count}"
+
+def _shard_id(run_id, shard_index, shard_count):
+    return f"{run_id}:shard_{shard_index}_of_{shard_count}"
+
+def read_step1_result(database, collection_name_out, run_id, shard_count):
+    """
+    Return the Step 1 result shared by a worker of this sharded run.
+
+    Returns:
+        tuple | None: (top_comparable_keys, key_alignment), or None if no worker has published one yet.
+    """
+    shared = database[shard_registry_name(collection_name_out)].find_one({"_id": _step1_id(run_id, shard_count)})
+    if shared is None:
+        return None
+    return json.loads(shared["top_comparable_keys"]), json.loads(shared["key_alignment"])
+
+def wait_for_step1_result(database, collection_name_out, run_id, shard_count, timeout, poll_interval=2.0):
+    """Wait up to timeout seconds for another worker of this run to share its Step 1 result; None if none does."""
+    deadline = time.monotonic() + timeout
+    while True:
+        shared = read_step1_result(database, collection_name_out, run_id, shard_count)
+        if shared is not None or time.monotonic() >= deadline:
+            return shared
+        time.sleep(poll_interval)
+
+def share_step1_result(database, collection_name_out, run_id, shard_count, top_comparable_keys, key_alignment):
+    """
+    Publish this worker's Step 1 result unless another worker of the run already did, and return the shared one.
+    Step 1 samples randomly, so all shards must use the same keys to produce consistent output.
+    """
+    registry = database[shard_registry_name(collection_name_out)]
+    shared = registry.find_one_and_update(
+        {"_id": _step1_id(run_id, shard_count)},
+        {"$setOnInsert": {
+            "run_id": run_id,
+            # Stored as JSON because profile keys may contain characters MongoDB does not allow in field names
+            "top_comparable_keys": json.dumps(top_comparable_keys),
+            "key_alignment": json.dumps(key_alignment),
+            "created_at": datetime.now(timezone.utc),
+        }},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return json.loads(shared["top_comparable_keys"]), json.loads(shared["key_alignment"])
+
+def mark_shard_complete(database, collection_name_out, run_id, shard_index, shard_count, modules, result_count):
+    """Record that a shard of a run finished, so the coordinator knows its output is complete."""
+    registry = database[shard_registry_name(collection_name_out)]
+    registry.update_one(
+        {"_id": _shard_id(run_id, shard_index, shard_count)},
+        {"$set": {
+            "run_id": run_id,
+            "shard_index": shard_index,
+            "shard_count": shard_count,
+            "modules": modules,
+            "result_count": result_count,
+            "collection": shard_collection_name(collection_name_out, shard_index, shard_count),
+            "completed_at": datetime.now(timezone.utc),
+        }},
+        upsert=True,
+    )
+
+def completed_shards(database, collection_name_out, run_id, shard_count):
+    """Return the completion markers of the shards of an N-way run, keyed by shard index."""
+    registry = database[shard_registry_name(collection_name_out)]
+    markers = registry.find({"run_id": run_id, "shard_count": shard_count, "completed_at": {"$exists": True}})
+    return {marker["shard_index"]: marker for marker in markers}
+
+def _require_complete(database, collection_name_out, run_id, shard_count):
+    """
+    Raises:
+        RuntimeError: If some shards of the run have not completed yet.
+    """
+    markers = completed_shards(database, collection_name_out, run_id, shard_count)
+    missing = sorted(set(range(shard_count)) - set(markers))
+    if missing:
+        raise RuntimeError(f"❌ Shards {missing} of {shard_count} of run '{run_id}' have not completed yet.")
+
+def clear_run(database, collection_name_out, run_id):
+    """Remove the shared Step 1 result and the completion markers of a merged run."""
+    database[shard_registry_name(collection_name_out)].delete_many({"run_id": run_id})
+
+def iter_shard_results(database, collection_name_out, run_id, shard_count, batch_size=1000):
+    """
+    Yield ResultBatch objects with the similarity results of every shard of an N-way run.
+
+    Raises:
+        RuntimeError: If some shards have not completed yet.
+    """
+    _require_complete(database, collection_name_out, run_id, shard_count)
+    for shard_index in range(shard_count):
+        # One id table per shard, so a compact merge stores one table set per shard rather than per batch
+        yield from iter_result_batches(
+            database, shard_collection_name(collection_name_out, shard_index, shard_count), batch_size, tables=ResultTables()
+        )
+
+def iter_shard_user_pairs(database, collection_name_out, run_id, shard_count, batch_size=1000):
+    """Yield UserPairBatch objects with the user pairs of every shard of an N-way run (all shards must be complete)."""
+    _require_complete(database, collection_name_out, run_id, shard_count)
+    for shard_index in range(shard_count):
+        yield from iter_user_pair_batches(database, shard_collection_name(collection_name_out, shard_index, shard_count), batch_size)
@@ -30,6 +30,7 @@ For questions or permissions, please contact: info@gofreelab.com
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 import logging
+from embedding import EmbeddingHandler
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -72,7 +73,13 @@ class SimilarityCalculator:
             if value in embeddings_cache:
                 return embeddings_cache[value]
             
-            embedding = nlp_model(str(value)).vector
+            if nlp_model is None:
+                # No SpaCy model given: encode with the handler's active policy instead
+                embedding = EmbeddingHandler.get_embedding(str(value))
+                if embedding is None:
+                    return None
+            else:
+                embedding = nlp_model(str(value)).vector
             
             # Check for NaN values
             if np.isnan(embedding).any():
@@ -0,0 +1,264 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : stage_profiler.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script provides on-demand profiling of pipeline stages.
+                  A stage selected with PROFILE_STAGES (or main.py --profile)
+                  runs under cProfile, a sampling profiler when pyinstrument is
+                  installed, and tracemalloc. Dask and executor tasks wrapped
+                  with profiled_task are profiled in their worker threads or
+                  processes too. Per-stage profile files and top-N reports are
+                  written to PROFILE_DIR.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import cProfile
+import functools
+import glob
+import io
+import logging
+import multiprocessing
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import config
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:  # Optional: the sampling profiler is skipped without it
+    SamplingProfiler = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CPROFILE = "cprofile"
+SAMPLING = "sampling"
+TRACEMALLOC = "tracemalloc"
+PROFILERS = (CPROFILE, SAMPLING, TRACEMALLOC)
+
+_local = threading.local()
+_lock = threading.Lock()
+_worker_profilers = {}  # stage -> cProfile.Profile of every worker thread of this process
+_generations = {}  # stage -> number of times it was profiled, so pooled threads start fresh each time
+_stage_threads = set()  # Threads whose stage profiler already covers the tasks they run
+
+def _split(value):
+    return [item.strip().lower() for item in value.split(",") if item.strip()]
+
+def enable_profiling(stages, profilers=None):
+    """
+    Turn profiling on for the given stages (comma-separated names or "all") from the command line.
+    The settings are also exported to the environment so worker processes pick them up.
+    """
+    config.PROFILE_STAGES = stages
+    os.environ["PROFILE_STAGES"] = stages
+    if profilers:
+        config.PROFILERS = profilers
+        os.environ["PROFILERS"] = profilers
+    unknown = set(_split(config.PROFILERS)) - set(PROFILERS)
+    if unknown:
+        raise ValueError(f"❌ Unknown profilers: {', '.join(sorted(unknown))}. Expected some of: {', '.join(PROFILERS)}")
+
+def is_profiled(stage):
+    """Whether the stage is selected for profiling."""
+    stages = _split(config.PROFILE_STAGES)
+    return "all" in stages or stage.lower() in stages
+
+def active_profilers(stage):
+    """The profilers to run for a stage (empty when it is not profiled)."""
+    return _split(config.PROFILERS) if is_profiled(stage) else []
+
+def _in_worker_process():
+    """Whether this is a worker process started by multiprocessing (e.g. the dask processes scheduler)."""
+    return multiprocessing.parent_process() is not None
+
+def _worker_profile_path(stage, task):
+    return os.path.join(config.PROFILE_DIR, f"{stage}.worker-{task}.prof")
+
+def _worker_profiler(stage):
+    """The cProfile profiler of the current worker thread for a stage, or None when none should run."""
+    if CPROFILE not in active_profilers(stage) or threading.get_ident() in _stage_threads:
+        return None
+    if _in_worker_process():
+        # Worker processes keep no state between tasks; each task's stats go to their own file
+        return cProfile.Profile()
+    profilers = getattr(_local, "profilers", None)
+    if profilers is None:
+        profilers = _local.profilers = {}
+    generation = _generations.get(stage, 0)
+    if stage not in profilers or profilers[stage][0] != generation:
+        profilers[stage] = (generation, cProfile.Profile())
+        with _lock:
+            _worker_profilers.setdefault(stage, []).append(profilers[stage][1])
+    return profilers[stage][1]
+
+class ProfiledTask:
+    """A task function that runs under cProfile in its worker thread or process when its stage is profiled."""
+
+    def __init__(self, stage, function):
+        self.stage = stage
+        self.function = function
+        # Keep the function's name for dask task keys; instances pickle by value for process workers
+        functools.update_wrapper(self, function)
+
+    def __call__(self, *args, **kwargs):
+        profiler = _worker_profiler(self.stage)
+        if profiler is None:
+            return self.function(*args, **kwargs)
+        try:
+            profiler.enable()
+        except ValueError:  # Another profiler is active in this thread
+            return self.function(*args, **kwargs)
+        try:
+            return self.function(*args, **kwargs)
+        finally:
+            profiler.disable()
+            if _in_worker_process():
+                os.makedirs(config.PROFILE_DIR, exist_ok=True)
+                profiler.dump_stats(_worker_profile_path(self.stage, f"{os.getpid()}-{time.time_ns()}"))
+
+def profiled_task(stage, function):
+    """
+    Wrap a task function so it runs under cProfile in its worker thread or process when the stage is profiled.
+    Worker threads are merged in memory at the end of the stage; in worker processes every task
+    writes its stats to PROFILE_DIR, and those files are merged at the end of the stage.
+    """
+    return ProfiledTask(stage, function)
+
+class StageProfiler:
+    """Context manager that profiles one pipeline stage with the configured profilers."""
+
+    def __init__(self, stage, directory=None, top_n=None):
+        self.stage = stage
+        self.directory = directory or config.PROFILE_DIR
+        self.top_n = top_n or config.PROFILE_TOP_N
+        self.profilers = active_profilers(stage)
+        self._cprofile = None
+        self._sampler = None
+        self._started_tracemalloc = False
+        self._snapshot = None
+
+    def __enter__(self):
+        if not self.profilers:
+            return self
+        os.makedirs(self.directory, exist_ok=True)
+        # Stale stats of an earlier run's worker processes must not be merged into this one
+        for path in glob.glob(_worker_profile_path(self.stage, "*")):
+            os.remove(path)
+        with _lock:
+            _worker_profilers.pop(self.stage, None)
+            _generations[self.stage] = _generations.get(self.stage, 0) + 1
+        if TRACEMALLOC in self.profilers:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(config.PROFILE_TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            tracemalloc.reset_peak()
+            self._snapshot = tracemalloc.take_snapshot()
+        if SAMPLING in self.profilers:
+            if SamplingProfiler is None:
+                logger.warning("⚠️ Sampling profiler requested but pyinstrument is not installed; skipping it.")
+            else:
+                self._sampler = SamplingProfiler()
+                self._sampler.start()
+        if CPROFILE in self.profilers:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+            _stage_threads.add(threading.get_ident())
+        logger.info(f"🔹 Profiling {self.stage} with {', '.join(self.profilers)}.")
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.profilers:
+            return False
+        elapsed = time.perf_counter() - self._start
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            _stage_threads.discard(threading.get_ident())
+        if self._sampler is not None:
+            self._sampler.stop()
+        # Report allocations before writing the other reports allocates anything
+        if self._snapshot is not None:
+            self._write_tracemalloc()
+        if self._cprofile is not None:
+            self._write_cprofile(elapsed)
+        if self._sampler is not None:
+            self._write(f"{self.stage}.sampling.txt", self._sampler.output_text(unicode=True, color=False))
+            self._write(f"{self.stage}.sampling.html", self._sampler.output_html())
+        logger.info(f"✅ Profiles of {self.stage} written to '{self.directory}'.")
+        return False
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write(self, name, text):
+        with open(self._path(name), "w", encoding="utf-8") as file:
+            file.write(text)
+
+    def _write_cprofile(self, elapsed):
+        """Save the stage's own stats, the merged stats of its workers, and a combined top-N report."""
+        self._cprofile.dump_stats(self._path(f"{self.stage}.prof"))
+        with _lock:
+            thread_profilers = _worker_profilers.pop(self.stage, [])
+        worker_stats = None
+        for profiler in thread_profilers:
+            profiler.create_stats()
+            if not profiler.stats:
+                continue
+            if worker_stats is None:
+                worker_stats = pstats.Stats(profiler)
+            else:
+                worker_stats.add(profiler)
+        for path in glob.glob(_worker_profile_path(self.stage, "*")):
+            if worker_stats is None:
+                worker_stats = pstats.Stats(path)
+            else:
+                worker_stats.add(path)
+            os.remove(path)
+
+        report = io.StringIO()
+        report.write(f"{self.stage}: {elapsed:.2f} s wall time\n\n")
+        combined = pstats.Stats(self._cprofile, stream=report)
+        if worker_stats is not None:
+            worker_stats.dump_stats(self._path(f"{self.stage}.workers.prof"))
+            combined.add(worker_stats)
+            report.write("Stage thread and worker tasks combined; worker time overlaps the stage thread's wait.\n\n")
+        combined.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_n)
+        combined.sort_stats(pstats.SortKey.TIME).print_stats(self.top_n)
+        self._write(f"{self.stage}.cprofile.txt", report.getvalue())
+
+    def _write_tracemalloc(self):
+        """Report the top allocation sites by memory still held at the end of the stage, and the peak."""
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+        differences = snapshot.filter_traces(ignore).compare_to(self._snapshot.filter_traces(ignore), "lineno")
+        lines = [f"{self.stage}: peak traced memory {peak / (1024 * 1024):.1f} MB", "", f"Top {self.top_n} allocation sites (growth during the stage):"]
+        lines.extend(str(difference) for difference in differences[:self.top_n])
+        lines.extend(["", f"Top {self.top_n} allocation sites (held at the end of the stage):"])
+        lines.extend(str(statistic) for statistic in snapshot.filter_traces(ignore).statistics("lineno")[:self.top_n])
+        self._write(f"{self.stage}.tracemalloc.txt", "\n".join(lines) + "\n")
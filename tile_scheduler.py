@@ -0,0 +1,176 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : tile_scheduler.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script partitions the full profile matching work into
+                  tiles of (module, block of one role, block of another role)
+                  with roughly equal estimated cost. Large role pairs are split
+                  into several blocks, tiles are ordered largest first so the
+                  biggest ones do not straggle at the end, and each tile holds
+                  only the profiles it compares. With the profile prefilter,
+                  a tile compares each profile only with its candidates.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import logging
+import math
+from collections import defaultdict
+import numpy as np
+import config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class WorkTile:
+    """
+    Compares every profile of profiles1 with every profile of profiles2 (same module, different roles),
+    or, when candidates is set, profiles1[i] only with the profiles2 at the indices in candidates[i].
+    """
+
+    __slots__ = ("module", "role1", "role2", "profiles1", "profiles2", "cost", "candidates")
+
+    def __init__(self, module, role1, role2, profiles1, profiles2, candidates=None, cost=None):
+        self.module = module
+        self.role1 = role1
+        self.role2 = role2
+        self.profiles1 = profiles1
+        self.profiles2 = profiles2
+        self.candidates = candidates
+        self.cost = block_cost(profiles1) * block_cost(profiles2) if cost is None else cost
+
+    def others(self, index):
+        """The profiles of profiles2 that profiles1[index] is compared with."""
+        if self.candidates is None:
+            return self.profiles2
+        return [self.profiles2[j] for j in self.candidates[index]]
+
+    def __repr__(self):
+        return f"WorkTile({self.module}: {len(self.profiles1)} {self.role1} x {len(self.profiles2)} {self.role2}, cost={self.cost})"
+
+def block_cost(profiles):
+    """Estimated comparison cost of a block of prepared profiles: its number of usable keys."""
+    return sum(len(profile[4]) for profile in profiles)
+
+def split_by_cost(profiles, parts):
+    """Split profiles into at most `parts` consecutive blocks of roughly equal key count."""
+    parts = max(1, min(parts, len(profiles)))
+    if parts == 1:
+        return [profiles]
+    target = block_cost(profiles) / parts
+    blocks, block, block_keys = [], [], 0
+    for profile in profiles:
+        block.append(profile)
+        block_keys += len(profile[4])
+        if block_keys >= target and len(blocks) < parts - 1:
+            blocks.append(block)
+            block, block_keys = [], 0
+    if block:
+        blocks.append(block)
+    return blocks
+
+def candidate_costs(profiles1, profiles2, selected):
+    """Estimated comparison cost of each profile of profiles1 against its selected candidates."""
+    keys2 = np.array([len(profile[4]) for profile in profiles2], dtype=np.int64)
+    return [len(profile[4]) * int(keys2[indices].sum()) for profile, indices in zip(profiles1, selected)]
+
+def _candidate_tiles(module, role1, role2, profiles1, profiles2, selected, target_cost):
+    """Split a prefiltered role pair into tiles of consecutive role1 profiles holding only their candidates."""
+    tiles = []
+    rows, cost = [], 0
+
+    def flush():
+        union = np.unique(np.concatenate([selected[i] for i in rows]))
+        tiles.append(WorkTile(
+            module, role1, role2,
+            [profiles1[i] for i in rows], [profiles2[j] for j in union],
+            candidates=[np.searchsorted(union, selected[i]) for i in rows], cost=cost,
+        ))
+
+    for i, row_cost in enumerate(candidate_costs(profiles1, profiles2, selected)):
+        if not len(selected[i]):
+            continue
+        rows.append(i)
+        cost += row_cost
+        if cost >= target_cost:
+            flush()
+            rows, cost = [], 0
+    if rows:
+        flush()
+    return tiles
+
+def plan_tiles(prepared_pairs, target_tiles=None, min_tile_cost=None, candidates=None):
+    """
+    Partition prepared profiles (module, role, role_index, user_index, prepared) into work tiles.
+
+    Every ordered pair of roles in a module is split into blocks until its tiles cost about
+    total / target_tiles key comparisons (but no less than min_tile_cost), so one giant module
+    does not become a single straggler and tiny modules do not become thousands of tasks.
+    With candidates from ProfilePrefilter.plan, a role pair is split over its role1 profiles
+    by the cost of their candidate comparisons only.
+
+    Returns:
+        list: WorkTile objects, largest estimated cost first.
+    """
+    target_tiles = target_tiles or config.STEP2_WORKERS * config.STEP2_TILES_PER_WORKER
+    min_tile_cost = config.STEP2_MIN_TILE_COST if min_tile_cost is None else min_tile_cost
+
+    profiles_by_role = defaultdict(lambda: defaultdict(list))
+    for profile in prepared_pairs:
+        if profile[4]:  # Profiles without usable keys match nothing
+            profiles_by_role[profile[0]][profile[1]].append(profile)
+
+    role_pairs = [
+        (module, role1, role2, roles[role1], roles[role2])
+        for module, roles in profiles_by_role.items()
+        for role1 in roles
+        for role2 in roles
+        if role1 != role2
+    ]
+    candidates = candidates or {}
+    total_cost = sum(
+        sum(candidate_costs(profiles1, profiles2, candidates[(module, role1, role2)]))
+        if (module, role1, role2) in candidates else block_cost(profiles1) * block_cost(profiles2)
+        for module, role1, role2, profiles1, profiles2 in role_pairs
+    )
+    target_cost = max(total_cost / max(target_tiles, 1), min_tile_cost, 1)
+
+    tiles = []
+    for module, role1, role2, profiles1, profiles2 in role_pairs:
+        if (module, role1, role2) in candidates:
+            tiles.extend(_candidate_tiles(module, role1, role2, profiles1, profiles2, candidates[(module, role1, role2)], target_cost))
+            continue
+        pieces = math.ceil(block_cost(profiles1) * block_cost(profiles2) / target_cost)
+        # Split both sides in proportion to their sizes so blocks stay roughly square
+        blocks1 = min(len(profiles1), max(1, round(math.sqrt(pieces * len(profiles1) / len(profiles2)))))
+        blocks2 = min(len(profiles2), max(1, math.ceil(pieces / blocks1)))
+        for block1 in split_by_cost(profiles1, blocks1):
+            for block2 in split_by_cost(profiles2, blocks2):
+                tiles.append(WorkTile(module, role1, role2, block1, block2))
+
+    tiles.sort(key=lambda tile: tile.cost, reverse=True)
+    if tiles:
+        logger.info(
+            f"Planned {len(tiles)} work tiles over {len(profiles_by_role)} modules "
+            f"(target cost {target_cost:.0f}, largest {tiles[0].cost}, smallest {tiles[-1].cost})."
+        )
+    return tiles
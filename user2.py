@@ -33,29 +33,83 @@ import logging
 from dask import delayed, compute
 from similarity_calculator import SimilarityCalculator
 from mongodb_writer import MongoDBWriter
-from embedding import EmbeddingHandler
+from embedding import EmbeddingHandler, SHORT_TEXT_MAX_LENGTH
 import numpy as np
 from typing import List, Dict, Any
 from db import store_vector_in_db  # Import the standalone function from db.py
+from value_memo import ValueInterner, ValueScoreCache
+from pipeline_logging import StageCounters, SampledLogger
+from memory_budget import MemoryBudget, AdaptiveChunker
+from compact_results import ResultBatch, RESULT_TABLES
+from score_matrix import ScoreMatrixWriter
+from tile_scheduler import plan_tiles
+from profile_prefilter import ProfilePrefilter
+from stage_profiler import profiled_task
+from user_pairs import UserPairAccumulator, UserPairBatch, user_pair_collection_name
+import config
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+hot_path_logger = SampledLogger(logger)
 
 class UserSimilarityAnalyzerFull:
     allowed_keys = {}
+    key_alignment = {}
+    value_interner = ValueInterner()
+    value_score_cache = ValueScoreCache(config.VALUE_SCORE_CACHE_SIZE)
 
     @staticmethod
     def initialize_allowed_keys(allowed_keys):
         """Set allowed keys for filtering user data."""
         UserSimilarityAnalyzerFull.allowed_keys = allowed_keys
 
+    @staticmethod
+    def initialize_key_alignment(key_alignment):
+        """Set the key-to-key alignment map learned in Step 1."""
+        UserSimilarityAnalyzerFull.key_alignment = key_alignment or {}
+
+    @staticmethod
+    def reset_value_state():
+        """
+        Forget the value ids and cached scores of earlier runs. Scores are keyed by value ids only, not by
+        encoder policy or fitted state, so every Step 2 run starts from empty tables.
+        """
+        UserSimilarityAnalyzerFull.value_interner.clear()
+        UserSimilarityAnalyzerFull.value_score_cache.clear()
+
     @staticmethod
     def _filter_keys(user_data, module, role):
         """Filter user data based on allowed keys."""
         allowed = UserSimilarityAnalyzerFull.allowed_keys.get(module, {}).get(role, [])
         return {key: value for key, value in user_data.items() if key in allowed}
 
+    @staticmethod
+    def _aligned_key_pairs(user1_filtered, user2_filtered, module, role1, role2):
+        """
+        Yield the (key1, key2) pairs worth comparing between two filtered profiles.
+        Falls back to the full cross product when Step 1 learned no alignment for this role pair.
+        """
+        role_alignment = UserSimilarityAnalyzerFull.key_alignment.get(module, {}).get(role1, {})
+        if not any(role2 in aligned_roles for aligned_roles in role_alignment.values()):
+            for key1 in user1_filtered:
+                for key2 in user2_filtered:
+                    yield key1, key2
+            return
+        for key1 in user1_filtered:
+            for key2 in role_alignment.get(key1, {}).get(role2, {}):
+                if key2 in user2_filtered:
+                    yield key1, key2
+
+    @staticmethod
+    def _key_pair_weight(module, role1, key1, role2, key2):
+        """
+        Importance of a key pair: how often Step 1 saw the two keys match (find_key_alignment_by_module).
+        Pairs compared without a learned alignment weigh 1.
+        """
+        alignment = UserSimilarityAnalyzerFull.key_alignment.get(module, {}).get(role1, {}).get(key1, {}).get(role2, {})
+        return alignment.get(key2, 1)
+
     @staticmethod
     def generate_key_value_pairs_full(data):
         """Generate key-value pairs from the nested dictionary structure."""
@@ -81,7 +135,7 @@ class UserSimilarityAnalyzerFull:
     def handle_value(value):
         """Ensure the value passed is a string for embeddings calculation; skip non-text or numeric values."""
         if isinstance(value, (int, float, str)) and str(value).isnumeric():
-            logger.warning(f"Skipping numeric value: {value}")
+            hot_path_logger.debug("Skipping numeric value: %s", value)
             return None
         elif isinstance(value, list):
             return " ".join(map(str, value))
@@ -93,104 +147,195 @@ class UserSimilarityAnalyzerFull:
             return value
 
     @staticmethod
-    def _calculate_similarity_for_pair_full(pair, all_key_value_pairs, embeddings_cache, nlp_model, threshold, embedding_handler, database, vector_collection):
+    def canonicalize_value(value):
+        """
+        Return the canonical text of a raw value, or None if it cannot be embedded.
+        List items are ordered, whitespace is collapsed and case is folded so equal values share one id.
+        """
+        if isinstance(value, list):
+            value = sorted(value, key=str)
+        text = UserSimilarityAnalyzerFull.handle_value(value)
+        if text is None or not isinstance(text, str):
+            return None
+        return " ".join(text.split()).casefold()
+
+    @staticmethod
+    def _prepare_profile(user_data, counters):
+        """Map each usable key of a filtered profile to its (display value, value id)."""
+        prepared = {}
+        for key, raw_value in user_data.items():
+            canonical = UserSimilarityAnalyzerFull.canonicalize_value(raw_value)
+            if canonical is None:
+                counters.increment(StageCounters.SKIPPED_NUMERIC)
+                hot_path_logger.debug("Skipping key due to invalid or numeric value: %s", key)
+                continue
+            if not canonical:
+                counters.increment(StageCounters.EMPTY_TEXT)
+                hot_path_logger.debug("Empty text detected for key %s. Skipping embedding.", key)
+                continue
+            display_value = UserSimilarityAnalyzerFull.handle_value(raw_value).strip()
+            prepared[key] = (display_value, UserSimilarityAnalyzerFull.value_interner.intern(canonical))
+        return prepared
+
+    @staticmethod
+    def prepare_key_value_pairs(all_key_value_pairs, counters=None):
+        """Filter every profile once and intern its values, keeping the key-value pair tuple layout."""
+        counters = counters if counters is not None else StageCounters()
+        return [
+            (module, role, role_index, user_index,
+             UserSimilarityAnalyzerFull._prepare_profile(UserSimilarityAnalyzerFull._filter_keys(user, module, role), counters))
+            for module, role, role_index, user_index, user in all_key_value_pairs
+        ]
+
+    @staticmethod
+    def _score_value_pair(value_id1, value_id2, threshold, embedding_handler, database, vector_collection, counters):
+        """
+        Score two interned values, memoized per unordered value-id pair.
+        Returns (similarity_score or None, long_text).
+        """
+        if value_id1 == value_id2:
+            # Identical canonical values need no embedding
+            text = UserSimilarityAnalyzerFull.value_interner.text(value_id1)
+            return 1.0, len(text) >= SHORT_TEXT_MAX_LENGTH
+
+        def compute_score():
+            text1 = UserSimilarityAnalyzerFull.value_interner.text(value_id1)
+            text2 = UserSimilarityAnalyzerFull.value_interner.text(value_id2)
+            # The policy picks one encoder for both texts, so mixed-length pairs are scored too.
+            encoder = embedding_handler.select_encoder(text1, text2)
+            long_text = len(text1) >= SHORT_TEXT_MAX_LENGTH or len(text2) >= SHORT_TEXT_MAX_LENGTH
+            emb1 = embedding_handler.get_embedding(text1, encoder)
+            emb2 = embedding_handler.get_embedding(text2, encoder)
+            if emb1 is None or emb2 is None:
+                hot_path_logger.debug("One or both %s embeddings are None for values (%s, %s).", encoder, value_id1, value_id2)
+                return None, long_text
+            similarity_score = SimilarityCalculator.calculate_cosine_similarity(emb1, emb2)
+            if similarity_score is None:
+                logger.warning(f"Similarity calculation returned None for values ({value_id1}, {value_id2}).")
+                return None, long_text
+            similarity_score = float(similarity_score)
+            if long_text and similarity_score >= threshold:
+                # Build and store the combined document for long texts.
+                combined_doc = {
+                    "text1": text1,
+                    "vector1": emb1,
+                    "text2": text2,
+                    "vector2": emb2
+                }
+                try:
+                    store_vector_in_db(combined_doc, database, vector_collection)
+                except Exception as e:
+                    logger.error(f"Error storing combined long text document for values ({value_id1}, {value_id2}): {e}")
+            return similarity_score, long_text
+
+        entry = UserSimilarityAnalyzerFull.value_score_cache.get_or_compute(value_id1, value_id2, compute_score)
+        # Counted per comparison, cache hits included; a missing or unusable (NaN) embedding leaves no score
+        if entry[0] is None:
+            counters.increment(StageCounters.NONE_EMBEDDING)
+        return entry
+
+    @staticmethod
+    def _calculate_similarity_for_pair_full(pair, all_key_value_pairs, embeddings_cache, nlp_model, threshold, embedding_handler, database, vector_collection, floor=None):
         """
         Calculate similarity scores for a pair of key-value pairs.
-        Returns a dictionary with key 'similarity' containing all similarity result dictionaries.
-        Both short text (long_text=False) and long text (long_text=True) similarity results are appended.
+        Expects profiles prepared by prepare_key_value_pairs (key -> (value, value id)).
+        Returns a dictionary with key 'similarity' holding the matches as a compact ResultBatch.
+        With a floor below the threshold, 'below_threshold' holds the comparisons scoring between the two;
+        with USER_PAIR_AGGREGATION, 'user_pairs' holds a UserPairBatch.
+        Each distinct value pair is scored once and the score is reused for every user pair sharing it;
+        results involving a text of 150+ characters are flagged long_text=True.
         """
-        sim_results = []
-        module1, role1, _, user1_index, user1 = pair
-        user1_filtered = UserSimilarityAnalyzerFull._filter_keys(user1, module1, role1)
+        sim_rows = []
+        below_rows = []
+        floor = threshold if floor is None else min(floor, threshold)
+        counters = StageCounters()
+        user_pair_rows = [] if config.USER_PAIR_AGGREGATION else None
+        module1, role1, _, user1_index, _ = pair
+        UserSimilarityAnalyzerFull._compare_profile(
+            pair, all_key_value_pairs, threshold, floor, embedding_handler, database, vector_collection,
+            counters, sim_rows, below_rows, user_pair_rows
+        )
+        counters.log_summary(logger, f"Task {module1}/{role1} #{user1_index}")
+        result = {"similarity": ResultBatch.from_tuples(sim_rows), "counters": counters.as_dict()}
+        if floor < threshold:
+            result["below_threshold"] = ResultBatch.from_tuples(below_rows)
+        if user_pair_rows is not None:
+            result["user_pairs"] = UserPairBatch.from_tuples(user_pair_rows)
+        return result
 
-        logger.info(f"Checking pair: {pair}")
+    @staticmethod
+    def _calculate_similarity_for_tile(tile, threshold, embedding_handler, database, vector_collection, floor=None):
+        """
+        Calculate similarity scores for a WorkTile: every profile of its first block against every
+        profile of its second block. Returns the same dictionary as _calculate_similarity_for_pair_full.
+        """
+        sim_rows = []
+        below_rows = []
+        floor = threshold if floor is None else min(floor, threshold)
+        counters = StageCounters()
+        user_pair_rows = [] if config.USER_PAIR_AGGREGATION else None
+        for index, pair in enumerate(tile.profiles1):
+            UserSimilarityAnalyzerFull._compare_profile(
+                pair, tile.others(index), threshold, floor, embedding_handler, database, vector_collection,
+                counters, sim_rows, below_rows, user_pair_rows
+            )
+        counters.log_summary(logger, f"Tile {tile.module}: {len(tile.profiles1)} {tile.role1} x {len(tile.profiles2)} {tile.role2}")
+        result = {"similarity": ResultBatch.from_tuples(sim_rows), "counters": counters.as_dict()}
+        if floor < threshold:
+            result["below_threshold"] = ResultBatch.from_tuples(below_rows)
+        if user_pair_rows is not None:
+            result["user_pairs"] = UserPairBatch.from_tuples(user_pair_rows)
+        return result
 
-        for module2, role2, _, user2_index, user2 in all_key_value_pairs:
-            user2_filtered = UserSimilarityAnalyzerFull._filter_keys(user2, module2, role2)
+    @staticmethod
+    def _compare_profile(pair, other_pairs, threshold, floor, embedding_handler, database, vector_collection, counters, sim_rows, below_rows, user_pair_rows=None):
+        """
+        Compare one prepared profile with profiles of the same module and another role, appending
+        result row tuples scoring at least the threshold to sim_rows and those between floor and threshold to below_rows.
+        When user_pair_rows is given, each user pair with a match also gets one row there, scored by the
+        key-weighted mean of all its key-level scores.
+        """
+        module1, role1, _, user1_index, user1_prepared = pair
+        module_id, role1_id = RESULT_TABLES.modules.intern(module1), RESULT_TABLES.roles.intern(role1)
+
+        hot_path_logger.debug("Checking profile %s/%s #%s", module1, role1, user1_index)
+
+        for module2, role2, _, user2_index, user2_prepared in other_pairs:
             # Process only if modules are the same but roles differ.
-            if module1 == module2 and (role1 != role2 and user1_filtered and user2_filtered):
-                for key1, raw_value1 in user1_filtered.items():
-                    for key2, raw_value2 in user2_filtered.items():
-                        # Preprocess values.
-                        value1 = UserSimilarityAnalyzerFull.handle_value(raw_value1)
-                        value2 = UserSimilarityAnalyzerFull.handle_value(raw_value2)
-                        if value1 is None or value2 is None or not isinstance(value1, str) or not isinstance(value2, str):
-                            logger.debug(f"Skipping pair due to invalid or numeric value: ({key1}, {key2})")
-                            continue
-                        # Trim texts.
-                        value1 = value1.strip()
-                        value2 = value2.strip()
-                        if not value1 or not value2:
-                            logger.warning(f"Empty text detected for keys ({key1}, {key2}). Skipping embedding.")
+            if module1 == module2 and (role1 != role2 and user1_prepared and user2_prepared):
+                pair_score = UserPairAccumulator() if user_pair_rows is not None else None
+                for key1, key2 in UserSimilarityAnalyzerFull._aligned_key_pairs(user1_prepared, user2_prepared, module1, role1, role2):
+                    value1, value_id1 = user1_prepared[key1]
+                    value2, value_id2 = user2_prepared[key2]
+                    try:
+                        similarity_score, long_text = UserSimilarityAnalyzerFull._score_value_pair(
+                            value_id1, value_id2, threshold, embedding_handler, database, vector_collection, counters
+                        )
+                        if similarity_score is None:
                             continue
-
-                        # logger.info(f"Processing pair for keys ({key1}, {key2}).")
-                        len_value1 = len(value1)
-                        len_value2 = len(value2)
-
-                        # Case 1: Both texts are short.
-                        if len_value1 < 150 and len_value2 < 150:
-                            try:
-                                emb1 = embedding_handler.get_word_embedding(value1)
-                                emb2 = embedding_handler.get_word_embedding(value2)
-                                if emb1 is None or emb2 is None:
-                                    logger.warning(f"One or both embeddings are None for pair ({key1}, {key2}).")
-                                    continue
-                                similarity_score = SimilarityCalculator.calculate_cosine_similarity(emb1, emb2)
-                                if similarity_score is None:
-                                    logger.warning(f"Similarity calculation returned None for pair ({key1}, {key2}).")
-                                    continue
-                                similarity_score = float(similarity_score)
-                                if similarity_score >= threshold:
-                                    sim_results.append({
-                                        "user1": {"module": module1, "role": role1, "user_index": user1_index, "key": key1, "value": value1},
-                                        "user2": {"module": module2, "role": role2, "user_index": user2_index, "key": key2, "value": value2},
-                                        "similarity_score": similarity_score,
-                                        "long_text": False
-                                    })
-                                    # logger.info(f"Short text similarity for pair ({key1}, {key2}): {similarity_score}")
-                                else:
-                                    logger.info(f"Short text similarity for pair ({key1}, {key2}) below threshold: {similarity_score}")
-                            except Exception as e:
-                                logger.error(f"Error calculating similarity for pair ({key1}, {key2}): {e}")
-                        # Case 2: One or both texts are long.
-                        elif len_value1 >= 150 and len_value2 >= 150:
-                            try:
-                                emb1 = embedding_handler.get_sentence_bert_embedding(value1)
-                                emb2 = embedding_handler.get_sentence_bert_embedding(value2)
-                                if emb1 is None or emb2 is None:
-                                    logger.warning(f"One or both Sentence-BERT embeddings are None for pair ({key1}, {key2}).")
-                                    continue
-                                similarity_score = SimilarityCalculator.calculate_cosine_similarity(emb1, emb2)
-                                if similarity_score is None:
-                                    logger.warning(f"Long text similarity returned None for pair ({key1}, {key2}).")
-                                    continue
-                                similarity_score = float(similarity_score)
-                                if similarity_score >= threshold:
-                                    sim_results.append({
-                                        "user1": {"module": module1, "role": role1, "user_index": user1_index, "key": key1, "value": value1},
-                                        "user2": {"module": module2, "role": role2, "user_index": user2_index, "key": key2, "value": value2},
-                                        "similarity_score": similarity_score,
-                                        "long_text": True
-                                    })
-                                    # logger.info(f"Long text similarity for pair ({key1}, {key2}): {similarity_score}")
-                                    # Build and store the combined document for long texts.
-                                    combined_doc = {
-                                        "text1": value1,
-                                        "vector1": emb1.tolist() if hasattr(emb1, "tolist") else emb1,
-                                        "text2": value2,
-                                        "vector2": emb2.tolist() if hasattr(emb2, "tolist") else emb2
-                                    }
-                                    try:
-                                        store_vector_in_db(combined_doc, database, vector_collection)
-                                        # logger.info(f"Stored combined long text embedding document for pair ({key1}, {key2}).")
-                                    except Exception as e:
-                                        logger.error(f"Error storing combined long text document for pair ({key1}, {key2}): {e}")
-                                else:
-                                    logger.info(f"Long text similarity for pair ({key1}, {key2}) below threshold: {similarity_score}")
-                            except Exception as e:
-                                logger.error(f"Error processing long text similarity for pair ({key1}, {key2}): {e}")
-        return {"similarity": sim_results}
+                        if pair_score is not None:
+                            weight = UserSimilarityAnalyzerFull._key_pair_weight(module1, role1, key1, role2, key2)
+                            pair_score.add(similarity_score, weight, similarity_score >= threshold)
+                        if similarity_score >= floor:
+                            rows = sim_rows if similarity_score >= threshold else below_rows
+                            rows.append((
+                                module_id,
+                                role1_id, user1_index, RESULT_TABLES.keys.intern(key1), RESULT_TABLES.values.intern(value1),
+                                RESULT_TABLES.roles.intern(role2), user2_index, RESULT_TABLES.keys.intern(key2), RESULT_TABLES.values.intern(value2),
+                                similarity_score, long_text,
+                            ))
+                        if similarity_score >= threshold:
+                            counters.increment(StageCounters.MATCHED)
+                        else:
+                            counters.increment(StageCounters.BELOW_THRESHOLD)
+                            hot_path_logger.debug("Similarity for pair (%s, %s) below threshold: %s", key1, key2, similarity_score)
+                    except Exception as e:
+                        logger.error(f"Error calculating similarity for pair ({key1}, {key2}): {e}")
+                if pair_score is not None and pair_score.matched:
+                    user_pair_rows.append((
+                        module_id, role1_id, user1_index, RESULT_TABLES.roles.intern(role2), user2_index,
+                        pair_score.score(), pair_score.matched, pair_score.compared,
+                    ))
 
     @staticmethod
     def calculate_similarity_scores_full(
@@ -202,39 +347,97 @@ class UserSimilarityAnalyzerFull:
         mongo_writer: MongoDBWriter,
         embedding_handler: EmbeddingHandler,
         database: Any,           # Proper MongoDB database object
-        vector_collection: str      # Collection name for combined long text embedding documents
+        vector_collection: str,     # Collection name for combined long text embedding documents
+        result_channel: Any = None,  # Optional in-process channel to Step 3
+        keep_score_matrices: bool = True  # False for shard workers, whose matrices would cover only their modules
     ) -> None:
         """
         Calculate similarity scores for all key-value pairs and write results to MongoDB.
-        All similarity results (both short and long text) are written to collection_name_out.
+        All similarity results (both short and long text) are written to collection_name_out,
+        or published to result_channel when one is given (its sinks handle persistence).
         """
-        overall_sim_results = []
         selected_similarity_count = 0
-        similarity_tasks = []
+        user_pair_count = 0
+        run_counters = StageCounters()
+        UserSimilarityAnalyzerFull.reset_value_state()
         try:
             if not all_key_value_pairs:
                 logger.warning("No key-value pairs to process.")
                 return
-            for pair in all_key_value_pairs:
-                task = delayed(UserSimilarityAnalyzerFull._calculate_similarity_for_pair_full)(
-                    pair, all_key_value_pairs, embeddings_cache, nlp_model, threshold, embedding_handler, database, vector_collection
-                )
-                similarity_tasks.append(task)
-            task_results = compute(*similarity_tasks, scheduler='threads', num_workers=4)
-            # Process each task's result.
-            for result in task_results:
-                if result:
-                    sim_res = result.get("similarity", [])
-                    if sim_res:
-                        # logger.info(f"Writing {len(sim_res)} similarity results to collection: {collection_name_out}")
-                        mongo_writer.write_similarity_scores(collection_name_out, sim_res)
-                        for sim in sim_res:
-                            overall_sim_results.append(sim)
-                        selected_similarity_count += len(sim_res)
-                else:
-                    logger.warning("Received None result for similarity calculation.")
-            mongo_writer.write_similarity_count(collection_name_out, selected_similarity_count)
+            # Filter and intern every profile once instead of once per task
+            prepared_pairs = UserSimilarityAnalyzerFull.prepare_key_value_pairs(all_key_value_pairs, run_counters)
+            value_interner = UserSimilarityAnalyzerFull.value_interner
+            logger.info(f"Interned {len(value_interner)} distinct values.")
+            # Fit corpus-dependent encoders and batch-encode every distinct value up front
+            embedding_handler.prepare_corpus(
+                [value_interner.text(value_id) for value_id in range(len(value_interner))],
+                score_cache=UserSimilarityAnalyzerFull.value_score_cache,
+            )
+            # Without a memory budget all tiles run in one dask round; with one, rounds are sized to fit it
+            memory_budget = MemoryBudget()
+            # Keep every score down to the floor so other thresholds can be applied without rerunning Step 2
+            score_matrices = ScoreMatrixWriter() if config.SCORE_MATRIX_DIR and keep_score_matrices else None
+            # With user pairs, key-level results are an optional drill-down
+            keep_key_level = config.KEY_LEVEL_RESULTS or not config.USER_PAIR_AGGREGATION
+            floor = score_matrices.floor if score_matrices is not None else None
+            # Balanced (module, role block, role block) tiles, largest first, each holding only its own profiles
+            candidates = None
+            if config.PROFILE_PREFILTER:
+                # Compare profile vectors first; only the candidates of each profile are compared key by key
+                candidates = ProfilePrefilter(
+                    value_interner, UserSimilarityAnalyzerFull.key_alignment, embedding_handler=embedding_handler
+                ).plan(prepared_pairs)
+            tiles = plan_tiles(prepared_pairs, candidates=candidates)
+            chunker = AdaptiveChunker(memory_budget, config.STEP2_TILE_SIZE, len(tiles))
+            start = 0
+            while start < len(tiles):
+                round_tiles = tiles[start:start + chunker.next_size()]
+                start += len(round_tiles)
+                similarity_tasks = [
+                    delayed(profiled_task("step2", UserSimilarityAnalyzerFull._calculate_similarity_for_tile))(
+                        tile, threshold, embedding_handler, database, vector_collection, floor
+                    )
+                    for tile in round_tiles
+                ]
+                task_results = compute(*similarity_tasks, scheduler='threads', num_workers=config.STEP2_WORKERS)
+                round_count = 0
+                # Process each task's result.
+                for result in task_results:
+                    if result:
+                        run_counters.merge(result.get("counters"))
+                        sim_res = result.get("similarity")
+                        if score_matrices is not None:
+                            score_matrices.add(sim_res)
+                            score_matrices.add(result.get("below_threshold"))
+                        user_pairs = result.get("user_pairs")
+                        if user_pairs is not None and len(user_pairs):
+                            mongo_writer.write_user_pairs(user_pair_collection_name(collection_name_out), user_pairs)
+                            user_pair_count += len(user_pairs)
+                        if sim_res is not None and len(sim_res):
+                            if keep_key_level:
+                                if result_channel is not None:
+                                    result_channel.publish(sim_res)
+                                else:
+                                    mongo_writer.write_result_batch(collection_name_out, sim_res)
+                            round_count += len(sim_res)
+                    else:
+                        logger.warning("Received None result for similarity calculation.")
+                selected_similarity_count += round_count
+                del task_results
+                chunker.record(len(round_tiles), round_count)
+            score_cache = UserSimilarityAnalyzerFull.value_score_cache
+            logger.info(f"Value score cache: {score_cache.hits} hits, {score_cache.misses} misses.")
+            if score_matrices is not None:
+                score_matrices.save(threshold)
+            memory_budget.log_peak("Step 2")
+            if result_channel is None:
+                mongo_writer.write_similarity_count(collection_name_out, selected_similarity_count)
+            else:
+                result_channel.finish()
+            run_counters.log_summary(logger, "Step 2 totals")
             logger.info(f"Total similarity results written: {selected_similarity_count}")
+            if config.USER_PAIR_AGGREGATION:
+                logger.info(f"Total user pairs written: {user_pair_count}")
         except Exception as e:
             logger.error(f"Error calculating similarity scores: {e}")
 
@@ -0,0 +1,183 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : user_pairs.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script defines user-pair results. Step 2 combines the
+                  key-level scores of two users into one score, weighted by the
+                  key alignment learned in Step 1, while it scores them. The
+                  pairs are kept as rows of a NumPy structured array, stored in
+                  a compact user-pair collection next to the output collection
+                  and read back per module for ranking. Key-level results stay
+                  available as a drill-down.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import logging
+import numpy as np
+from compact_results import COMPACT, RESULT_TABLES, ResultBatch, ResultTables, load_table_sets, stored_result_format
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+USER_PAIR_DTYPE = np.dtype([
+    ("module", np.uint32),
+    ("role1", np.uint32), ("user1", np.uint32),
+    ("role2", np.uint32), ("user2", np.uint32),
+    ("score", np.float32),
+    ("matched", np.uint16),  # key pairs at or above the threshold
+    ("compared", np.uint16),  # key pairs scored
+])
+
+def user_pair_collection_name(collection_name_out):
+    """Name of the collection holding the user-pair results of an output collection."""
+    return f"{collection_name_out}__user_pairs"
+
+class UserPairAccumulator:
+    """Combines the key-level scores of one user pair into a weighted mean while they are computed."""
+
+    __slots__ = ("weighted_sum", "weight_total", "matched", "compared")
+
+    def __init__(self):
+        self.weighted_sum = 0.0
+        self.weight_total = 0.0
+        self.matched = 0
+        self.compared = 0
+
+    def add(self, score, weight, matched):
+        self.weighted_sum += weight * score
+        self.weight_total += weight
+        self.compared += 1
+        self.matched += matched
+
+    def score(self):
+        return self.weighted_sum / self.weight_total if self.weight_total else 0.0
+
+class UserPairBatch:
+    """A batch of user-pair results stored as a structured array of ids."""
+
+    __slots__ = ("rows", "tables")
+
+    def __init__(self, rows=None, tables=None):
+        self.rows = rows if rows is not None else np.empty(0, dtype=USER_PAIR_DTYPE)
+        self.tables = tables or RESULT_TABLES
+
+    @staticmethod
+    def from_tuples(tuples, tables=None):
+        """Build a batch from row tuples in USER_PAIR_DTYPE field order."""
+        return UserPairBatch(np.array(tuples, dtype=USER_PAIR_DTYPE), tables)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def to_documents(self):
+        """Expand the rows into documents shaped like key-level results, so ranking handles both."""
+        tables = self.tables
+        documents = []
+        for row in self.rows:
+            module = tables.modules.text(int(row["module"]))
+            documents.append({
+                "user1": {"module": module, "role": tables.roles.text(int(row["role1"])), "user_index": int(row["user1"])},
+                "user2": {"module": module, "role": tables.roles.text(int(row["role2"])), "user_index": int(row["user2"])},
+                "similarity_score": float(row["score"]),
+                "matched_keys": int(row["matched"]),
+                "compared_keys": int(row["compared"]),
+            })
+        return documents
+
+    def to_compact_documents(self):
+        """Convert the rows into the stored schema. Module and role names are few, so they are kept as text."""
+        tables = self.tables
+        return [
+            {
+                "m": tables.modules.text(int(row["module"])),
+                "r1": tables.roles.text(int(row["role1"])), "u1": int(row["user1"]),
+                "r2": tables.roles.text(int(row["role2"])), "u2": int(row["user2"]),
+                "s": float(row["score"]), "n": int(row["matched"]), "c": int(row["compared"]),
+            }
+            for row in self.rows
+        ]
+
+    @staticmethod
+    def from_compact_documents(documents, tables=None):
+        """Intern stored user-pair documents into a batch."""
+        tables = tables or RESULT_TABLES
+        return UserPairBatch.from_tuples([
+            (
+                tables.modules.intern(document["m"]),
+                tables.roles.intern(document["r1"]), document["u1"],
+                tables.roles.intern(document["r2"]), document["u2"],
+                document["s"], document["n"], document["c"],
+            )
+            for document in documents
+        ], tables)
+
+def count_user_pairs(database, collection_name_out, module=None):
+    """Count the stored user pairs of an output collection, optionally for one module."""
+    query = {"m": module} if module is not None else {}
+    return database[user_pair_collection_name(collection_name_out)].count_documents(query)
+
+def user_pair_modules(database, collection_name_out):
+    """Return the modules that have stored user pairs."""
+    return database[user_pair_collection_name(collection_name_out)].distinct("m")
+
+def iter_user_pair_batches(database, collection_name_out, batch_size=1000, module=None, sort_by_score=False):
+    """Yield the stored user pairs of an output collection as UserPairBatch objects."""
+    cursor = database[user_pair_collection_name(collection_name_out)].find(
+        {"m": module} if module is not None else {}, {"_id": 0},
+        sort=[("s", -1)] if sort_by_score else None, batch_size=batch_size, allow_disk_use=True,
+    )
+    documents = []
+    for document in cursor:
+        documents.append(document)
+        if len(documents) >= batch_size:
+            yield UserPairBatch.from_compact_documents(documents, ResultTables())
+            documents = []
+    if documents:
+        yield UserPairBatch.from_compact_documents(documents, ResultTables())
+
+def key_level_results(database, collection_name_out, module, role1, user1, role2, user2):
+    """
+    Drill down from a user pair to its key-level results (stored when KEY_LEVEL_RESULTS is set).
+
+    Returns:
+        list: Key-level result documents of the pair, highest score first.
+    """
+    compact = stored_result_format(database, collection_name_out) == COMPACT
+    if compact:
+        # Role ids differ per table set, so narrow by module and users in the query and by role afterwards
+        query = {"m": module, "u1": user1, "u2": user2}
+    else:
+        query = {
+            "user1.module": module, "user1.role": role1, "user1.user_index": user1,
+            "user2.role": role2, "user2.user_index": user2,
+        }
+    collection = database[collection_name_out]
+    documents = list(collection.find(query, {"_id": 0}))
+    if compact:
+        stored_tables = load_table_sets(database, collection_name_out)
+        documents = ResultBatch.from_compact_documents(documents, stored_tables, ResultTables()).to_documents()
+    results = [
+        document for document in documents
+        if document["user1"]["role"] == role1 and document["user2"]["role"] == role2
+    ]
+    return sorted(results, key=lambda document: document["similarity_score"], reverse=True)
@@ -35,10 +35,11 @@ from similarity_calculator import SimilarityCalculator
 from file_writer import FileWriter
 from mongodb_writer import MongoDBWriter
 from embedding import EmbeddingHandler
+from stage_profiler import profiled_task
 from collections import defaultdict
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class UserSimilarityAnalyzer:
@@ -115,7 +116,7 @@ class UserSimilarityAnalyzer:
         similarity_tasks = []
         try:
             for pair in all_key_value_pairs:
-                task = delayed(UserSimilarityAnalyzer._calculate_similarity_for_pair)(
+                task = delayed(profiled_task("step1", UserSimilarityAnalyzer._calculate_similarity_for_pair))(
                     pair, all_key_value_pairs, embeddings_cache, nlp_model, threshold
                 )
                 similarity_tasks.append(task)
@@ -0,0 +1,123 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : value_memo.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script provides the value-level layer used by full
+                  profile matching. It interns canonical value texts to
+                  integer ids and memoizes similarity scores per value pair in
+                  a bounded, symmetric cache so identical values shared by
+                  many profiles are only scored once.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ValueInterner:
+    """Maps each distinct canonical value text to a stable integer id."""
+
+    def __init__(self):
+        self._ids = {}
+        self._texts = []
+        self._lock = threading.Lock()
+
+    def intern(self, text):
+        """Return the id of the given canonical text, assigning a new one if needed."""
+        value_id = self._ids.get(text)
+        if value_id is not None:
+            return value_id
+        with self._lock:
+            value_id = self._ids.get(text)
+            if value_id is None:
+                value_id = len(self._texts)
+                self._texts.append(text)
+                self._ids[text] = value_id
+            return value_id
+
+    def text(self, value_id):
+        """Return the canonical text for an id."""
+        return self._texts[value_id]
+
+    def __len__(self):
+        return len(self._texts)
+
+    def clear(self):
+        """Forget all interned values."""
+        with self._lock:
+            self._ids.clear()
+            self._texts.clear()
+
+class ValueScoreCache:
+    """Bounded LRU cache of scores keyed by an unordered pair of value ids."""
+
+    def __init__(self, max_size=1_000_000):
+        self.max_size = max_size
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(value_id1, value_id2):
+        # Cosine similarity is symmetric, so (a, b) and (b, a) share one entry
+        return (value_id1, value_id2) if value_id1 <= value_id2 else (value_id2, value_id1)
+
+    def get_or_compute(self, value_id1, value_id2, compute_fn):
+        """Return the cached entry for the pair, computing and storing it on a miss."""
+        key = self._key(value_id1, value_id2)
+        with self._lock:
+            if key in self._scores:
+                self._scores.move_to_end(key)
+                self.hits += 1
+                return self._scores[key]
+            self.misses += 1
+
+        # Compute outside the lock; a concurrent duplicate computation is harmless
+        entry = compute_fn()
+        with self._lock:
+            self._scores[key] = entry
+            self._scores.move_to_end(key)
+            while len(self._scores) > self.max_size:
+                self._scores.popitem(last=False)
+        return entry
+
+    def resize(self, max_size):
+        """Change the capacity, evicting the least recently used entries if it shrinks."""
+        with self._lock:
+            self.max_size = max_size
+            while len(self._scores) > self.max_size:
+                self._scores.popitem(last=False)
+
+    def __len__(self):
+        return len(self._scores)
+
+    def clear(self):
+        """Drop all cached scores and reset the hit counters."""
+        with self._lock:
+            self._scores.clear()
+            self.hits = 0
+            self.misses = 0
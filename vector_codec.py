@@ -0,0 +1,127 @@
+"""
+===============================================================================
+                             GoFreeLab Proprietary
+-------------------------------------------------------------------------------
+
+Project Name    : Skill Rag Clustering
+File Name       : vector_codec.py
+Author          : <Author Name>
+Created Date    : <Date>
+Version         : <Version>
+Description     : This script encodes embedding vectors for MongoDB. A vector is
+                  stored as raw little-endian float32 bytes in a BSON binary,
+                  together with its dtype and dimension, and is decoded with
+                  np.frombuffer without copying. Vectors stored in the legacy
+                  format (an array of doubles) are still read, and the migrate
+                  command rewrites them in the binary format.
+
+-------------------------------------------------------------------------------
+Copyright (c) 2025 GoFreeLab. All rights reserved.
+
+This source code and all its contents are the proprietary property of GoFreeLab.
+Unauthorized copying, sharing, or distribution of this code, in whole or in
+part, via any medium is strictly prohibited without prior written permission
+from GoFreeLab.
+
+This software is for use only by employees, contractors, or partners of
+GoFreeLab with explicit authorization.
+
+For questions or permissions, please contact: info@gofreelab.com
+===============================================================================
+"""
+
+import argparse
+import logging
+import numpy as np
+from bson.binary import Binary
+from pymongo import UpdateOne
+from mongo_manager import MongoConnectionManager
+from pipeline_logging import configure_logging
+from config import get_env_variable
+import config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BINARY = "binary"
+LIST = "list"
+VECTOR_DTYPE = np.dtype("<f4")  # Little-endian float32, whatever the host byte order
+VECTOR_FIELDS = ("vector", "vector1", "vector2")
+
+def encode_vector(vector, encoding=None):
+    """
+    Convert a vector into its stored form.
+
+    Returns:
+        dict | list: {"dtype", "dim", "data"} with the raw bytes in a BSON binary (VECTOR_ENCODING=binary),
+            or a list of floats (VECTOR_ENCODING=list, the legacy format).
+    """
+    array = np.asarray(vector, dtype=VECTOR_DTYPE).ravel()
+    if (encoding or config.VECTOR_ENCODING) == LIST:
+        return array.tolist()
+    return {"dtype": VECTOR_DTYPE.str, "dim": len(array), "data": Binary(array.tobytes())}
+
+def decode_vector(value):
+    """
+    Convert a stored vector back into a float32 array. Binary vectors are read without copying,
+    so the array is read-only; legacy lists are converted.
+    """
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        array = np.frombuffer(value["data"], dtype=np.dtype(value["dtype"]))
+        if len(array) != value["dim"]:
+            raise ValueError(f"❌ Stored vector has {len(array)} values but declares dim {value['dim']}.")
+        return array
+    return np.asarray(value, dtype=VECTOR_DTYPE)
+
+def encode_vector_fields(document, encoding=None):
+    """Return a copy of a vector document with every vector field encoded for storage."""
+    return {
+        field: encode_vector(value, encoding) if field in VECTOR_FIELDS and value is not None else value
+        for field, value in document.items()
+    }
+
+def migrate_vectors(collection, batch_size=None):
+    """
+    Rewrite the legacy (array) vectors of a collection in the binary format with unordered bulk writes.
+
+    Returns:
+        int: The number of documents rewritten.
+    """
+    batch_size = batch_size or config.EMBEDDING_BATCH_SIZE
+    legacy = {"$or": [{field: {"$type": "array"}} for field in VECTOR_FIELDS]}
+    projection = {field: 1 for field in VECTOR_FIELDS}
+    operations, migrated = [], 0
+    for document in collection.find(legacy, projection, batch_size=batch_size):
+        update = {
+            field: encode_vector(document[field], BINARY)
+            for field in VECTOR_FIELDS if isinstance(document.get(field), list)
+        }
+        operations.append(UpdateOne({"_id": document["_id"]}, {"$set": update}))
+        if len(operations) >= batch_size:
+            collection.bulk_write(operations, ordered=False)
+            migrated += len(operations)
+            operations = []
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+        migrated += len(operations)
+    logger.info(f"✅ Migrated {migrated} vector documents in '{collection.name}' to the binary format.")
+    return migrated
+
+def parse_args():
+    """Parse command line options for the vector migration."""
+    parser = argparse.ArgumentParser(description="Rewrite vectors stored as arrays of doubles in the binary float32 format.")
+    parser.add_argument("collections", nargs="*", help="Collections to migrate (default: EMBEDDING_COLLECTION and VECTOR_COLLECTION).")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    configure_logging()
+    try:
+        database = MongoConnectionManager.get_database(bulk=True)
+        for collection_name in args.collections or [config.EMBEDDING_COLLECTION, get_env_variable("VECTOR_COLLECTION", "vector_1")]:
+            migrate_vectors(database[collection_name])
+    finally:
+        MongoConnectionManager.close_all()